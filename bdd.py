@@ -0,0 +1,214 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import profiler
+
+
+class BDD(object):
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self):
+        # node 0 and 1 are terminals
+        self.var = [None, None]
+        self.low = [None, None]
+        self.high = [None, None]
+        self.unique = {}
+        self.ite_cache = {}
+        self.numvars = 0
+
+    def newVar(self):
+        v = self.numvars
+        self.numvars += 1
+        return self.mk(v, self.FALSE, self.TRUE)
+
+    def mk(self, v, low, high):
+        if low == high:
+            return low
+        key = (v, low, high)
+        if key in self.unique:
+            return self.unique[key]
+        node = len(self.var)
+        self.var.append(v)
+        self.low.append(low)
+        self.high.append(high)
+        self.unique[key] = node
+        return node
+
+    def topvar(self, *nodes):
+        vs = [self.var[n] for n in nodes if n > self.TRUE]
+        return min(vs)
+
+    def cofactor(self, node, v, value):
+        if node <= self.TRUE or self.var[node] != v:
+            return node
+        return self.high[node] if value else self.low[node]
+
+    def ite(self, f, g, h):
+        if f == self.TRUE:
+            return g
+        if f == self.FALSE:
+            return h
+        if g == h:
+            return g
+        if g == self.TRUE and h == self.FALSE:
+            return f
+        key = (f, g, h)
+        if key in self.ite_cache:
+            return self.ite_cache[key]
+        v = self.topvar(f, g, h)
+        t = self.ite(self.cofactor(f, v, True), self.cofactor(g, v, True),
+                     self.cofactor(h, v, True))
+        e = self.ite(self.cofactor(f, v, False), self.cofactor(g, v, False),
+                     self.cofactor(h, v, False))
+        rslt = self.mk(v, e, t)
+        self.ite_cache[key] = rslt
+        return rslt
+
+    def apply_not(self, f):
+        return self.ite(f, self.FALSE, self.TRUE)
+
+    def apply_and(self, f, g):
+        return self.ite(f, g, self.FALSE)
+
+    def apply_or(self, f, g):
+        return self.ite(f, self.TRUE, g)
+
+    def apply_xor(self, f, g):
+        return self.ite(f, self.apply_not(g), g)
+
+
+# each atomic predicate (a comparison or a 1-bit signal) is a BDD variable,
+# and equality tests of one signal against distinct constants are exclusive
+class ConditionEngine(object):
+    def __init__(self):
+        self.bdd = BDD()
+        self.atoms = []  # BDD variable -> DF atom
+        self.atom_index = {}  # DF atom -> BDD variable node
+        self.eq_atoms = {}  # terminal name -> {value: BDD variable node}
+        self.domain = BDD.TRUE
+        self.cache = {}  # DF condition -> BDD node
+        self.representative = {}  # BDD node -> DF condition
+
+    def clear(self):
+        self.__init__()
+
+    def tobdd(self, cond):
+        if cond is None:
+            return BDD.TRUE
+        if cond in self.cache:
+            profiler.count('condengine.hits')
+            return self.cache[cond]
+        rslt = self._tobdd(cond)
+        self.cache[cond] = rslt
+        if rslt not in self.representative:
+            self.representative[rslt] = cond
+        return rslt
+
+    def _tobdd(self, cond):
+        if isinstance(cond, DFEvalValue):
+            return BDD.TRUE if cond.value > 0 else BDD.FALSE
+        if isinstance(cond, DFOperator):
+            if cond.operator == 'Ulnot':
+                return self.bdd.apply_not(self.tobdd(cond.nextnodes[0]))
+            if cond.operator == 'Land':
+                rslt = BDD.TRUE
+                for n in cond.nextnodes:
+                    rslt = self.bdd.apply_and(rslt, self.tobdd(n))
+                return rslt
+            if cond.operator == 'Lor':
+                rslt = BDD.FALSE
+                for n in cond.nextnodes:
+                    rslt = self.bdd.apply_or(rslt, self.tobdd(n))
+                return rslt
+            if cond.operator in ('NotEq', 'NotEql'):
+                op = 'Eq' if cond.operator == 'NotEq' else 'Eql'
+                return self.bdd.apply_not(self.atom(DFOperator(cond.nextnodes, op)))
+        return self.atom(cond)
+
+    def atom(self, cond):
+        if cond in self.atom_index:
+            return self.atom_index[cond]
+        node = self.bdd.newVar()
+        self.atoms.append(cond)
+        self.atom_index[cond] = node
+        eq = self.getEquality(cond)
+        if eq is not None:
+            name, value = eq
+            if name not in self.eq_atoms:
+                self.eq_atoms[name] = {}
+            for v, other in self.eq_atoms[name].items():
+                if v == value:
+                    continue
+                exclusive = self.bdd.apply_not(self.bdd.apply_and(node, other))
+                self.domain = self.bdd.apply_and(self.domain, exclusive)
+            self.eq_atoms[name][value] = node
+        return node
+
+    def getEquality(self, cond):
+        if not isinstance(cond, DFOperator):
+            return None
+        if cond.operator not in ('Eq', 'Eql'):
+            return None
+        left, right = cond.nextnodes
+        if isinstance(left, DFTerminal) and isinstance(right, DFEvalValue):
+            return (left.name, right.value)
+        if isinstance(right, DFTerminal) and isinstance(left, DFEvalValue):
+            return (right.name, left.value)
+        return None
+
+    def restrict(self, node):
+        return self.bdd.apply_and(node, self.domain)
+
+    def isSatisfiable(self, cond):
+        return self.restrict(self.tobdd(cond)) != BDD.FALSE
+
+    def isTautology(self, cond):
+        node = self.tobdd(cond)
+        return self.bdd.apply_and(self.domain, self.bdd.apply_not(node)) == BDD.FALSE
+
+    def isEquivalent(self, cond0, cond1):
+        return self.restrict(self.tobdd(cond0)) == self.restrict(self.tobdd(cond1))
+
+    def canonical(self, node):
+        restricted = self.restrict(node)
+        if restricted == BDD.FALSE:
+            return DFEvalValue(0, 1)
+        if restricted == self.domain:
+            return None
+        if restricted in self.representative:
+            return self.representative[restricted]
+        cond = self.todf(node)
+        self.representative[restricted] = cond
+        return cond
+
+    def simplify(self, cond):
+        return self.canonical(self.tobdd(cond))
+
+    def todf(self, node):
+        if node == BDD.TRUE:
+            return DFEvalValue(1, 1)
+        if node == BDD.FALSE:
+            return DFEvalValue(0, 1)
+        if node in self.representative:
+            return self.representative[node]
+        atom = self.atoms[self.bdd.var[node]]
+        low = self.bdd.low[node]
+        high = self.bdd.high[node]
+        if high == BDD.TRUE and low == BDD.FALSE:
+            return atom
+        if high == BDD.FALSE and low == BDD.TRUE:
+            return DFOperator((atom,), 'Ulnot')
+        terms = []
+        if high == BDD.TRUE:
+            terms.append(atom)
+        elif high != BDD.FALSE:
+            terms.append(DFOperator((atom, self.todf(high)), 'Land'))
+        if low == BDD.TRUE:
+            terms.append(DFOperator((atom,), 'Ulnot'))
+        elif low != BDD.FALSE:
+            terms.append(DFOperator((DFOperator((atom,), 'Ulnot'), self.todf(low)), 'Land'))
+        if len(terms) == 1:
+            return terms[0]
+        return DFOperator(tuple(terms), 'Lor')
@@ -0,0 +1,182 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import random
+from optparse import OptionParser
+
+
+def clog2(n):
+    width = 1
+    while (1 << width) < n:
+        width += 1
+    return width
+
+
+def gen_fsm(name, states=8, branching=2, inputs=4, seed=0):
+    rnd = random.Random(seed)
+    width = clog2(states)
+    lines = []
+    lines.append('module %s(input CLK, input RST, input [%d:0] in, output reg [%d:0] state);' %
+                 (name, inputs - 1, width - 1))
+    for i in range(states):
+        lines.append("  localparam S%d = %d'd%d;" % (i, width, i))
+    lines.append('  always @(posedge CLK) begin')
+    lines.append('    if (RST) begin')
+    lines.append('      state <= S0;')
+    lines.append('    end else begin')
+    lines.append('      case (state)')
+    for i in range(states):
+        lines.append('        S%d: begin' % i)
+        for b in range(branching):
+            dst = rnd.randrange(states)
+            kw = 'if' if b == 0 else 'else if'
+            lines.append('          %s (in[%d]) state <= S%d;' % (kw, rnd.randrange(inputs), dst))
+        lines.append('          else state <= S%d;' % ((i + 1) % states))
+        lines.append('        end')
+    lines.append('        default: state <= S0;')
+    lines.append('      endcase')
+    lines.append('    end')
+    lines.append('  end')
+    lines.append('endmodule')
+    return '\n'.join(lines) + '\n'
+
+
+def gen_counter(name, width=16, limit=None):
+    limit = (1 << width) - 1 if limit is None else limit
+    lines = []
+    lines.append('module %s(input CLK, input RST, input en, output reg [%d:0] count);' %
+                 (name, width - 1))
+    lines.append('  always @(posedge CLK) begin')
+    lines.append('    if (RST) count <= 0;')
+    lines.append("    else if (en && count < %d) count <= count + 1;" % limit)
+    lines.append('    else if (en) count <= 0;')
+    lines.append('  end')
+    lines.append('endmodule')
+    return '\n'.join(lines) + '\n'
+
+
+def gen_localparam_chain(name, depth=64):
+    lines = []
+    lines.append('module %s(input CLK, output reg [31:0] mode);' % name)
+    lines.append('  localparam P0 = 1;')
+    for i in range(1, depth):
+        lines.append('  localparam P%d = P%d + 1;' % (i, i - 1))
+    lines.append('  always @(posedge CLK) mode <= P%d;' % (depth - 1))
+    lines.append('endmodule')
+    return '\n'.join(lines) + '\n'
+
+
+def gen_nested(name, depth=8, inputs=8, seed=0):
+    rnd = random.Random(seed)
+    lines = []
+    lines.append('module %s(input CLK, input RST, input [%d:0] in, output reg [7:0] step);' %
+                 (name, inputs - 1))
+    lines.append('  always @(posedge CLK) begin')
+    lines.append('    if (RST) step <= 0;')
+    lines.append('    else begin')
+
+    def body(level, indent):
+        pad = ' ' * indent
+        if level == depth:
+            lines.append('%sstep <= %d;' % (pad, rnd.randrange(256)))
+            return
+        if level % 2 == 0:
+            lines.append('%sif (in[%d]) begin' % (pad, rnd.randrange(inputs)))
+            body(level + 1, indent + 2)
+            lines.append('%send else begin' % pad)
+            body(level + 1, indent + 2)
+            lines.append('%send' % pad)
+        else:
+            lines.append('%scase (step)' % pad)
+            for v in range(2):
+                lines.append('%s  %d: begin' % (pad, v))
+                body(level + 1, indent + 4)
+                lines.append('%s  end' % pad)
+            lines.append('%s  default: step <= 0;' % pad)
+            lines.append('%sendcase' % pad)
+
+    body(0, 6)
+    lines.append('    end')
+    lines.append('  end')
+    lines.append('endmodule')
+    return '\n'.join(lines) + '\n'
+
+
+def gen_design(modules=4, instances=2, states=8, branching=2, width=16,
+               depth=64, nest=8, caseitems=0, seed=0):
+    # TOP instantiates 'instances' copies of each of the 'modules' leaf kinds
+    kinds = [
+        lambda n, i: gen_fsm(n, states, branching, seed=seed + i),
+        lambda n, i: gen_counter(n, width),
+        lambda n, i: gen_localparam_chain(n, depth),
+        lambda n, i: gen_nested(n, nest, seed=seed + i),
+    ]
+    sources = []
+    top = ['module TOP(input CLK, input RST, input [7:0] in);']
+    for m in range(modules):
+        name = 'sub%d' % m
+        kind = m % len(kinds)
+        sources.append(kinds[kind](name, m))
+        for i in range(instances):
+            inst = '%s_inst%d' % (name, i)
+            if kind == 0:
+                top.append('  %s %s(.CLK(CLK), .RST(RST), .in(in[3:0]), .state());' % (name, inst))
+            elif kind == 1:
+                top.append('  %s %s(.CLK(CLK), .RST(RST), .en(in[0]), .count());' % (name, inst))
+            elif kind == 2:
+                top.append('  %s %s(.CLK(CLK), .mode());' % (name, inst))
+            else:
+                top.append('  %s %s(.CLK(CLK), .RST(RST), .in(in), .step());' % (name, inst))
+    if caseitems > 0:
+        sources.append(gen_case_fsm('subcase', caseitems))
+        top.append('  subcase subcase_inst(.CLK(CLK), .RST(RST), .go(in[0]), .state());')
+    top.append('endmodule')
+    sources.append('\n'.join(top) + '\n')
+    return ''.join(sources)
+
+
+def gen_case_fsm(name, items=1000):
+    width = clog2(items)
+    lines = []
+    lines.append('module %s(input CLK, input RST, input go, output reg [%d:0] state);' %
+                 (name, width - 1))
+    lines.append('  always @(posedge CLK) begin')
+    lines.append('    if (RST) state <= 0;')
+    lines.append('    else case (state)')
+    for i in range(items):
+        lines.append('      %d: if (go) state <= %d;' % (i, (i + 1) % items))
+    lines.append('      default: state <= 0;')
+    lines.append('    endcase')
+    lines.append('  end')
+    lines.append('endmodule')
+    return '\n'.join(lines) + '\n'
+
+
+cases = {
+    'small': dict(modules=4, instances=1, states=8, branching=2, width=8, depth=16, nest=4),
+    'fsm64': dict(modules=4, instances=2, states=64, branching=4, width=16, depth=64, nest=6),
+    'wide': dict(modules=8, instances=4, states=16, branching=2, width=32, depth=128, nest=8),
+    'case1000': dict(modules=0, instances=1, caseitems=1000),
+}
+
+
+def main():
+    optparser = OptionParser(usage="Usage: python generate.py [options]")
+    optparser.add_option("-o", "--outdir", dest="outdir",
+                         default="bench_designs", help="Output directory, Default=bench_designs")
+    optparser.add_option("-c", "--case", dest="cases", action="append",
+                         default=[], help="Case name (%s)" % ', '.join(sorted(cases.keys())))
+    (options, args) = optparser.parse_args()
+
+    if not os.path.exists(options.outdir):
+        os.makedirs(options.outdir)
+    for name in (options.cases if options.cases else sorted(cases.keys())):
+        filename = os.path.join(options.outdir, name + '.v')
+        with open(filename, 'w') as f:
+            f.write(gen_design(**cases[name]))
+        print(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import json
+import time
+import tracemalloc
+from optparse import OptionParser
+
+# appended, so this tree's ast.py does not shadow the standard module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate
+import dfglobals
+
+
+class StageTimer(object):
+    # a timer either times the stages or traces their peak memory, never
+    # both: tracemalloc slows down every allocation of a traced call
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.results = {}
+
+    def run(self, name, func, *args, **kwargs):
+        if self.trace:
+            tracemalloc.start()
+            rslt = func(*args, **kwargs)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.results[name] = {'peak': peak}
+            return rslt
+        start = time.perf_counter()
+        rslt = func(*args, **kwargs)
+        self.results[name] = {'time': time.perf_counter() - start}
+        return rslt
+
+
+def run_pipeline(filename, topmodule, timer):
+    from dataflow import VerilogDataflowAnalyzer, VerilogDataflowOptimizer
+    from controlflow import VerilogControlflowAnalyzer
+
+    ast = timer.run('parse', VerilogCodeParser([filename]).parse)
+
+    analyzer = VerilogDataflowAnalyzer([filename], topmodule)
+    timer.run('generate', analyzer.generate)
+    terms = analyzer.getTerms()
+    binddict = analyzer.getBinddict()
+
+    optimizer = VerilogDataflowOptimizer(terms, binddict)
+    timer.run('resolveConstant', optimizer.resolveConstant)
+
+    canalyzer = VerilogControlflowAnalyzer(topmodule, terms, binddict,
+                                           optimizer.getResolvedTerms(),
+                                           optimizer.getResolvedBinddict(),
+                                           optimizer.getConstlist())
+    fsms = timer.run('getFiniteStateMachines', canalyzer.getFiniteStateMachines)
+    timer.run('get_loop', lambda: [fsm.get_loop() for fsm in fsms.values()])
+
+    codegen = ASTCodeGenerator()
+    timer.run('ASTCodeGenerator', codegen.visit, ast)
+    return fsms
+
+
+def run_case(filename, topmodule='TOP', repeat=1):
+    # the best time of 'repeat' untraced runs, the peak memory of one traced run
+    best = {}
+    for i in range(repeat):
+        timer = StageTimer()
+        fsms = run_pipeline(filename, topmodule, timer)
+        for stage, rslt in timer.results.items():
+            if not stage in best or rslt['time'] < best[stage]['time']:
+                best[stage] = rslt
+
+    timer = StageTimer(trace=True)
+    run_pipeline(filename, topmodule, timer)
+    for stage, rslt in timer.results.items():
+        best[stage]['peak'] = rslt['peak']
+    best['fsm_size'] = {
+        'states': sum([len(fsm.states()) for fsm in fsms.values()]),
+        'transitions': sum([fsm.size() for fsm in fsms.values()]),
+    }
+    return best
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, stages in sorted(results.items()):
+        if not case in baseline:
+            continue
+        for stage, rslt in sorted(stages.items()):
+            if not stage in baseline[case]:
+                continue
+            for metric in sorted(rslt.keys()):
+                if not metric in baseline[case][stage]:
+                    continue
+                base = baseline[case][stage][metric]
+                cur = rslt[metric]
+                if base > 0 and (cur - base) / base > threshold:
+                    regressions.append((case, stage, metric, base, cur))
+    return regressions
+
+
+def main():
+    optparser = OptionParser(usage="Usage: python run.py [options]")
+    optparser.add_option("-d", "--designdir", dest="designdir",
+                         default="bench_designs", help="Design directory, Default=bench_designs")
+    optparser.add_option("-c", "--case", dest="cases", action="append",
+                         default=[], help="Case name (%s)" %
+                         ', '.join(sorted(generate.cases.keys())))
+    optparser.add_option("-r", "--repeat", dest="repeat", type="int",
+                         default=3, help="Repetitions per case (best is kept), Default=3")
+    optparser.add_option("-o", "--output", dest="output",
+                         default="bench_output.json", help="Result JSON, Default=bench_output.json")
+    optparser.add_option("--compare", dest="baseline",
+                         default=None, help="Baseline JSON to compare against")
+    optparser.add_option("--threshold", dest="threshold", type="float",
+                         default=0.2, help="Relative slowdown flagged as regression, Default=0.2")
+    (options, args) = optparser.parse_args()
+
+    if not dfglobals.install():
+        optparser.error('pyverilog is required')
+    if not os.path.exists(options.designdir):
+        os.makedirs(options.designdir)
+
+    results = {}
+    for name in (options.cases if options.cases else sorted(generate.cases.keys())):
+        filename = os.path.join(options.designdir, name + '.v')
+        with open(filename, 'w') as f:
+            f.write(generate.gen_design(**generate.cases[name]))
+        results[name] = run_case(filename, repeat=options.repeat)
+        for stage, rslt in results[name].items():
+            if stage == 'fsm_size':
+                print('%-8s %-24s %10d states %8d transitions' %
+                      (name, stage, rslt['states'], rslt['transitions']))
+                continue
+            print('%-8s %-24s %10.4f s %12d B' % (name, stage, rslt['time'], rslt['peak']))
+
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.baseline is None:
+        return
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.threshold)
+    for case, stage, metric, base, cur in regressions:
+        print('REGRESSION %s %s %s: %g -> %g (%+.1f%%)' %
+              (case, stage, metric, base, cur, (cur - base) * 100.0 / base))
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
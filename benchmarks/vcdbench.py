@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import time
+import random
+from optparse import OptionParser
+
+# appended, so this tree's ast.py does not shadow the standard module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dfglobals
+
+
+def gen_vcd(filename, size=64 << 20, states=16, noise=32, seed=0):
+    # a ring FSM 'TOP.state' with random skips, plus noisy data signals
+    rnd = random.Random(seed)
+    width = max(1, (states - 1).bit_length())
+    codes = ['!'] + [chr(ord('#') + i) for i in range(noise)]
+    with open(filename, 'w') as f:
+        f.write('$timescale 1ns $end\n$scope module TOP $end\n')
+        f.write('$var reg %d ! state [%d:0] $end\n' % (width, width - 1))
+        for i, code in enumerate(codes[1:]):
+            f.write('$var wire 8 %s data%d [7:0] $end\n' % (code, i))
+        f.write('$upscope $end\n$enddefinitions $end\n')
+        f.write('$dumpvars\nb0 !\n$end\n')
+        state = 0
+        t = 0
+        while f.tell() < size:
+            t += 1
+            lines = ['#%d' % t]
+            for code in rnd.sample(codes[1:], 4):
+                lines.append('b%s %s' % (format(rnd.getrandbits(8), 'b'), code))
+            if rnd.random() < 0.5:
+                state = (state + (2 if rnd.random() < 0.1 else 1)) % states
+                lines.append('b%s !' % format(state, 'b'))
+            f.write('\n'.join(lines) + '\n')
+    return states
+
+
+def ring_fsm(states):
+    from controlflow import FiniteStateMachine
+    fsm = FiniteStateMachine('state')
+    for s in range(states):
+        fsm.add((s, s), (s + 1) % states, None)
+    return fsm
+
+
+def main():
+    optparser = OptionParser(usage="Usage: python vcdbench.py [options]")
+    optparser.add_option("-o", "--output", dest="output",
+                         default="bench_designs/bench.vcd", help="Dump file, Default=bench_designs/bench.vcd")
+    optparser.add_option("-m", "--size", dest="size", type="int",
+                         default=64, help="Dump size in MB, Default=64")
+    optparser.add_option("-r", "--repeat", dest="repeat", type="int",
+                         default=3, help="Repetitions (best is kept), Default=3")
+    (options, args) = optparser.parse_args()
+
+    if not dfglobals.install():
+        optparser.error('pyverilog is required')
+    import vcd
+
+    dirname = os.path.dirname(options.output)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    states = gen_vcd(options.output, size=options.size << 20)
+    fsms = {'TOP_state': ring_fsm(states)}
+    size = os.path.getsize(options.output)
+
+    best = None
+    for i in range(options.repeat):
+        start = time.perf_counter()
+        result = vcd.coverage(options.output, fsms, flatname=str)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result['TOP_state'].write(sys.stdout)
+    print('%d bytes in %.3f s: %.1f MB/s' % (size, best, size / best / (1 << 20)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,196 @@
+import sys
+import re
+import logging
+import multiprocessing
+from collections import OrderedDict, deque
+from bdd import BDD, ConditionEngine
+import dagsplit
+import graphwriter
+import minimize
+import profiler
+import utility
+from dfcompiler import DFCompiler
+from dataflow import DataflowIndex, toCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class TreeCache(object):
+    # per-stage results of makeTree, keyed by term name
+    stages = ('getTree', 'walkTree', 'reorder', 'optimize', 'replaceUndefined', 'compile')
+    const_stages = ('walkTree', 'reorder', 'optimize', 'replaceUndefined', 'compile')
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.caches = dict([(stage, OrderedDict()) for stage in self.stages])
+        self.hits = dict([(stage, 0) for stage in self.stages])
+        self.misses = dict([(stage, 0) for stage in self.stages])
+        self.constkey = None
+
+    def clear(self, stages=None):
+        for stage in (self.stages if stages is None else stages):
+            self.caches[stage].clear()
+
+    def validate(self, optimizer):
+        # trees after getTree depend on the constant list; returns True when
+        # a change of the constants cleared them
+        # an optimizer without constversion still counts the writes of a
+        # ConstantList through its version
+        constlist = optimizer.constlist
+        constkey = (id(constlist), getattr(optimizer, 'constversion',
+                                           getattr(constlist, 'version', 0)))
+        if constkey == self.constkey:
+            return False
+        cleared = self.constkey is not None
+        if cleared:
+            self.clear(self.const_stages)
+        self.constkey = constkey
+        return cleared
+
+    def get(self, stage, termname):
+        cache = self.caches[stage]
+        if termname in cache:
+            self.hits[stage] += 1
+            if profiler.default.enabled:
+                profiler.count('makeTree.%s.hits' % stage)
+            cache.move_to_end(termname)
+            return True, cache[termname]
+        self.misses[stage] += 1
+        return False, None
+
+    def put(self, stage, termname, tree):
+        cache = self.caches[stage]
+        cache[termname] = tree
+        cache.move_to_end(termname)
+        if self.maxsize is not None and len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def stats(self):
+        return dict([(stage, {'hits': self.hits[stage], 'misses': self.misses[stage],
+                              'size': len(self.caches[stage])})
+                     for stage in self.stages])
+
+
+class AnalysisContext(object):
+    # results shared by the analyzers of one design, filled on first query
+    def __init__(self, maxtrees=4096):
+        self.maxtrees = maxtrees
+        self.clear()
+
+    def clear(self):
+        self.treecache = TreeCache(self.maxtrees)
+        self.clearDerived()
+
+    def clearDerived(self):
+        self.fsms = {}  # key:analyzer options, value:dict[termname]=FiniteStateMachine
+        self.loops = {}  # key:analyzer options, value:dict[termname]=set of loops
+        self.widths = {}
+        self.resetvalues = {}  # key:termname, value:tuple of reset values
+        self.walks = {}  # key:(condlist, fsm_sig), value:list of state nodes
+        self.transconds = {}  # key:transcond, value:optimized transcond
+
+    def validate(self, optimizer):
+        # everything derived from the trees goes with them
+        if self.treecache.validate(optimizer):
+            self.clearDerived()
+
+
+def getDelaySource(bindlist):
+    # the signal a register only copies once its reset branches are removed,
+    # by the rule _getFuncdict follows delay chains with; None otherwise
+    if len(bindlist) != 1 or bindlist[0].tree is None:
+        return None
+    funcdict = splitter.remove_reset_condition(splitter.split(bindlist[0].tree))
+    if len(funcdict) == 1 and len(list(funcdict.keys())[0]) == 0:
+        next_term = list(funcdict.values())[0]
+        if isinstance(next_term, DFTerminal):
+            return next_term.name
+    return None
+
+
+def sliceDataflow(roots, terms, binddict, resolved_terms, resolved_binddict, index=None):
+    # cone of influence of the roots: the walk stops at clocked registers and
+    # inputs, except for the registers a root's delay chain is followed to
+    if index is None:
+        index = DataflowIndex(terms, binddict)
+
+    def combinational(termname):
+        # inputs of submodule instances are bound to their ports' signals
+        if not termname in terms:
+            return False
+        if signaltype.isInput(terms[termname].termtype) and not termname in binddict:
+            return False
+        if not signaltype.isReg(terms[termname].termtype):
+            return True
+        for bind in binddict.get(termname, ()):
+            if bind.isCombination():
+                return True
+        return False
+
+    roots = set(roots)
+    stack = list(roots)
+    while stack:
+        termname = stack.pop()
+        source = getDelaySource(resolved_binddict.get(termname, ()))
+        # makeTree walks through the combinational signals in between
+        seen = set([])
+        while source is not None and combinational(source) and not source in seen:
+            seen.add(source)
+            bindlist = binddict.get(source, ())
+            source = (bindlist[0].tree.name if len(bindlist) == 1 and
+                      isinstance(bindlist[0].tree, DFTerminal) else None)
+        if source is None or not source in terms or combinational(source):
+            continue
+        if signaltype.isInput(terms[source].termtype) or source in roots:
+            continue
+        roots.add(source)
+        stack.append(source)
+
+    names = index.getCone(roots, combinational)
+
+    def select(d):
+        return dict([(n, v) for n, v in d.items() if n in names])
+
+    return (select(terms), select(binddict),
+            select(resolved_terms), select(resolved_binddict))
+
 
 class VerilogControlflowAnalyzer(VerilogSubset):
+    case_min_items = 8  # shorter case chains stay DFBranch chains
+
     def __init__(self, topmodule, terms, binddict,
                  resolved_terms, resolved_binddict,
-                 constlist, fsm_vars=('fsm', 'state', 'count', 'cnt', 'step', 'mode')):
+                 constlist, fsm_vars=('fsm', 'state', 'count', 'cnt', 'step', 'mode'),
+                 prune=False, context=None, coi=False, index=None, dagsplit=False):
+        self.fsm_vars = fsm_vars
+        self.coi = coi
+        self.dagsplit = dagsplit
+        if coi:
+            roots = [termname for termname in resolved_binddict.keys()
+                     if self.isFsmVar(termname)]
+            terms, binddict, resolved_terms, resolved_binddict = sliceDataflow(
+                roots, terms, binddict, resolved_terms, resolved_binddict, index)
         VerilogSubset.__init__(self, topmodule, terms, binddict,
                                resolved_terms, resolved_binddict, constlist)
         self.treewalker = VerilogDataflowWalker(topmodule, terms, binddict,
                                                 resolved_terms, resolved_binddict, constlist)
-        self.fsm_vars = fsm_vars
+        self.condengine = ConditionEngine() if prune else None
+        self.context = context if context is not None else AnalysisContext()
+
+    def getContextKey(self):
+        # the options that change the FSMs an analyzer extracts
+        return (tuple(self.fsm_vars), self.condengine is not None, self.coi, self.dagsplit)
 
     def getLoops(self):
         fsms = self.getFiniteStateMachines()
+        key = self.getContextKey()
+        if key in self.context.loops:
+            return self.context.loops[key], fsms
         loops = {}
         for signame, fsm in fsms.items():
             loop_set = fsm.get_loop()
@@ -19,20 +199,35 @@ class VerilogControlflowAnalyzer(VerilogSubset):
             if not signame in loops:
                 loops[signame] = set([])
             loops[signame].update(loop_set)
+        self.context.loops[key] = loops
         return loops, fsms
 
     def getFiniteStateMachines(self):
+        self.context.validate(self.optimizer)
+        key = self.getContextKey()
+        if key in self.context.fsms:
+            return self.context.fsms[key]
+        statemachines = self._getFiniteStateMachines()
+        self.context.fsms[key] = statemachines
+        return statemachines
+
+    def _getFiniteStateMachines(self):
         statemachines = {}
         for termname, bindlist in self.resolved_binddict.items():
             if not self.isFsmVar(termname):
                 continue
             funcdict, delaycnt = self.getFuncdict(termname)
             if len(funcdict) > 0:
-                print("FSM signal: %s, Condition list length: %d" % (str(termname), len(funcdict)))
-            fsm = self.getFiniteStateMachine(termname, funcdict)
+                logger.info("FSM signal: %s, Condition list length: %d", str(termname), len(funcdict))
+            with profiler.span('getFiniteStateMachine'):
+                fsm = self.getFiniteStateMachine(termname, funcdict)
             if fsm.size() > 0:
                 fsm.set_delaycnt(delaycnt)
-                fsm.resolve(self.optimizer)
+                with profiler.span('FiniteStateMachine.resolve'):
+                    fsm.resolve(self.optimizer)
+                if self.condengine is not None:
+                    with profiler.span('FiniteStateMachine.prune'):
+                        fsm.prune(self.condengine)
                 statemachines[termname] = fsm
         return statemachines
 
@@ -41,34 +236,96 @@ class VerilogControlflowAnalyzer(VerilogSubset):
         if len(funcdict) == 0:
             return fsm
         width = self.getWidth(termname)
+        resetvalues = self.getResetValues(termname)
+        initial = utility.IntervalSet.values(resetvalues) if len(resetvalues) > 0 else None
+        walker = None
+        if isinstance(funcdict, dagsplit.DAGFuncdict):
+            # every pass reads the DAG node by node instead of its paths
+            walker = dagsplit.StateWalker(funcdict.dag, termname, width)
+            branches = walker.branches()
+            dsts, consts, bits, pairs = walker.evidence()
+        else:
+            branches = utility.getStateBranches(funcdict, termname, width)
+            dsts, consts, bits, pairs = utility.getEncodingEvidence(funcdict, termname)
+        with profiler.span('inferStateRange'):
+            domain = utility.inferStateDomain(branches, termname, width, initial)
+        fsm.set_domain(domain)
+        fsm.set_reset(resetvalues if len(resetvalues) > 0 else None)
+        fsm.set_encoding(utility.selectEncoding(dsts, consts, bits, pairs, width, resetvalues))
+        builder = TransitionTableBuilder()
+        for value, node, values in self.getTransitions(funcdict, termname, width, domain, walker):
+            statenode_list = node.nodelist if isinstance(
+                node, transition.StateNodeList) else [node, ]
+            for statenode in statenode_list:
+                fsm.construct(value, statenode, builder, values)
+        builder.build(fsm)
+        return fsm
+
+    def getTransitions(self, funcdict, termname, width, domain, walker=None):
+        # (constant value, state node, state values) shortest condition lists first
+        if walker is not None:
+            return walker.transitions(domain)
+        rslt = []
         for condlist, func in sorted(funcdict.items(), key=lambda x: len(x[0])):
             if not isinstance(func, DFEvalValue):
                 continue
-            print("Condition: %s, Inferring transition condition" % str(condlist))
+            logger.info("Condition: %s, Inferring transition condition", str(condlist))
             node = transition.walkCondlist(condlist, termname, width)
             if node is None:
                 continue
-            statenode_list = node.nodelist if isinstance(
-                node, transition.StateNodeList) else [node, ]
-            for statenode in statenode_list:
-                fsm.construct(func.value, statenode)
-        return fsm
+            rslt.append((func.value, node, domain))
+        return rslt
 
     def getFuncdict(self, termname, delaycnt=0):
+        with profiler.span('getFuncdict'):
+            return self._getFuncdict(termname, delaycnt)
+
+    def _getFuncdict(self, termname, delaycnt=0, origin=None):
+        origin = termname if origin is None else origin
         termtype = self.getTermtype(termname)
         if not self.isClockEdge(termname):
             return {}, 0
         if signaltype.isRename(termtype):
             return {}, 0
         tree = self.makeTree(termname)
-        funcdict = splitter.split(tree)
-        funcdict = splitter.remove_reset_condition(funcdict)
+        if self.dagsplit:
+            return self._getFuncdictDAG(termname, tree, delaycnt, origin)
+        all_funcdict = splitter.split(tree)
+        funcdict = splitter.remove_reset_condition(all_funcdict)
+        # remove_reset_condition strips the reset conditions from every key, so
+        # a reset assignment is the one its stripped key no longer maps to
+        self.context.resetvalues[origin] = tuple(sorted(set(
+            [func.value for condlist, func in all_funcdict.items()
+             if funcdict.get(splitter.remove_reset_condlist(condlist)) is not func and
+             isinstance(func, DFEvalValue)])))
         if len(funcdict) == 1 and len(list(funcdict.keys())[0]) == 0:
             next_term = list(funcdict.values())[0]
             if isinstance(next_term, DFTerminal):
-                return self.getFuncdict(next_term.name, delaycnt + 1)
+                return self._getFuncdict(next_term.name, delaycnt + 1, origin)
+        return funcdict, delaycnt
+
+    def _getFuncdictDAG(self, termname, tree, delaycnt, origin):
+        if not isinstance(tree, DFBranch):
+            # as splitter.split() finds no condition in a tree without a branch
+            self.context.resetvalues[origin] = ()
+            return {}, delaycnt
+        tree, cases = toCase(tree, self.case_min_items)
+        with profiler.span('dagsplit'):
+            dag = dagsplit.SplitDAG(tree)
+            resetvalues = dag.remove_reset(splitter.remove_reset_condlist)
+        self.context.resetvalues[origin] = tuple(sorted(resetvalues))
+        funcdict = dagsplit.DAGFuncdict(dag)
+        next_term = funcdict.single()
+        if isinstance(next_term, DFTerminal):
+            return self._getFuncdict(next_term.name, delaycnt + 1, origin)
         return funcdict, delaycnt
 
+    def getResetValues(self, termname):
+        self.context.validate(self.optimizer)
+        if not termname in self.context.resetvalues:
+            self.getFuncdict(termname)
+        return self.context.resetvalues.get(termname, ())
+
     def isFsmVar(self, termname):
         for v in self.fsm_vars:
             if re.search(v.lower(), str(termname).lower()):
@@ -76,6 +333,14 @@ class VerilogControlflowAnalyzer(VerilogSubset):
         return False
 
     def getWidth(self, termname):
+        self.context.validate(self.optimizer)
+        if termname in self.context.widths:
+            return self.context.widths[termname]
+        width = self._getWidth(termname)
+        self.context.widths[termname] = width
+        return width
+
+    def _getWidth(self, termname):
         term = self.getTerm(termname)
         msb = self.optimizer.optimizeConstant(term.msb)
         lsb = self.optimizer.optimizeConstant(term.lsb)
@@ -85,24 +350,104 @@ class VerilogControlflowAnalyzer(VerilogSubset):
         return self.optimizer.optimizeConstant(width).value
 
     def makeTree(self, termname):
-        tree = self.getTree(termname)
-        tree = self.treewalker.walkTree(tree)
-        tree = reorder.reorder(tree)
-        tree = self.optimizer.optimize(tree)
-        tree = replace.replaceUndefined(tree, termname)
+        self.context.validate(self.optimizer)
+        cache = self.context.treecache
+        found, tree = cache.get('replaceUndefined', termname)
+        if found:
+            return tree
+        stages = (
+            ('getTree', lambda t: self.getTree(termname)),
+            ('walkTree', self.treewalker.walkTree),
+            ('reorder', reorder.reorder),
+            ('optimize', self.optimizer.optimize),
+            ('replaceUndefined', lambda t: replace.replaceUndefined(t, termname)),
+        )
+        # resume from the latest stage that is still cached
+        start = 0
+        tree = None
+        for i in range(len(stages) - 2, -1, -1):
+            found, cached = cache.get(stages[i][0], termname)
+            if found:
+                start = i + 1
+                tree = cached
+                break
+        for stage, func in stages[start:]:
+            with profiler.span('makeTree.' + stage):
+                tree = func(tree)
+            cache.put(stage, termname, tree)
+        profiler.count('makeTree.trees')
         return tree
 
+    def getCompiledTree(self, termname):
+        # next-state function of termname over a flat vector of signal values
+        self.context.validate(self.optimizer)
+        cache = self.context.treecache
+        found, func = cache.get('compile', termname)
+        if found:
+            return func
+        # case chains compile to a dict dispatch instead of a comparison chain
+        tree, cases = toCase(self.makeTree(termname), self.case_min_items)
+        with profiler.span('compile'):
+            compiler = DFCompiler(self.getWidth)
+            func = compiler.compile(tree, self.getWidth(termname), termname)
+        cache.put('compile', termname, func)
+        return func
+
 
 class FiniteStateMachine(object):
+    max_floyd_states = 512
+
     def __init__(self, name):
         self.name = name
         self.fsm = {}  # key:src, value: dict[cond]=dst
         self.any = {}  # key:cond, value:dst
         self.delaycnt = 0
+        self.domain = None  # IntervalSet of the values the state can hold
+        self.reachable = None  # explored state values, None when not explored
+        self.complete = False  # whether the exploration covered every input
+        self.reset = None  # reset values, None when unknown
+        self.encoding = None  # utility.StateEncoding, None when not detected
+        self.overlaps = []  # (src or None for any, dsts) whose conditions overlap after prune()
+        self.version = 0  # bumped on every change, invalidates the distance cache
+        self.distcache = None
 
     def set_delaycnt(self, delaycnt):
         self.delaycnt = delaycnt
 
+    def set_domain(self, domain):
+        self.domain = domain
+
+    def touch(self):
+        self.version += 1
+
+    def set_reset(self, reset):
+        self.reset = reset
+
+    def set_encoding(self, encoding):
+        self.encoding = encoding
+
+    def set_reachable(self, reachable, complete):
+        self.reachable = reachable
+        self.complete = complete
+
+    def restrict(self, states):
+        # a copy keeping only transitions between the given states
+        states = set(states)
+        fsm = FiniteStateMachine(self.name)
+        fsm.set_delaycnt(self.delaycnt)
+        fsm.set_domain(self.domain)
+        fsm.set_reset(self.reset)
+        fsm.set_encoding(self.encoding)
+        for src, dstdict in self.fsm.items():
+            if not src in states:
+                continue
+            fsm.fsm[src] = dict([(cond, dst) for cond, dst in dstdict.items()
+                                 if dst in states])
+        for cond, dst in self.any.items():
+            if dst in states:
+                fsm.any[cond] = dst
+        return fsm
+
     def size(self):
         dstlen = 0
         for src, dstdict in self.fsm.items():
@@ -134,7 +479,7 @@ class FiniteStateMachine(object):
                     maxval = dst
         return (minval, maxval)
 
-    def construct(self, dst, node):
+    def construct(self, dst, node, builder=None, domain=None):
         if node is None:
             return
         if node.isany:
@@ -142,14 +487,27 @@ class FiniteStateMachine(object):
             self.add_any(dst, transcond)
         for rp in node.range_pairs:
             transcond = node.transcond
-            self.add(rp, dst, transcond)
+            rps = [rp] if domain is None else domain.clip(*rp)
+            if self.encoding is not None and self.encoding.compact:
+                rps = [(v, v) for r in rps for v in self.encoding.select(*r)]
+            for r in rps:
+                if builder is not None:
+                    builder.add(r, dst, transcond)
+                else:
+                    self.add(r, dst, transcond)
 
     def add_any(self, dst, cond):
         self.any[cond] = dst
+        self.touch()
 
     def add(self, srcs, dst, cond):
+        self.touch()
         sb, se = srcs
-        for src in range(sb, se + 1):
+        if self.encoding is not None and self.encoding.compact:
+            srcs = self.encoding.select(sb, se)
+        else:
+            srcs = range(sb, se + 1)
+        for src in srcs:
             if not src in self.fsm:
                 self.fsm[src] = {}
             self.fsm[src][cond] = dst
@@ -177,54 +535,110 @@ class FiniteStateMachine(object):
                     new_dstdict[cond] = dst
             new_fsm[src] = new_dstdict
         self.fsm = new_fsm
+        self.touch()
 
-    def view(self):
+    def prune(self, engine):
+        self.overlaps = []
+        new_fsm = {}
+        for src, dstdict in self.fsm.items():
+            dstdict = self._prune_dstdict(engine, dstdict, src)
+            # a source left without satisfiable edges is no state of its own
+            if len(dstdict) > 0:
+                new_fsm[src] = dstdict
+        self.fsm = new_fsm
+        self.any = self._prune_dstdict(engine, self.any)
+        self.touch()
+
+    def _prune_dstdict(self, engine, dstdict, src=None):
+        dst_node = {}
+        for cond, dst in sorted(dstdict.items(), key=lambda x: x[1]):
+            node = engine.tobdd(cond)
+            if dst in dst_node:
+                node = engine.bdd.apply_or(dst_node[dst], node)
+            dst_node[dst] = engine.restrict(node)
+        dsts = sorted([dst for dst, node in dst_node.items() if node != BDD.FALSE])
+
+        def unmerged():
+            return dict([(cond, dst) for cond, dst in dstdict.items()
+                         if dst_node[dst] != BDD.FALSE and engine.isSatisfiable(cond)])
+
+        overlaps = [(d0, d1) for i, d0 in enumerate(dsts) for d1 in dsts[i + 1:]
+                    if engine.restrict(engine.bdd.apply_and(dst_node[d0], dst_node[d1])) != BDD.FALSE]
+        if len(overlaps) > 0:
+            # nondeterministic: merging would collapse the overlapping edges,
+            # so they are reported and only the unsatisfiable ones are dropped
+            self.overlaps.append((src, tuple(sorted(set([d for pair in overlaps for d in pair])))))
+            logger.warning("Overlapping transition conditions of %s from %s to %s", self.name,
+                           'any' if src is None else str(src),
+                           ', '.join(['%d/%d' % pair for pair in overlaps]))
+            return unmerged()
+        new_dstdict = dict([(engine.canonical(dst_node[dst]), dst) for dst in dsts])
+        if len(new_dstdict) < len(dsts):
+            # disjoint conditions sharing a representative are kept unmerged
+            return unmerged()
+        return new_dstdict
+
+    def states(self):
+        states = set(self.fsm.keys())
+        for dstdict in self.fsm.values():
+            states.update(dstdict.values())
+        states.update(self.any.values())
+        return sorted(states)
+
+    def transitions(self):
+        # yields (src, cond, dst), where src is None for 'any' transitions
         for cond, dst in self.any.items():
-            s = []
-            s.append('any -- ')
-            if cond is not None:
-                s.append(cond.tocode())
-            else:
-                s.append('None')
-            s.append('--> %d' % dst)
-            print(''.join(s))
+            yield (None, cond, dst)
         for src, dstdict in self.fsm.items():
             for cond, dst in dstdict.items():
-                s = []
-                s.append('%d --' % src)
-                if cond is not None:
-                    s.append(cond.tocode())
-                else:
-                    s.append('None')
-                s.append('--> %d' % dst)
-                print(''.join(s))
+                yield (src, cond, dst)
+
+    def view(self, buf=sys.stdout):
+        lines = []
+        for src, cond, dst in self.transitions():
+            code = 'None' if cond is None else cond.tocode()
+            if src is None:
+                lines.append('any -- %s--> %d\n' % (code, dst))
+            else:
+                lines.append('%d --%s--> %d\n' % (src, code, dst))
+        buf.write(''.join(lines))
 
-    def tograph(self, filename='fsm.png', nolabel=False):
+    def minimize(self, encoding=False):
+        # encoding: keep states with different values apart
+        with profiler.span('FiniteStateMachine.minimize'):
+            return minimize.minimize(self, encoding)
+
+    def is_equivalent(self, other, encoding=True):
+        # encoding=False compares only the condition sequences both accept
+        with profiler.span('FiniteStateMachine.is_equivalent'):
+            return minimize.equivalent(self, other, encoding)
+
+    def export(self, filename, format=None, nolabel=False, compact=False):
+        return graphwriter.export(self, filename, format=format, nolabel=nolabel, compact=compact)
+
+    def tograph(self, filename='fsm.png', nolabel=False, dotfile=None, compact=False):
         import pygraphviz as pgv
         #graph = pgv.AGraph(strict=False, directed=True)
         graph = pgv.AGraph(directed=True)
-        for src, dstdict in self.fsm.items():
-            graph.add_node(str(src), label=str(src))
-            for cond, dst in dstdict.items():
-                graph.add_node(str(dst), label=str(dst))
-                if nolabel:
-                    graph.add_edge(str(src), str(dst), label='')
-                else:
-                    graph.add_edge(str(src), str(dst), label=str(cond))
-        srcs = self.fsm.keys()
-        for src in srcs:
-            for cond, dst in self.any.items():
-                graph.add_node(str(dst), label=str(dst))
-                if nolabel:
-                    graph.add_edge(str(src), str(dst), label='')
-                else:
-                    graph.add_edge(str(src), str(dst), label=str(cond))
+        model = graphwriter.build(self, nolabel=nolabel, compact=compact)
+        for node, label in model.nodes.items():
+            graph.add_node(node, label=label)
+        for src, dst, label in model.edges:
+            graph.add_edge(src, dst, label=label)
+        if len(model.legend) > 0:
+            lines = ['%s: %s' % (labelid, label) for labelid, label in model.legend.items()]
+            graph.add_node('legend', shape='box', label='\\l'.join(lines) + '\\l')
 
-        graph.write('file.dot')
+        if dotfile is not None:
+            graph.write(dotfile)
         graph.layout(prog='dot')
         graph.draw(filename)
 
     def get_loop(self):
+        with profiler.span('FiniteStateMachine.get_loop'):
+            return self._get_loop()
+
+    def _get_loop(self):
         loops = set([])
         loop_node_cnt = {}
         for k in sorted(self.fsm.keys()):
@@ -278,16 +692,224 @@ class FiniteStateMachine(object):
                     paths.add((node,) + np)
         return paths
 
+    def successors(self, src):
+        # [(cond, dst)] leaving src, 'any' transitions included
+        return list(self.fsm.get(src, {}).items()) + list(self.any.items())
+
+    def shortest_path(self, src, dst, banned_nodes=(), banned_edges=()):
+        # breadth-first search; a path is a list of (src, cond, dst) steps
+        if src == dst:
+            return []
+        prev = {src: None}
+        queue = deque([src])
+        while queue:
+            node = queue.popleft()
+            for cond, nxt in sorted(self.successors(node), key=lambda x: x[1]):
+                if nxt in prev or nxt in banned_nodes or (node, cond, nxt) in banned_edges:
+                    continue
+                prev[nxt] = (node, cond, nxt)
+                if nxt == dst:
+                    path = []
+                    step = prev[nxt]
+                    while step is not None:
+                        path.append(step)
+                        step = prev[step[0]]
+                    return path[::-1]
+                queue.append(nxt)
+        return None
+
+    def k_shortest_paths(self, src, dst, k):
+        # Yen's algorithm over loopless paths; parallel transitions with
+        # different conditions make different paths
+        first = self.shortest_path(src, dst)
+        if first is None:
+            return []
+        paths = [first]
+        candidates = []
+        while len(paths) < k:
+            last = paths[-1]
+            for i in range(len(last)):
+                spur = last[i][0]
+                root = last[:i]
+                banned_edges = set([p[i] for p in paths if p[:i] == root and len(p) > i])
+                banned_nodes = set([step[0] for step in root])
+                tail = self.shortest_path(spur, dst, banned_nodes, banned_edges)
+                if tail is None:
+                    continue
+                path = root + tail
+                if not path in candidates and not path in paths:
+                    candidates.append(path)
+            if len(candidates) == 0:
+                break
+            candidates.sort(key=len)
+            paths.append(candidates.pop(0))
+        return paths
+
+    def all_paths(self, src, dst, maxlen, simple=True):
+        # yields every path of at most maxlen transitions; with simple=False
+        # states may repeat
+        stack = [(src, [], set([src]))]
+        while stack:
+            node, path, visited = stack.pop()
+            if node == dst and len(path) > 0:
+                yield path
+                if simple:
+                    continue
+            if len(path) >= maxlen:
+                continue
+            for cond, nxt in self.successors(node):
+                if simple and nxt in visited and nxt != dst:
+                    continue
+                stack.append((nxt, path + [(node, cond, nxt)], visited | set([nxt])))
+
+    def distance_matrix(self, method=None):
+        # (states, matrix) of the fewest transitions between states, -1 when
+        # unreachable; cached until the FSM changes
+        key = (self.version, method)
+        if self.distcache is not None and self.distcache[0] == key:
+            return self.distcache[1]
+        states = self.states()
+        if method is None:
+            method = 'floyd' if np is not None and len(states) <= self.max_floyd_states else 'bfs'
+        with profiler.span('FiniteStateMachine.distance_matrix'):
+            if method == 'floyd':
+                matrix = self._floyd_warshall(states)
+            else:
+                matrix = self._bfs_distances(states)
+        self.distcache = (key, (states, matrix))
+        return states, matrix
+
+    def _floyd_warshall(self, states):
+        index = dict([(s, i) for i, s in enumerate(states)])
+        n = len(states)
+        dist = np.full((n, n), np.inf)
+        np.fill_diagonal(dist, 0)
+        for s in states:
+            for cond, dst in self.successors(s):
+                if dst != s:
+                    dist[index[s], index[dst]] = 1
+        for k in range(n):
+            dist = np.minimum(dist, dist[:, k, None] + dist[None, k, :])
+        return np.where(np.isinf(dist), -1, dist).astype(np.int64)
+
+    def _bfs_distances(self, states):
+        index = dict([(s, i) for i, s in enumerate(states)])
+        matrix = []
+        for s in states:
+            row = [-1] * len(states)
+            row[index[s]] = 0
+            queue = deque([s])
+            while queue:
+                node = queue.popleft()
+                for cond, nxt in self.successors(node):
+                    if row[index[nxt]] < 0:
+                        row[index[nxt]] = row[index[node]] + 1
+                        queue.append(nxt)
+            matrix.append(row)
+        return np.array(matrix, dtype=np.int64) if np is not None else matrix
+
+    def distance(self, src, dst):
+        states, matrix = self.distance_matrix()
+        if not src in states or not dst in states:
+            return -1
+        i = states.index(src)
+        j = states.index(dst)
+        return int(matrix[i][j])
+
+
+class TransitionTableBuilder(object):
+    # rows of (src_lo, src_hi, cond_id, dst), expanded at once by build()
+    max_value = 2 ** 62
+
+    def __init__(self):
+        self.rows = []
+        self.conds = []
+        self.cond_index = {}
+
+    def intern(self, cond):
+        if cond in self.cond_index:
+            return self.cond_index[cond]
+        cond_id = len(self.conds)
+        self.conds.append(cond)
+        self.cond_index[cond] = cond_id
+        return cond_id
+
+    def add(self, srcs, dst, cond):
+        sb, se = srcs
+        self.rows.append((sb, se, self.intern(cond), dst))
+
+    def build(self, fsm):
+        if len(self.rows) == 0:
+            return
+        if np is None or not self.vectorizable():
+            for sb, se, cond_id, dst in self.rows:
+                fsm.add((sb, se), dst, self.conds[cond_id])
+            return
+
+        rows = np.array(self.rows, dtype=np.int64)
+        lo, hi, cond_ids, dsts = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+        lengths = np.maximum(hi - lo + 1, 0)
+        total = int(lengths.sum())
+        if total == 0:
+            return
+        rowidx = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        srcs = lo[rowidx] + offsets
+        cids = cond_ids[rowidx]
+
+        # a later row overwrites an earlier one for the same (src, cond),
+        # as repeated FiniteStateMachine.add() calls do
+        order = np.lexsort((rowidx, cids, srcs))
+        srcs = srcs[order]
+        cids = cids[order]
+        rowidx = rowidx[order]
+        last = np.ones(total, dtype=bool)
+        last[:-1] = (srcs[1:] != srcs[:-1]) | (cids[1:] != cids[:-1])
+
+        for src, cond_id, dst in zip(srcs[last].tolist(), cids[last].tolist(),
+                                     dsts[rowidx[last]].tolist()):
+            if not src in fsm.fsm:
+                fsm.fsm[src] = {}
+            fsm.fsm[src][self.conds[cond_id]] = dst
+        fsm.touch()
+
+    def vectorizable(self):
+        for sb, se, cond_id, dst in self.rows:
+            if max(abs(sb), abs(se), abs(dst)) >= self.max_value:
+                return False
+        return True
 
 
 class VerilogActiveConditionAnalyzer(VerilogControlflowAnalyzer):
     def __init__(self, topmodule, terms, binddict,
-                 resolved_terms, resolved_binddict, constlist):
+                 resolved_terms, resolved_binddict, constlist,
+                 fsm_vars=('fsm', 'state', 'count', 'cnt', 'step', 'mode'),
+                 context=None, dagsplit=False):
         VerilogControlflowAnalyzer.__init__(self, topmodule, terms, binddict,
-                                            resolved_terms, resolved_binddict, constlist)
-        self.fsm_loops, self.fsms = self.getLoops()
+                                            resolved_terms, resolved_binddict, constlist,
+                                            fsm_vars, context=context, dagsplit=dagsplit)
+
+    @property
+    def walk_cache(self):
+        # kept in the context, which drops it with the trees when the
+        # constants change
+        self.context.validate(self.optimizer)
+        return self.context.walks
 
-    def getActiveConditions(self, termname, condition=splitter.active_constant):
+    @property
+    def transcond_cache(self):
+        self.context.validate(self.optimizer)
+        return self.context.transconds
+
+    @property
+    def fsms(self):
+        return self.getFiniteStateMachines()
+
+    @property
+    def fsm_loops(self):
+        return self.getLoops()[0]
+
+    def getActiveConditions(self, termname, condition=splitter.active_constant, intervals=False):
         if not termname in self.resolved_binddict:
             return {}
         tree = self.makeTree(termname)
@@ -296,44 +918,112 @@ class VerilogActiveConditionAnalyzer(VerilogControlflowAnalyzer):
         funcdict = splitter.remove_reset_condition(funcdict)
 
         if len(funcdict) == 1 and len(list(funcdict.keys())[0]) == 0:
-            func = funcdict.values()[0]
             return {termname: (('any', None), )}
 
         active_conditions = {}
         active_conditions_size = 0
         for fsm_sig in self.fsms.keys():
-            rslt = self.getActiveConditions_fsm(fsm_sig, funcdict)
+            rslt = self.getActiveConditions_fsm(fsm_sig, funcdict, intervals)
             if len(rslt) > 0:
                 active_conditions[fsm_sig] = rslt
             active_conditions_size += len(rslt)
 
         if active_conditions_size == 0:
-            rslt = self.getActiveConditions_fsm(termname, funcdict)
+            rslt = self.getActiveConditions_fsm(termname, funcdict, intervals)
             if len(rslt) > 0:
                 active_conditions[termname] = rslt
 
         return active_conditions
 
-    def getActiveConditions_fsm(self, fsm_sig, funcdict):
-        # returns a list of some (state, transcond) pairs
+    def getActiveConditionsMany(self, termnames, condition=splitter.active_constant,
+                                intervals=False, processes=None):
+        termnames = list(termnames)
+        if processes is None or processes <= 1 or len(termnames) <= 1:
+            active_conditions = {}
+            for termname in termnames:
+                active_conditions[termname] = self.getActiveConditions(
+                    termname, condition, intervals)
+            return active_conditions
+
+        # warm the shared FSMs before the workers fork
+        self.getFiniteStateMachines()
+        chunks = [termnames[i::processes] for i in range(processes)]
+        pool = multiprocessing.Pool(processes, _init_active_worker,
+                                    (self, condition, intervals))
+        try:
+            rslts = pool.map(_active_worker, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        active_conditions = {}
+        for rslt in rslts:
+            active_conditions.update(rslt)
+        return active_conditions
+
+    def walkCondlist(self, condlist, fsm_sig, fsm_sig_width):
+        key = (condlist, fsm_sig)
+        cache = self.walk_cache
+        if key in cache:
+            profiler.count('walkCondlist.hits')
+            return cache[key]
+        node = transition.walkCondlist(condlist, fsm_sig, fsm_sig_width)
+        state_node_list = []
+        if isinstance(node, transition.StateNodeList):
+            for n in node.nodelist:
+                state_node_list.append(n)
+        elif node:
+            state_node_list.append(node)
+        cache[key] = state_node_list
+        return state_node_list
+
+    def optimizeTranscond(self, transcond):
+        cache = self.transcond_cache
+        if transcond in cache:
+            profiler.count('optimizeTranscond.hits')
+            return cache[transcond]
+        rslt = self.optimizer.optimize(transcond)
+        cache[transcond] = rslt
+        return rslt
+
+    def getActiveConditions_fsm(self, fsm_sig, funcdict, intervals=False):
+        # returns a list of some (state, transcond) pairs,
+        # or (range_start, range_end, transcond) triples if intervals is True
         active_conditions = []
         fsm_sig_width = self.getWidth(fsm_sig)
         for condlist, func in sorted(funcdict.items(), key=lambda x: len(x[0])):
-            node = transition.walkCondlist(condlist, fsm_sig, fsm_sig_width)
-            state_node_list = []
-            if isinstance(node, transition.StateNodeList):
-                for n in node.nodelist:
-                    state_node_list.append(n)
-            elif node:
-                state_node_list.append(node)
+            state_node_list = self.walkCondlist(condlist, fsm_sig, fsm_sig_width)
 
             for state_node in state_node_list:
                 # if state_node.isany:
                 #    active_conditions.append( ('any', state_node.transcond) )
+                if len(state_node.range_pairs) == 0:
+                    continue
+                transcond = self.optimizeTranscond(state_node.transcond)
+                if isinstance(transcond, DFEvalValue) and transcond.value == 0:
+                    continue
                 for rs, re in state_node.range_pairs:
+                    if intervals:
+                        active_conditions.append((rs, re, transcond))
+                        continue
                     for state in range(rs, re + 1):
-                        transcond = self.optimizer.optimize(state_node.transcond)
-                        if isinstance(transcond, DFEvalValue) and transcond.value == 0:
-                            continue
                         active_conditions.append((state, transcond))
-        return tuple(active_conditions)
\ No newline at end of file
+        return tuple(active_conditions)
+
+
+_active_analyzer = None
+_active_condition = None
+_active_intervals = False
+
+
+def _init_active_worker(analyzer, condition, intervals):
+    global _active_analyzer
+    global _active_condition
+    global _active_intervals
+    _active_analyzer = analyzer
+    _active_condition = condition
+    _active_intervals = intervals
+
+
+def _active_worker(termnames):
+    return _active_analyzer.getActiveConditionsMany(termnames, _active_condition,
+                                                    _active_intervals)
\ No newline at end of file
@@ -0,0 +1,389 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import utility
+from dataflow import DFCase
+
+
+class Leaf(object):
+    def __init__(self, value):
+        self.value = value  # DF tree assigned on this path, None keeps the value
+
+
+class Decision(object):
+    def __init__(self, cond, true, false):
+        self.cond = cond
+        self.true = true
+        self.false = false
+
+
+class CaseDecision(object):
+    def __init__(self, selector, items, default):
+        self.selector = selector
+        self.items = items  # [(value node, DAG node)]
+        self.default = default
+
+
+class SplitDAG(object):
+    # the decision structure of a next-state tree; equal subtrees share one
+    # DAG node, and a path's condition tuple is only built while walking it
+    def __init__(self, tree):
+        self.memo = {}  # key:(kind, condition, child ids), value:DAG node
+        self.edgecache = {}  # key:id of a decision, value:its edges
+        self.indexcache = {}  # key:id of a decision, value:its edges by first condition
+        self.root = self.build(tree)
+
+    def build(self, tree):
+        # hash-consing: a decision is keyed by its condition and the identity
+        # of its already shared children, so no subtree is hashed twice
+        if isinstance(tree, DFBranch):
+            true = self.build(tree.truenode)
+            false = self.build(tree.falsenode)
+            key = ('branch', tree.condnode, id(true), id(false))
+            if not key in self.memo:
+                self.memo[key] = Decision(tree.condnode, true, false)
+            return self.memo[key]
+        if isinstance(tree, DFCase):
+            items = [(value, self.build(subtree)) for value, subtree in tree.items]
+            default = self.build(tree.default)
+            key = ('case', tree.selector, tuple([(value, id(node)) for value, node in items]),
+                   id(default))
+            if not key in self.memo:
+                self.memo[key] = CaseDecision(tree.selector, items, default)
+            return self.memo[key]
+        key = ('leaf', tree)
+        if not key in self.memo:
+            self.memo[key] = Leaf(tree)
+        return self.memo[key]
+
+    def edges(self, node):
+        # [(conditions, child)] leaving a decision, in splitter.split order;
+        # cached so that every path shares the same condition objects
+        if id(node) in self.edgecache:
+            return self.edgecache[id(node)][1]
+        if isinstance(node, Decision):
+            rslt = [((node.cond, ), node.true),
+                    ((DFOperator((node.cond, ), 'Ulnot'), ), node.false)]
+        else:
+            # a constant item excludes the other constants by itself, so only
+            # the negations of the non-constant items before it are kept;
+            # items repeating a constant are unreachable
+            rslt = []
+            seen = set([])
+            varnots = ()
+            nots = []
+            for value, child in node.items:
+                const = isinstance(value, DFEvalValue)
+                if const and value.value in seen:
+                    continue
+                eq = DFOperator((node.selector, value), 'Eq')
+                noteq = DFOperator((eq, ), 'Ulnot')
+                if const:
+                    seen.add(value.value)
+                    rslt.append((varnots + (eq, ), child))
+                else:
+                    rslt.append((tuple(nots) + (eq, ), child))
+                    varnots = varnots + (noteq, )
+                nots.append(noteq)
+            rslt.append((tuple(nots), node.default))
+        self.edgecache[id(node)] = (node, rslt)
+        return rslt
+
+    def firstedges(self, node):
+        # edges(node) by their first condition
+        if id(node) in self.indexcache:
+            return self.indexcache[id(node)][1]
+        index = {}
+        for conds, child in self.edges(node):
+            index.setdefault(conds[0] if len(conds) > 0 else None, []).append((conds, child))
+        self.indexcache[id(node)] = (node, index)
+        return index
+
+    def items(self):
+        # yields (condlist, value) for each root-to-leaf path
+        stack = [(self.root, ())]
+        while stack:
+            node, prefix = stack.pop()
+            if isinstance(node, Leaf):
+                if node.value is not None:
+                    yield prefix, node.value
+                continue
+            for conds, child in reversed(self.edges(node)):
+                stack.append((child, prefix + conds))
+
+    def reachable(self, node=None):
+        # the nodes below node (the root by default), each before its children
+        node = self.root if node is None else node
+        order = []
+        visited = set([])
+        stack = [(node, False)]
+        while stack:
+            n, done = stack.pop()
+            if done:
+                order.append(n)
+                continue
+            if id(n) in visited:
+                continue
+            visited.add(id(n))
+            stack.append((n, True))
+            if not isinstance(n, Leaf):
+                for conds, child in self.edges(n):
+                    if not id(child) in visited:
+                        stack.append((child, False))
+        order.reverse()
+        return order
+
+    def count(self, node=None):
+        # number of paths below node to an assignment, without walking them
+        counts = {}
+        for n in reversed(self.reachable(node)):
+            if isinstance(n, Leaf):
+                counts[id(n)] = 0 if n.value is None else 1
+            else:
+                counts[id(n)] = sum([counts[id(c)] for conds, c in self.edges(n)])
+        return counts[id(self.root if node is None else node)]
+
+    def remove_reset(self, remove_reset_condlist):
+        # a decision on a reset condition gives way to its false side, as
+        # remove_reset_condition lets the stripped keys of the false side
+        # overwrite those of the true side; the true side is only kept when
+        # the false side assigns nothing. Returns the constants given way.
+        resetvalues = set([])
+        resets = {}
+        rebuilt = {}
+        for node in reversed(self.reachable()):
+            rslt = node
+            if isinstance(node, Decision):
+                if not node.cond in resets:
+                    resets[node.cond] = len(remove_reset_condlist((node.cond, ))) == 0
+                true, false = rebuilt[id(node.true)], rebuilt[id(node.false)]
+                if resets[node.cond]:
+                    if self.count(false) > 0:
+                        rslt, dropped = false, node.true
+                    else:
+                        rslt, dropped = true, node.false
+                    resetvalues.update(self.leafvalues(dropped))
+                elif true is not node.true or false is not node.false:
+                    rslt = Decision(node.cond, true, false)
+            elif isinstance(node, CaseDecision):
+                # items repeating a constant are never reached nor rebuilt
+                items = [(value, rebuilt.get(id(child), child)) for value, child in node.items]
+                default = rebuilt[id(node.default)]
+                if (default is not node.default or
+                        any([c is not child for (v, c), (value, child) in zip(items, node.items)])):
+                    rslt = CaseDecision(node.selector, items, default)
+            rebuilt[id(node)] = rslt
+        self.root = rebuilt[id(self.root)]
+        return resetvalues
+
+    def leafvalues(self, node):
+        return set([n.value.value for n in self.reachable(node)
+                    if isinstance(n, Leaf) and isinstance(n.value, DFEvalValue)])
+
+
+class StateWalker(object):
+    # the passes getFiniteStateMachine runs on the next-state function of
+    # termname, fed from the DAG instead of its expanded paths: the nodes are
+    # visited in one topological order, and every condition is inferred and
+    # walked by transition.walkCond once
+    def __init__(self, dag, termname, width):
+        self.dag = dag
+        self.termname = termname
+        self.width = width
+        self.order = dag.reachable()
+        self.live = set([])  # ids of the nodes with a path to an assignment
+        self.constlive = set([])  # ids of the nodes with a path to a constant
+        for node in reversed(self.order):
+            if isinstance(node, Leaf):
+                live = node.value is not None
+                constlive = isinstance(node.value, DFEvalValue)
+            else:
+                children = [id(child) for conds, child in dag.edges(node)]
+                live = any([c in self.live for c in children])
+                constlive = any([c in self.constlive for c in children])
+            if live:
+                self.live.add(id(node))
+            if constlive:
+                self.constlive.add(id(node))
+        self.mays = {}  # key:cond, value:IntervalSet of the state values it may hold for
+        self.statenodes = {}  # key:cond, value:transition.walkCond result
+
+    def may(self, cond):
+        if not cond in self.mays:
+            self.mays[cond] = utility.inferCondition(cond, self.termname, self.width)[0]
+        return self.mays[cond]
+
+    def walk(self, cond):
+        if not cond in self.statenodes:
+            self.statenodes[cond] = transition.walkCond(cond, self.termname, self.width)
+        return self.statenodes[cond]
+
+    def narrow(self, may, conds):
+        # may below conds, None when no state value can take them
+        for cond in conds:
+            may = may.intersect(self.may(cond))
+            if may.isempty():
+                return None
+        return may
+
+    def propagate(self, start, step, merge):
+        # the value of each live node, from start at the root: step(value,
+        # conds) gives the value below an edge (None drops the edge), merge
+        # joins the values arriving at a shared node
+        values = {}
+        if id(self.dag.root) in self.live:
+            values[id(self.dag.root)] = start
+        for node in self.order:
+            if isinstance(node, Leaf) or not id(node) in values:
+                continue
+            value = values[id(node)]
+            for conds, child in self.dag.edges(node):
+                if not id(child) in self.live:
+                    continue
+                v = step(value, conds)
+                if v is None:
+                    continue
+                values[id(child)] = v if not id(child) in values else merge(values[id(child)], v)
+        return values
+
+    def branches(self):
+        # utility.getStateBranches with one branch per leaf: its may set is
+        # the union over the paths to it, which inferStateDomain treats alike
+        values = self.propagate(utility.IntervalSet.full(self.width), self.narrow,
+                                lambda a, b: a.union(b))
+        return [(values[id(node)], node.value) for node in self.order
+                if isinstance(node, Leaf) and id(node) in values and
+                not (isinstance(node.value, DFTerminal) and node.value.name == self.termname)]
+
+    def evidence(self):
+        # utility.getEncodingEvidence: the tests of every live edge, and the
+        # first state value each path tests, carried down as a set per node
+        dsts = set([])
+        consts = set([])
+        bits = set([])
+        pairs = set([])
+        tested = set([])
+        for node in self.order:
+            if isinstance(node, Leaf) or not id(node) in self.live:
+                continue
+            for conds, child in self.dag.edges(node):
+                if not id(child) in self.live:
+                    continue
+                for cond in conds:
+                    if not cond in tested:
+                        tested.add(cond)
+                        utility.getStateTests(cond, self.termname, consts, bits)
+
+        def step(srcs, conds):
+            src = utility.getStateSource(conds, self.termname)
+            if src is None or not None in srcs:
+                return srcs
+            return set([s for s in srcs if s is not None] + [src])
+
+        srcs = self.propagate(set([None]), step, lambda a, b: a | b)
+        for node in self.order:
+            if not isinstance(node, Leaf) or not isinstance(node.value, DFEvalValue):
+                continue
+            if not id(node) in srcs:
+                continue
+            dsts.add(node.value.value)
+            for src in srcs[id(node)]:
+                if src is not None and src != node.value.value:
+                    pairs.add((src, node.value.value))
+        return dsts, consts, bits, pairs
+
+    def transitions(self, domain=None):
+        # (constant value, state node, state values) of each constant path,
+        # shortest condition lists first as in the flat mode. The depth-first
+        # walk folds the walkCond results as walkCondlist does, sharing each
+        # prefix between the paths below it, and drops the paths no state
+        # value in domain can take.
+        start = domain if domain is not None else utility.IntervalSet.full(self.width)
+        rslt = []
+        stack = [(self.dag.root, None, start, 0)]
+        if not id(self.dag.root) in self.constlive:
+            stack = []
+        while stack:
+            node, statenode, may, depth = stack.pop()
+            if isinstance(node, Leaf):
+                if depth == 0:
+                    statenode = transition.walkCondlist((), self.termname, self.width)
+                if statenode is not None:
+                    rslt.append((depth, node.value.value, statenode, may))
+                continue
+            for conds, child in reversed(self.dag.edges(node)):
+                if not id(child) in self.constlive:
+                    continue
+                m = self.narrow(may, conds)
+                if m is None:
+                    continue
+                s = statenode
+                for cond in conds:
+                    r = self.walk(cond)
+                    if s and r:
+                        s = transition.andStateNodeList(s, r)
+                    elif r:
+                        s = r
+                stack.append((child, s, m, depth + len(conds)))
+        rslt.sort(key=lambda x: x[0])
+        return [(value, statenode, may) for depth, value, statenode, may in rslt]
+
+
+class DAGFuncdict(object):
+    # read-only mapping from condition tuples to values, like splitter.split()
+    # returns, materialized path by path from a SplitDAG
+    def __init__(self, dag):
+        self.dag = dag
+
+    def __len__(self):
+        return self.dag.count()
+
+    def __iter__(self):
+        for condlist, value in self.dag.items():
+            yield condlist
+
+    def keys(self):
+        return list(iter(self))
+
+    def values(self):
+        return [value for condlist, value in self.dag.items()]
+
+    def items(self):
+        return list(self.dag.items())
+
+    def lookup(self, key):
+        # (found, value): key is followed down the DAG edge by edge
+        node = self.dag.root
+        pos = 0
+        while not isinstance(node, Leaf):
+            first = key[pos] if pos < len(key) else None
+            for conds, child in self.dag.firstedges(node).get(first, ()):
+                if key[pos:pos + len(conds)] == conds:
+                    node = child
+                    pos += len(conds)
+                    break
+            else:
+                return False, None
+        if pos < len(key) or node.value is None:
+            return False, None
+        return True, node.value
+
+    def __getitem__(self, key):
+        found, value = self.lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.lookup(key)[0]
+
+    def get(self, key, default=None):
+        found, value = self.lookup(key)
+        return value if found else default
+
+    def single(self):
+        # the value of a funcdict holding only the empty condition tuple
+        if isinstance(self.dag.root, Leaf):
+            return self.dag.root.value
+        return None
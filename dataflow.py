@@ -1,3 +1,6 @@
+import profiler
+import utility
+
 
 class VerilogDataflowAnalyzer(VerilogCodeParser):
     def __init__(self, filelist, topmodule='TOP', noreorder=False, nobind=False,
@@ -7,6 +10,7 @@ class VerilogDataflowAnalyzer(VerilogCodeParser):
         self.terms = {}
         self.binddict = {}
         self.frametable = None
+        self.index = None
         files = filelist if isinstance(filelist, tuple) or isinstance(
             filelist, list) else [filelist]
         VerilogCodeParser.__init__(self, files,
@@ -16,31 +20,303 @@ class VerilogDataflowAnalyzer(VerilogCodeParser):
         self.nobind = nobind
 
     def generate(self):
-        ast = self.parse()
+        with profiler.span('parse'):
+            ast = self.parse()
 
-        module_visitor = ModuleVisitor()
-        module_visitor.visit(ast)
-        modulenames = module_visitor.get_modulenames()
-        moduleinfotable = module_visitor.get_moduleinfotable()
+        with profiler.span('ModuleVisitor'):
+            module_visitor = ModuleVisitor()
+            module_visitor.visit(ast)
+            modulenames = module_visitor.get_modulenames()
+            moduleinfotable = module_visitor.get_moduleinfotable()
 
-        signal_visitor = SignalVisitor(moduleinfotable, self.topmodule)
-        signal_visitor.start_visit()
-        frametable = signal_visitor.getFrameTable()
+        with profiler.span('SignalVisitor'):
+            signal_visitor = SignalVisitor(moduleinfotable, self.topmodule)
+            signal_visitor.start_visit()
+            frametable = signal_visitor.getFrameTable()
 
         if self.nobind:
             self.frametable = frametable
             return
 
-        bind_visitor = BindVisitor(moduleinfotable, self.topmodule, frametable,
-                                   noreorder=self.noreorder)
+        with profiler.span('BindVisitor'):
+            bind_visitor = BindVisitor(moduleinfotable, self.topmodule, frametable,
+                                       noreorder=self.noreorder)
 
-        bind_visitor.start_visit()
-        dataflow = bind_visitor.getDataflows()
+            bind_visitor.start_visit()
+            dataflow = bind_visitor.getDataflows()
 
         self.frametable = bind_visitor.getFrameTable()
         self.terms = dataflow.getTerms()
         self.binddict = dataflow.getBinddict()
-
+        with profiler.span('DataflowIndex'):
+            self.index = DataflowIndex(self.terms, self.binddict)
+
+    def getFrameTable(self):
+        return self.frametable
+
+    def getTerms(self):
+        return self.terms
+
+    def getBinddict(self):
+        return self.binddict
+
+    def getIndex(self):
+        if self.index is None:
+            self.index = DataflowIndex(self.terms, self.binddict)
+        return self.index
+
+    def getFanin(self, termname):
+        return self.getIndex().getFanin(termname)
+
+    def setBinds(self, termname, bindlist):
+        self.getBinddict()[termname] = bindlist
+        self.getIndex().setBinds(termname, bindlist)
+
+    def getFanout(self, termname):
+        return self.getIndex().getFanout(termname)
+
+    def getCone(self, termnames):
+        # terms and binds in the transitive fan-in of the given terms
+        names = self.getIndex().getCone(termnames)
+        terms = self.getTerms()
+        binddict = self.getBinddict()
+        cone_terms = dict([(n, terms[n]) for n in names if n in terms])
+        cone_binddict = dict([(n, binddict[n]) for n in names if n in binddict])
+        return cone_terms, cone_binddict
+
+
+class DataflowIndex(object):
+    # direct fan-in and fan-out of every term, from the trees in binddict
+    def __init__(self, terms=None, binddict=None):
+        self.fanin = {}  # key:termname, value:set of termnames it reads
+        self.fanout = {}  # key:termname, value:set of termnames reading it
+        if terms is not None:
+            for termname in terms.keys():
+                self.addTerm(termname)
+        if binddict is not None:
+            for termname, bindlist in binddict.items():
+                for bind in bindlist:
+                    self.addBind(termname, bind)
+
+    def addTerm(self, termname):
+        if not termname in self.fanin:
+            self.fanin[termname] = set([])
+        if not termname in self.fanout:
+            self.fanout[termname] = set([])
+
+    def addBind(self, termname, bind):
+        self.addTerm(termname)
+        for node in (bind.tree, bind.msb, bind.lsb, bind.ptr):
+            for name in utility.getTerminals(node):
+                self.addTerm(name)
+                self.fanin[termname].add(name)
+                self.fanout[name].add(termname)
+
+    def removeBinds(self, termname):
+        for name in self.fanin.get(termname, ()):
+            self.fanout[name].discard(termname)
+        self.fanin[termname] = set([])
+
+    def setBinds(self, termname, bindlist):
+        self.removeBinds(termname)
+        for bind in bindlist:
+            self.addBind(termname, bind)
+
+    def removeTerm(self, termname):
+        self.removeBinds(termname)
+        for name in self.fanout.get(termname, ()):
+            self.fanin[name].discard(termname)
+        if termname in self.fanin:
+            del self.fanin[termname]
+        if termname in self.fanout:
+            del self.fanout[termname]
+
+    def getFanin(self, termname):
+        return self.fanin.get(termname, set([]))
+
+    def getFanout(self, termname):
+        return self.fanout.get(termname, set([]))
+
+    def getCone(self, termnames, expand=None):
+        # transitive fan-in; terms for which expand() is False are kept as leaves
+        roots = set(termnames)
+        visited = set(roots)
+        stack = list(roots)
+        while stack:
+            name = stack.pop()
+            if expand is not None and not name in roots and not expand(name):
+                continue
+            for n in self.getFanin(name):
+                if not n in visited:
+                    visited.add(n)
+                    stack.append(n)
+        return visited
+
+    def getDeadTerms(self, keep=()):
+        # terms that are read by nothing, except the given ones
+        return set([name for name, readers in self.fanout.items()
+                    if len(readers) == 0 and not name in keep])
+
+
+class DFCase(DFNotTerminal):
+    # multi-way branch: the first item whose value equals the selector wins,
+    # default (None keeps the current value) when none does
+    def __init__(self, selector, items, default=None):
+        self.selector = selector
+        self.items = tuple(items)  # ((value node, subtree), ...) in priority order
+        self.default = default
+        self.index = {}  # key:constant value, value:position of its first item
+        self.firstvar = len(self.items)  # position of the first non-constant value
+        for i, (value, node) in enumerate(self.items):
+            if not isinstance(value, DFEvalValue):
+                self.firstvar = min(self.firstvar, i)
+            elif not value.value in self.index:
+                self.index[value.value] = i
+
+    def __repr__(self):
+        return self.tostr()
+
+    def tostr(self):
+        ret = '(Case Selector:' + self.selector.tostr()
+        for value, node in self.items:
+            ret += ' Item:' + value.tostr() + ':' + ('None' if node is None else node.tostr())
+        ret += ' Default:' + ('None' if self.default is None else self.default.tostr()) + ')'
+        return ret
+
+    def tocode(self, dest='dest'):
+        selector = self.selector.tocode(dest)
+        ret = []
+        for value, node in self.items:
+            ret.append('((%s==%s)? %s : ' % (selector, value.tocode(dest),
+                                             dest if node is None else node.tocode(dest)))
+        ret.append(dest if self.default is None else self.default.tocode(dest))
+        ret.append(')' * len(self.items))
+        return ''.join(ret)
+
+    def tolabel(self):
+        return '_Case'
+
+    def children(self):
+        nodes = [self.selector]
+        for value, node in self.items:
+            nodes.append(value)
+            nodes.append(node)
+        nodes.append(self.default)
+        return tuple(nodes)
+
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return (self.selector == other.selector and self.items == other.items and
+                self.default == other.default)
+
+    def __hash__(self):
+        return hash((self.selector, self.items, self.default))
+
+    def lookup(self, value):
+        # (found, subtree) for a constant selector value; not found when a
+        # non-constant item value comes first
+        i = self.index.get(value)
+        if i is not None and i < self.firstvar:
+            return True, self.items[i][1]
+        if i is None and self.firstvar == len(self.items):
+            return True, self.default
+        return False, None
+
+    def tobranch(self):
+        node = self.default
+        for value, subtree in reversed(self.items):
+            node = DFBranch(DFOperator((self.selector, value), 'Eq'), subtree, node)
+        return node
+
+
+def getCaseItem(cond):
+    # (selector, value) of an 'Eq' condition with a constant side
+    if not isinstance(cond, DFOperator) or cond.operator != 'Eq' or len(cond.nextnodes) != 2:
+        return None
+    left, right = cond.nextnodes
+    for value in (right, left):
+        if isinstance(value, (DFEvalValue, DFIntConst, DFConstant)):
+            return (left if value is right else right), value
+    return None
+
+
+def toCase(tree, min_items=8):
+    # (tree, converted cases): right-deep DFBranch chains comparing one
+    # selector with constants become DFCase nodes; only branches are descended
+    if not isinstance(tree, DFBranch):
+        return tree, 0
+    items = []
+    selector = None
+    node = tree
+    while isinstance(node, DFBranch):
+        item = getCaseItem(node.condnode)
+        if item is None or (selector is not None and item[0] != selector):
+            break
+        selector = item[0]
+        items.append((item[1], node.truenode))
+        node = node.falsenode
+    cnt = 0
+    if len(items) < min_items:
+        # not a case chain: keep the head branch, convert below it
+        condnode, truenode, falsenode = tree.condnode, tree.truenode, tree.falsenode
+        truenode, c0 = toCase(truenode, min_items)
+        falsenode, c1 = toCase(falsenode, min_items)
+        return DFBranch(condnode, truenode, falsenode), c0 + c1
+    new_items = []
+    for value, subtree in items:
+        subtree, c = toCase(subtree, min_items)
+        cnt += c
+        new_items.append((value, subtree))
+    default, c = toCase(node, min_items)
+    return DFCase(selector, new_items, default), cnt + c + 1
+
+
+def fromCase(tree):
+    # expands DFCase nodes below branches back into DFBranch chains
+    if isinstance(tree, DFCase):
+        node = fromCase(tree.default)
+        for value, subtree in reversed(tree.items):
+            node = DFBranch(DFOperator((tree.selector, value), 'Eq'), fromCase(subtree), node)
+        return node
+    if isinstance(tree, DFBranch):
+        return DFBranch(tree.condnode, fromCase(tree.truenode), fromCase(tree.falsenode))
+    return tree
+
+
+class ConstantList(dict):
+    # constant values by name; every write bumps version, so caches of trees
+    # resolved against the list notice constants changed in place
+    version = 0  # a class default, as unpickling fills the items first
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, name, value)
+        self.version += 1
+
+    def __delitem__(self, name):
+        dict.__delitem__(self, name)
+        self.version += 1
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version += 1
+
+    def setdefault(self, name, value=None):
+        if not name in self:
+            self[name] = value
+        return self[name]
+
+    def pop(self, name, *default):
+        self.version += 1
+        return dict.pop(self, name, *default)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
 
 
 class VerilogOptimizer(object):
@@ -49,16 +325,27 @@ class VerilogOptimizer(object):
 
     def __init__(self, terms, constlist=None, default_width=32, level=2):
         self.terms = terms
-        self.constlist = constlist if constlist is not None else {}
+        self.constlist = constlist if constlist is not None else ConstantList()
         self.default_width = default_width
         self.level = level
+        self.constwrites = 0  # writes through setConstant/resetConstant
+
+    @property
+    def constversion(self):
+        # a ConstantList counts every write itself, a plain dict only the
+        # writes through this optimizer
+        if isinstance(self.constlist, ConstantList):
+            return self.constlist.version
+        return self.constwrites
 
     def setConstant(self, name, value):
         self.constlist[name] = value
+        self.constwrites += 1
 
     def resetConstant(self, name):
         if name in self.constlist:
             del self.constlist[name]
+            self.constwrites += 1
 
     def getConstant(self, name):
         if not name in self.constlist:
@@ -87,9 +374,42 @@ class VerilogOptimizer(object):
             t = self.optimizeHierarchy(t)
         return t
 
+    def optimizeCaseConstant(self, tree):
+        selector = self.optimizeConstant(tree.selector)
+        if isinstance(selector, DFEvalValue) and tree.firstvar == len(tree.items):
+            # every item value is already constant: O(1) through the index
+            found, node = tree.lookup(selector.value)
+            return self.optimizeConstant(node)
+        items = [(self.optimizeConstant(value), self.optimizeConstant(node))
+                 for value, node in tree.items]
+        return self.foldCase(selector, items, self.optimizeConstant(tree.default))
+
+    def foldCase(self, selector, items, default):
+        # drops unreachable items and folds a constant selector
+        new_items = []
+        seen = set([])
+        for value, node in items:
+            if isinstance(value, DFEvalValue):
+                if value.value in seen:
+                    continue
+                seen.add(value.value)
+                if isinstance(selector, DFEvalValue) and len(new_items) == 0:
+                    if selector.value == value.value:
+                        return node
+                    continue
+            new_items.append((value, node))
+        if len(new_items) == 0:
+            return default
+        return DFCase(selector, new_items, default)
+
     def optimizeConstant(self, tree):
         if tree is None:
             return None
+        if profiler.default.enabled:
+            profiler.count('optimizeConstant.nodes')
+        if isinstance(tree, DFCase):
+            return self.optimizeCaseConstant(tree)
+
         if isinstance(tree, DFBranch):
             condnode = self.optimizeConstant(tree.condnode)
             truenode = self.optimizeConstant(tree.truenode)
@@ -189,7 +509,7 @@ class VerilogOptimizer(object):
 
 class VerilogDataflowOptimizer(VerilogOptimizer):
     def __init__(self, terms, binddict):
-        VerilogOptimizer.__init__(self, terms, {})
+        VerilogOptimizer.__init__(self, terms, ConstantList())
         self.binddict = binddict
         self.resolved_terms = {}
         self.resolved_binddict = {}
@@ -207,20 +527,26 @@ class VerilogDataflowOptimizer(VerilogOptimizer):
         return self.terms[name]
 
     def resolveConstant(self):
+        with profiler.span('resolveConstant'):
+            self._resolveConstant()
+
+    def _resolveConstant(self):
         # 2-pass
         for bk, bv in sorted(self.binddict.items(), key=lambda x: len(x[0])):
             termtype = self.getTerm(bk).termtype
             if signaltype.isParameter(termtype) or signaltype.isLocalparam(termtype):
                 rslt = self.optimizeConstant(bv[0].tree)
+                profiler.count('resolveConstant.trees')
                 if isinstance(rslt, DFEvalValue):
-                    self.constlist[bk] = rslt
+                    self.setConstant(bk, rslt)
 
         for bk, bv in sorted(self.binddict.items(), key=lambda x: len(x[0])):
             termtype = self.getTerm(bk).termtype
             if signaltype.isParameter(termtype) or signaltype.isLocalparam(termtype):
                 rslt = self.optimizeConstant(bv[0].tree)
+                profiler.count('resolveConstant.trees')
                 if isinstance(rslt, DFEvalValue):
-                    self.constlist[bk] = rslt
+                    self.setConstant(bk, rslt)
 
         self.resolved_binddict = copy.deepcopy(self.binddict)
         for bk, bv in sorted(self.binddict.items(), key=lambda x: len(x[0])):
@@ -0,0 +1,266 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+from dataflow import DFCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def mask(width):
+    return (1 << width) - 1
+
+
+def _div(a, b):
+    return a // b if b != 0 else 0
+
+
+def _mod(a, b):
+    return a % b if b != 0 else 0
+
+
+def _parity(a):
+    return bin(a).count('1') & 1
+
+
+def _vdiv(a, b):
+    b = np.asarray(b)
+    return np.where(b != 0, a // np.where(b != 0, b, 1), 0)
+
+
+def _vmod(a, b):
+    b = np.asarray(b)
+    return np.where(b != 0, a % np.where(b != 0, b, 1), 0)
+
+
+def _vparity(a):
+    a = np.array(a, dtype=np.int64)
+    p = np.zeros_like(a)
+    while np.any(a):
+        p ^= a & 1
+        a >>= 1
+    return p
+
+
+def load(source, varnames, width, vectorized=False):
+    # rebuilds a CompiledFunction from its source, e.g. in a worker process
+    namespace = dict(DFCompiler.vector_namespace if vectorized else DFCompiler.namespace)
+    exec(compile(source, '<dfcompiler>', 'exec'), namespace)
+    return CompiledFunction(namespace['_f'], source, varnames, width, vectorized)
+
+
+class CompiledFunction(object):
+    def __init__(self, func, source, varnames, width, vectorized=False):
+        self.func = func
+        self.source = source
+        self.varnames = tuple(varnames)
+        self.index = dict([(name, i) for i, name in enumerate(self.varnames)])
+        self.width = width
+        self.vectorized = vectorized  # values are NumPy arrays, one entry per run
+
+    def __call__(self, values):
+        # values: a flat sequence ordered as varnames, or a dict by name
+        if isinstance(values, dict):
+            values = [values.get(name, 0) for name in self.varnames]
+        return self.func(values)
+
+
+class DFCompiler(object):
+    arith_ops = {
+        'Plus': '+', 'Minus': '-', 'Times': '*', 'Power': '**',
+        'And': '&', 'Or': '|', 'Xor': '^',
+        'Sll': '<<', 'Srl': '>>', 'Sla': '<<', 'Sra': '>>',
+    }
+    compare_ops = {
+        'LessThan': '<', 'GreaterThan': '>', 'LessEq': '<=', 'GreaterEq': '>=',
+        'Eq': '==', 'NotEq': '!=', 'Eql': '==', 'NotEql': '!=',
+    }
+    namespace = {'_div': _div, '_mod': _mod, '_parity': _parity}
+    vector_namespace = {'np': np, '_div': _vdiv, '_mod': _vmod, '_parity': _vparity}
+    max_vector_width = 62
+
+    def __init__(self, getwidth, default_width=32, vectorized=False):
+        # vectorized: generate NumPy code evaluating every run at once
+        if vectorized and np is None:
+            raise ImportError('vectorized compilation needs numpy')
+        self.getwidth = getwidth
+        self.default_width = default_width
+        self.vectorized = vectorized
+
+    def compile(self, tree, width=None, termname=None, varnames=None):
+        # termname: signal whose current value stands for unassigned branches
+        self.varnames = list(varnames) if varnames is not None else []
+        self.varindex = dict([(name, i) for i, name in enumerate(self.varnames)])
+        self.termname = termname
+        self.prelude = []  # helper definitions emitted before _f
+        code, w = self.expr(tree)
+        width = w if width is None else width
+        if self.vectorized and width > self.max_vector_width:
+            raise verror.FormatError('Can not vectorize a %d-bit expression' % width)
+        source = ''.join(self.prelude) + 'def _f(v):\n    return (%s) & %d\n' % (code, mask(width))
+        return load(source, self.varnames, width, self.vectorized)
+
+    def boolean(self, pred):
+        if self.vectorized:
+            return 'np.where(%s, 1, 0)' % pred
+        return '(1 if %s else 0)' % pred
+
+    def branch(self, cond, true, false):
+        if self.vectorized:
+            return 'np.where(%s != 0, %s, %s)' % (cond, true, false)
+        return '(%s if %s else %s)' % (true, cond, false)
+
+    def logical(self, op, args):
+        if self.vectorized:
+            joint = ' & ' if op == 'Land' else ' | '
+            return self.boolean(joint.join(['(%s != 0)' % a for a in args]))
+        joint = ' and ' if op == 'Land' else ' or '
+        return self.boolean(joint.join(args))
+
+    def var(self, name):
+        if not name in self.varindex:
+            self.varindex[name] = len(self.varnames)
+            self.varnames.append(name)
+        return 'v[%d]' % self.varindex[name]
+
+    def signal(self, name):
+        # int64 arrays hold neither the operand nor random draws beyond 62 bits
+        width = self.getwidth(name)
+        if self.vectorized and width > self.max_vector_width:
+            raise verror.FormatError('Can not vectorize the %d-bit signal %s' % (width, str(name)))
+        return self.var(name), width
+
+    def constant(self, node):
+        if isinstance(node, DFEvalValue):
+            return node.value
+        code, w = self.expr(node)
+        try:
+            return int(eval(code, dict(self.vector_namespace if self.vectorized else
+                                       self.namespace)))
+        except NameError:
+            return None
+
+    def expr(self, node):
+        if node is None:
+            if self.termname is None:
+                return '0', self.default_width
+            return self.signal(self.termname)
+
+        if isinstance(node, DFEvalValue):
+            width = node.width if node.width is not None else self.default_width
+            return '%d' % node.value, width
+        if isinstance(node, (DFUndefined, DFHighImpedance)):
+            return '0', self.default_width
+        if isinstance(node, DFIntConst):
+            return '%d' % node.eval(), node.width()
+        if isinstance(node, DFConstant):
+            return '%d' % node.eval(), self.default_width
+        if isinstance(node, DFTerminal):
+            return self.signal(node.name)
+
+        if isinstance(node, DFBranch):
+            cond, cw = self.expr(node.condnode)
+            true, tw = self.expr(node.truenode)
+            false, fw = self.expr(node.falsenode)
+            return self.branch(cond, true, false), max(tw, fw)
+
+        if isinstance(node, DFOperator):
+            return self.operator(node)
+
+        if isinstance(node, DFCase):
+            return self.case(node)
+
+        if isinstance(node, DFPartselect):
+            var, vw = self.expr(node.var)
+            msb = self.constant(node.msb)
+            lsb = self.constant(node.lsb)
+            if msb is None or lsb is None:
+                raise verror.FormatError('Can not compile a variable part-select: %s' % str(node))
+            width = msb - lsb + 1
+            return '((%s >> %d) & %d)' % (var, lsb, mask(width)), width
+
+        if isinstance(node, DFPointer):
+            var, vw = self.expr(node.var)
+            ptr, pw = self.expr(node.ptr)
+            return '((%s >> %s) & 1)' % (var, ptr), 1
+
+        if isinstance(node, DFConcat):
+            code = None
+            width = 0
+            for n in node.nextnodes:
+                c, w = self.expr(n)
+                c = '(%s & %d)' % (c, mask(w))
+                code = c if code is None else '((%s << %d) | %s)' % (code, w, c)
+                width += w
+            return code, width
+
+        raise verror.FormatError('Can not compile the tree: %s %s' %
+                                 (str(type(node)), str(node)))
+
+    def case(self, node):
+        if node.firstvar < len(node.items):
+            return self.expr(node.tobranch())
+        sel, sw = self.expr(node.selector)
+        alts = [self.expr(n) for v, n in node.items] + [self.expr(node.default)]
+        width = max([w for c, w in alts])
+        if self.vectorized:
+            conds = ['%s == %d' % (sel, v.value) for v, n in node.items]
+            return ('np.select([%s], [%s], %s)' %
+                    (', '.join(conds), ', '.join([c for c, w in alts[:-1]]), alts[-1][0]), width)
+        # one function per item, picked through a dict index: O(1) per call
+        n = len(self.prelude)
+        for i, (c, w) in enumerate(alts):
+            self.prelude.append('def _case%d_%d(v):\n    return %s\n' % (n, i, c))
+        self.prelude.append('_case%d = (%s, )\n' %
+                            (n, ', '.join(['_case%d_%d' % (n, i) for i in range(len(alts))])))
+        table = ', '.join(['%d: %d' % (value, i) for value, i in sorted(node.index.items())])
+        self.prelude.append('_case%d_index = {%s}\n' % (n, table))
+        return '_case%d[_case%d_index.get(%s, %d)](v)' % (n, n, sel, len(node.items)), width
+
+    def operator(self, node):
+        op = node.operator
+        args = [self.expr(n) for n in node.nextnodes]
+        if len(args) == 1:
+            a, w = args[0]
+            if op == 'Ulnot':
+                return self.boolean('%s == 0' % a), 1
+            if op == 'Unot':
+                return '(~%s & %d)' % (a, mask(w)), w
+            if op == 'Uminus':
+                return '(-%s & %d)' % (a, mask(w)), w
+            if op == 'Uplus':
+                return a, w
+            if op == 'Uand':
+                return self.boolean('%s == %d' % (a, mask(w))), 1
+            if op == 'Unand':
+                return self.boolean('%s != %d' % (a, mask(w))), 1
+            if op == 'Uor':
+                return self.boolean('%s != 0' % a), 1
+            if op == 'Unor':
+                return self.boolean('%s == 0' % a), 1
+            if op == 'Uxor':
+                return '_parity(%s)' % a, 1
+            if op == 'Uxnor':
+                return '(1 - _parity(%s))' % a, 1
+            raise verror.FormatError('Can not compile the operator: %s' % op)
+
+        if op in ('Land', 'Lor'):
+            return self.logical(op, [a for a, w in args]), 1
+        (a, aw), (b, bw) = args[0], args[1]
+        width = max(aw, bw)
+        if op in self.compare_ops:
+            return self.boolean('%s %s %s' % (a, self.compare_ops[op], b)), 1
+        if op == 'Xnor':
+            return '(~(%s ^ %s) & %d)' % (a, b, mask(width)), width
+        if op == 'Divide':
+            return '_div(%s, %s)' % (a, b), width
+        if op == 'Mod':
+            return '_mod(%s, %s)' % (a, b), width
+        if op in ('Sll', 'Srl', 'Sla', 'Sra'):
+            width = aw
+        if op in self.arith_ops:
+            return '((%s %s %s) & %d)' % (a, self.arith_ops[op], b, mask(width)), width
+        raise verror.FormatError('Can not compile the operator: %s' % op)
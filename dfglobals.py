@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import copy
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+
+def install():
+    # the modules of this tree read the pyverilog dataflow nodes, visitors
+    # and helper modules as globals; scripts and tests that run them from
+    # outside pyverilog put those into builtins first. Returns False when
+    # pyverilog is not installed.
+    try:
+        import pyverilog.dataflow.dataflow as df
+    except ImportError:
+        return False
+    import pyverilog.utils.verror as verror
+    import pyverilog.utils.util as util
+    import pyverilog.utils.signaltype as signaltype
+    import pyverilog.controlflow.splitter as splitter
+    import pyverilog.controlflow.transition as transition
+    import pyverilog.dataflow.reorder as reorder
+    import pyverilog.dataflow.replace as replace
+    from pyverilog.vparser.parser import VerilogCodeParser
+    from pyverilog.vparser.ast import Identifier
+    from pyverilog.dataflow.visit import NodeVisitor
+    from pyverilog.dataflow.modulevisitor import ModuleVisitor
+    from pyverilog.dataflow.signalvisitor import SignalVisitor
+    from pyverilog.dataflow.bindvisitor import BindVisitor
+    from pyverilog.dataflow.subset import VerilogSubset
+    from pyverilog.dataflow.walker import VerilogDataflowWalker
+    from pyverilog.ast_code_generator.codegen import ASTCodeGenerator
+
+    for name in dir(df):
+        if name.startswith('DF') or name.startswith('Term') or name.startswith('Bind'):
+            setattr(builtins, name, getattr(df, name))
+    names = {
+        'copy': copy, 'verror': verror, 'FormatError': verror.FormatError, 'util': util,
+        'signaltype': signaltype, 'splitter': splitter, 'transition': transition,
+        'reorder': reorder, 'replace': replace,
+        'VerilogCodeParser': VerilogCodeParser, 'Identifier': Identifier,
+        'NodeVisitor': NodeVisitor, 'ModuleVisitor': ModuleVisitor,
+        'SignalVisitor': SignalVisitor, 'BindVisitor': BindVisitor,
+        'VerilogSubset': VerilogSubset, 'VerilogDataflowWalker': VerilogDataflowWalker,
+        'ASTCodeGenerator': ASTCodeGenerator,
+    }
+    for name, value in names.items():
+        setattr(builtins, name, value)
+    return True
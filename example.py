@@ -2,10 +2,159 @@ from __future__ import absolute_import
 from __future__ import print_function
 import sys
 import os
+import io
+import json
+import time
+import logging
 from optparse import OptionParser
+import graphwriter
+import profiler
+import vcd
+import simulate
+
+
+def fsm_record(signame, fsm, loops, summary=False):
+    record = {
+        'signal': str(signame),
+        'delaycnt': fsm.delaycnt,
+        'states': len(fsm.states()),
+        'transitions': fsm.size(),
+        'loops': len(loops),
+        'encoding': None if fsm.encoding is None else fsm.encoding.kind,
+    }
+    if summary:
+        return record
+    record['fsm'] = [{'src': 'any' if src is None else src,
+                      'cond': None if cond is None else cond.tocode(),
+                      'dst': dst}
+                     for src, cond, dst in fsm.transitions()]
+    record['looplist'] = [list(loop) for loop in sorted(loops)]
+    return record
+
+
+def write_text(buf, signame, fsm, loops, summary=False):
+    buf.write('# SIGNAL NAME: %s\n' % signame)
+    buf.write('# DELAY CNT: %d\n' % fsm.delaycnt)
+    if fsm.encoding is not None:
+        buf.write('# ENCODING: %s\n' % fsm.encoding.kind)
+    if summary:
+        buf.write('# STATES: %d, TRANSITIONS: %d, LOOPS: %d\n' %
+                  (len(fsm.states()), fsm.size(), len(loops)))
+        return
+    fsm.view(buf)
+    buf.write('Loop\n')
+    for loop in loops:
+        buf.write('%s\n' % str(loop))
+
+
+def extract_fsms(filelist, options, fsm_vars):
+    analyzer = VerilogDataflowAnalyzer(filelist, options.topmodule,
+                                       preprocess_include=options.include,
+                                       preprocess_define=options.define)
+    analyzer.generate()
+    terms = analyzer.getTerms()
+    binddict = analyzer.getBinddict()
+    optimizer = VerilogDataflowOptimizer(terms, binddict)
+    optimizer.resolveConstant()
+    canalyzer = VerilogControlflowAnalyzer(options.topmodule, terms, binddict,
+                                           optimizer.getResolvedTerms(),
+                                           optimizer.getResolvedBinddict(),
+                                           optimizer.getConstlist(), fsm_vars,
+                                           coi=options.coi, index=analyzer.getIndex())
+    return canalyzer.getFiniteStateMachines()
+
+
+def compare_fsms(old_fsms, new_fsms, encoding=True):
+    # returns [(signal name, 'same'|'changed'|'added'|'removed', old size, new size)]
+    old = dict([(str(signame), fsm) for signame, fsm in old_fsms.items()])
+    new = dict([(str(signame), fsm) for signame, fsm in new_fsms.items()])
+    rslt = []
+    for name in sorted(set(old.keys()) | set(new.keys())):
+        if not name in new:
+            rslt.append((name, 'removed', len(old[name].states()), 0))
+        elif not name in old:
+            rslt.append((name, 'added', 0, len(new[name].states())))
+        else:
+            same = old[name].is_equivalent(new[name], encoding)
+            rslt.append((name, 'same' if same else 'changed',
+                         len(old[name].states()), len(new[name].states())))
+    return rslt
 
 
 def main():
+    INFO = "Control-flow analyzer for Verilog definitions"
+    USAGE = "Usage: python example.py -t TOPMODULE file ..."
+
+    optparser = OptionParser(usage=USAGE, description=INFO)
+    optparser.add_option("-t", "--top", dest="topmodule",
+                         default="TOP", help="Top module, Default=TOP")
+    optparser.add_option("-I", "--include", dest="include", action="append",
+                         default=[], help="Include path")
+    optparser.add_option("-D", dest="define", action="append",
+                         default=[], help="Macro Definition")
+    optparser.add_option("-s", "--search", dest="searchtarget", action="append",
+                         default=[], help="Search Target Signal")
+    optparser.add_option("--graphformat", dest="graphformat",
+                         default="png", help="Graph file format, Default=png")
+    optparser.add_option("--nograph", action="store_true", dest="nograph",
+                         default=False, help="Non graph generation")
+    optparser.add_option("--nolabel", action="store_true", dest="nolabel",
+                         default=False, help="State Machine Graph without Labels")
+    optparser.add_option("--compact", action="store_true", dest="compact",
+                         default=False, help="Bundle edges and move long labels to a legend")
+    optparser.add_option("--render-jobs", dest="render_jobs", type="int",
+                         default=0, help="Render graphs in N background 'dot' processes")
+    optparser.add_option("--render-timeout", dest="render_timeout", type="int",
+                         default=60, help="Timeout of a background render in seconds, Default=60")
+    optparser.add_option("--coi", action="store_true", dest="coi",
+                         default=False, help="Slice the dataflow to the cone of influence of FSM candidates")
+    optparser.add_option("--format", dest="format", type="choice",
+                         choices=('text', 'json', 'jsonl'),
+                         default="text", help="Output format: text, json or jsonl, Default=text")
+    optparser.add_option("--summary", action="store_true", dest="summary",
+                         default=False, help="Only report states, transitions, loops and timings")
+    optparser.add_option("-q", "--quiet", action="store_true", dest="quiet",
+                         default=False, help="Suppress per-condition progress messages")
+    optparser.add_option("-o", "--output", dest="output",
+                         default=None, help="Output file, Default=stdout")
+    optparser.add_option("--vcd", dest="vcd",
+                         default=None, help="Simulation dump to measure FSM coverage against")
+    optparser.add_option("--vcd-root", dest="vcd_root",
+                         default=None, help="VCD scope of the top module instance (e.g. tb.uut)")
+    optparser.add_option("--simulate", dest="simulate", type="int",
+                         default=0, help="Random-walk N runs per FSM and report visits and hitting times")
+    optparser.add_option("--sim-steps", dest="sim_steps", type="int",
+                         default=1000, help="Steps per random-walk run, Default=1000")
+    optparser.add_option("--sim-jobs", dest="sim_jobs", type="int",
+                         default=1, help="Processes for the random walks, Default=1")
+    optparser.add_option("--compare-with", dest="compare_with",
+                         default=None, help="Comma separated files of an older revision to compare FSMs against")
+    optparser.add_option("--compare-structure", action="store_true", dest="compare_structure",
+                         default=False, help="Ignore state encodings when comparing FSMs")
+    optparser.add_option("--profile", action="store_true", dest="profile",
+                         default=False, help="Print a per-phase timing table to stderr")
+    optparser.add_option("--trace", dest="trace",
+                         default=None, help="Write a Chrome trace JSON of the phases")
+    (options, args) = optparser.parse_args()
+
+    filelist = args
+    for f in filelist:
+        if not os.path.exists(f):
+            raise IOError("file not found: " + f)
+
+    if len(filelist) == 0:
+        optparser.print_help()
+        sys.exit()
+
+    logging.basicConfig(level=logging.WARNING if options.quiet else logging.INFO,
+                        format='%(message)s',
+                        stream=sys.stdout if options.format == 'text' else sys.stderr)
+
+    if options.profile or options.trace is not None:
+        profiler.default.enable(trace=options.trace is not None)
+
+    timings = {}
+    start = time.time()
 
     analyzer = VerilogDataflowAnalyzer(filelist, options.topmodule,
                                        preprocess_include=options.include,
@@ -15,7 +164,9 @@ def main():
     directives = analyzer.get_directives()
     terms = analyzer.getTerms()
     binddict = analyzer.getBinddict()
+    timings['dataflow'] = time.time() - start
 
+    start = time.time()
     optimizer = VerilogDataflowOptimizer(terms, binddict)
 
     optimizer.resolveConstant()
@@ -23,23 +174,141 @@ def main():
     resolved_binddict = optimizer.getResolvedBinddict()
     constlist = optimizer.getConstlist()
     fsm_vars = tuple(['fsm', 'state', 'count', 'cnt', 'step', 'mode'] + options.searchtarget)
+    timings['optimize'] = time.time() - start
 
+    start = time.time()
+    context = AnalysisContext()
     canalyzer = VerilogControlflowAnalyzer(options.topmodule, terms, binddict,
-                                           resolved_terms, resolved_binddict, constlist, fsm_vars)
+                                           resolved_terms, resolved_binddict, constlist, fsm_vars,
+                                           context=context, coi=options.coi,
+                                           index=analyzer.getIndex())
     fsms = canalyzer.getFiniteStateMachines()
+    timings['controlflow'] = time.time() - start
+
+    start = time.time()
+    fsm_loops, fsms = canalyzer.getLoops()
+    timings['loop'] = time.time() - start
+
+    coverage = {}
+    if options.vcd is not None:
+        start = time.time()
+        coverage = vcd.coverage(options.vcd, fsms, root=options.vcd_root,
+                                topmodule=options.topmodule)
+        timings['coverage'] = time.time() - start
+
+    comparison = None
+    if options.compare_with is not None:
+        start = time.time()
+        old_filelist = options.compare_with.split(',')
+        for f in old_filelist:
+            if not os.path.exists(f):
+                raise IOError("file not found: " + f)
+        old_fsms = extract_fsms(old_filelist, options, fsm_vars)
+        comparison = compare_fsms(old_fsms, fsms, not options.compare_structure)
+        timings['compare'] = time.time() - start
+
+    queue = None
+    if not options.nograph and options.render_jobs > 0:
+        queue = graphwriter.RenderQueue(max_workers=options.render_jobs,
+                                        timeout=options.render_timeout)
 
+    buf = io.StringIO()
+    records = []
+    graph_time = 0.0
     for signame, fsm in fsms.items():
-        print('# SIGNAL NAME: %s' % signame)
-        print('# DELAY CNT: %d' % fsm.delaycnt)
-        fsm.view()
+        start = time.time()
         if not options.nograph:
-            fsm.tograph(filename=util.toFlatname(signame) + '.' +
-                        options.graphformat, nolabel=options.nolabel)
-        loops = fsm.get_loop()
-        print('Loop')
-        for loop in loops:
-            print(loop)
+            filename = util.toFlatname(signame) + '.' + options.graphformat
+            if options.graphformat in graphwriter.writers:
+                fsm.export(filename, nolabel=options.nolabel, compact=options.compact)
+            elif queue is not None:
+                graphwriter.render(fsm, filename, queue,
+                                   nolabel=options.nolabel, compact=options.compact)
+            else:
+                fsm.tograph(filename=filename, nolabel=options.nolabel, compact=options.compact)
+        graph_time += time.time() - start
+
+        loops = fsm_loops.get(signame, set([]))
+
+        simulation = None
+        if options.simulate > 0:
+            start = time.time()
+            simulator = simulate.RandomSimulator(fsm, signame, canalyzer.getWidth,
+                                                 initial=canalyzer.getResetValues(signame))
+            simulation = simulator.run_parallel(options.simulate, options.sim_steps,
+                                                processes=options.sim_jobs)
+            timings['simulate'] = timings.get('simulate', 0.0) + time.time() - start
+
+        if options.format == 'text':
+            write_text(buf, signame, fsm, loops, options.summary)
+            if signame in coverage:
+                coverage[signame].write(buf)
+            if simulation is not None:
+                simulation.write(buf)
+            continue
+        record = fsm_record(signame, fsm, loops, options.summary)
+        if signame in coverage:
+            record['coverage'] = coverage[signame].todict()
+        if simulation is not None:
+            record['simulation'] = simulation.todict()
+        if options.format == 'jsonl':
+            buf.write(json.dumps(record) + '\n')
+        else:
+            records.append(record)
+    timings['graph'] = graph_time
+
+    if queue is not None:
+        start = time.time()
+        for filename, result in queue.wait().items():
+            if result != 'ok':
+                logging.getLogger(__name__).warning('%s: %s', filename, result)
+        queue.shutdown()
+        timings['render'] = time.time() - start
+
+    summary = {
+        'fsms': len(fsms),
+        'states': sum([len(fsm.states()) for fsm in fsms.values()]),
+        'transitions': sum([fsm.size() for fsm in fsms.values()]),
+        'timings': timings,
+    }
+    if profiler.enabled():
+        summary['profile'] = profiler.default.todict()
+
+    if comparison is not None:
+        summary['changed'] = len([c for c in comparison if c[1] != 'same'])
+        compare_records = [{'signal': name, 'status': status, 'old_states': o, 'new_states': n}
+                           for name, status, o, n in comparison]
+        if options.format == 'text':
+            for name, status, o, n in comparison:
+                buf.write('# COMPARE %s: %s (%d -> %d states)\n' % (name, status, o, n))
+        elif options.format == 'jsonl':
+            for record in compare_records:
+                buf.write(json.dumps({'compare': record}) + '\n')
+        else:
+            summary['compare'] = compare_records
+
+    if options.format == 'json':
+        json.dump({'fsms': records, 'summary': summary}, buf)
+        buf.write('\n')
+    elif options.format == 'jsonl':
+        buf.write(json.dumps({'summary': summary}) + '\n')
+    elif options.summary:
+        buf.write('# FSMS: %d, STATES: %d, TRANSITIONS: %d\n' %
+                  (summary['fsms'], summary['states'], summary['transitions']))
+        for phase, t in timings.items():
+            buf.write('# TIME %s: %.3f s\n' % (phase, t))
+
+    if options.output is None:
+        sys.stdout.write(buf.getvalue())
+    else:
+        with open(options.output, 'w') as out:
+            out.write(buf.getvalue())
+
+    if options.profile:
+        profiler.default.report(sys.stderr)
+    if options.trace is not None:
+        profiler.default.dump_trace(options.trace)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
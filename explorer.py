@@ -0,0 +1,191 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import time
+import random
+import itertools
+import multiprocessing
+
+import dfcompiler
+from bdd import ConditionEngine
+
+
+class ReachabilityResult(object):
+    def __init__(self, termname, reachable, edges, complete, fsm=None, overapprox=False):
+        self.termname = termname
+        self.reachable = reachable  # sorted list of reachable state values
+        self.edges = edges  # set of (src, dst) observed while exploring
+        self.complete = complete  # False when a budget or sampling cut the search
+        self.fsm = fsm  # the FSM restricted to reachable states
+        self.overapprox = overapprox  # True when other registers were taken as free inputs
+
+
+class VisitedSet(object):
+    # bitset for narrow state registers, plain set otherwise
+    max_bitset_width = 24
+
+    def __init__(self, width):
+        if width <= self.max_bitset_width:
+            self.bits = bytearray((1 << width) // 8 + 1)
+            self.values = None
+        else:
+            self.bits = None
+            self.values = set([])
+
+    def add(self, value):
+        if self.bits is None:
+            if value in self.values:
+                return False
+            self.values.add(value)
+            return True
+        if self.bits[value >> 3] & (1 << (value & 7)):
+            return False
+        self.bits[value >> 3] |= 1 << (value & 7)
+        return True
+
+
+class InputSpace(object):
+    # assignments of the free signals of a next-state function
+    def __init__(self, func, termname, getwidth, max_input_bits=16, samples=4096, seed=0):
+        self.func = func
+        self.state_pos = func.index.get(termname)
+        self.free = [(i, getwidth(name)) for i, name in enumerate(func.varnames)
+                     if name != termname]
+        self.total_bits = sum([w for i, w in self.free])
+        self.exhaustive = self.total_bits <= max_input_bits
+        self.samples = samples
+        self.rnd = random.Random(seed)
+
+    def assignments(self):
+        if self.exhaustive:
+            ranges = [range(1 << w) for i, w in self.free]
+            for values in itertools.product(*ranges):
+                yield values
+            return
+        for n in range(self.samples):
+            yield tuple([self.rnd.getrandbits(w) for i, w in self.free])
+
+    def successors(self, state):
+        vector = [0] * len(self.func.varnames)
+        if self.state_pos is not None:
+            vector[self.state_pos] = state
+        rslt = set([])
+        for values in self.assignments():
+            for (i, w), v in zip(self.free, values):
+                vector[i] = v
+            rslt.add(self.func.func(vector))
+        return rslt
+
+
+_worker_space = None
+
+
+def _init_worker(source, varnames, width, termname, widths, max_input_bits, samples, seed):
+    global _worker_space
+    func = dfcompiler.load(source, varnames, width)
+    _worker_space = InputSpace(func, termname, lambda name: widths[name],
+                               max_input_bits, samples, seed + os.getpid())
+
+
+def _worker_successors(states):
+    return [(src, dst) for src in states for dst in _worker_space.successors(src)]
+
+
+def symbolic_successors(fsm, engine, state):
+    rslt = set([])
+    for cond, dst in list(fsm.fsm.get(state, {}).items()) + list(fsm.any.items()):
+        if cond is None or engine.isSatisfiable(cond):
+            rslt.add(dst)
+    return rslt
+
+
+def explore(analyzer, termname, fsm=None, mode='enumerate', initial=None,
+            max_states=1 << 20, time_limit=None, max_input_bits=16, samples=4096,
+            seed=0, processes=None):
+    # breadth-first search over concrete state values from the reset values;
+    # mode 'enumerate' evaluates the compiled next-state function over the
+    # free signals, mode 'symbolic' follows satisfiable FSM transitions.
+    # enumerate mode takes every other register read by the function as a
+    # free input, so the result may include states the design never reaches
+    # (result.overapprox); time_limit is checked before each expanded state
+    width = analyzer.getWidth(termname)
+    if fsm is None:
+        fsm = analyzer.getFiniteStateMachines().get(termname)
+    if initial is None:
+        initial = analyzer.getResetValues(termname)
+    if len(initial) == 0:
+        initial = (0, )
+
+    start = time.time()
+    visited = VisitedSet(width)
+    reachable = []
+    frontier = []
+    for value in initial:
+        if visited.add(value):
+            reachable.append(value)
+            frontier.append(value)
+    edges = set([])
+    complete = True
+
+    pool = None
+    batch = 1  # states expanded between two budget checks
+    overapprox = False
+    if mode == 'symbolic':
+        if fsm is None:
+            raise ValueError('symbolic exploration needs an FSM: %s' % str(termname))
+        engine = analyzer.condengine if analyzer.condengine is not None else ConditionEngine()
+        expand = lambda states: [(src, dst) for src in states
+                                 for dst in symbolic_successors(fsm, engine, src)]
+    else:
+        func = analyzer.getCompiledTree(termname)
+        space = InputSpace(func, termname, analyzer.getWidth, max_input_bits, samples, seed)
+        complete = space.exhaustive
+        overapprox = any([signaltype.isReg(analyzer.getTermtype(name))
+                          for name in func.varnames if name != termname])
+        if processes is not None and processes > 1:
+            batch = processes * 64
+            widths = dict([(name, analyzer.getWidth(name)) for name in func.varnames])
+            pool = multiprocessing.Pool(processes, _init_worker,
+                                        (func.source, func.varnames, func.width, termname,
+                                         widths, max_input_bits, samples, seed))
+
+            def expand(states):
+                shards = [states[i::processes] for i in range(processes)]
+                rslt = []
+                for r in pool.map(_worker_successors, shards):
+                    rslt.extend(r)
+                return rslt
+        else:
+            expand = lambda states: [(src, dst) for src in states
+                                     for dst in space.successors(src)]
+
+    stopped = False
+    try:
+        while frontier and not stopped:
+            next_frontier = []
+            for i in range(0, len(frontier), batch):
+                if time_limit is not None and time.time() - start > time_limit:
+                    stopped = True
+                    break
+                for src, dst in expand(frontier[i:i + batch]):
+                    edges.add((src, dst))
+                    if visited.add(dst):
+                        reachable.append(dst)
+                        next_frontier.append(dst)
+                if len(reachable) > max_states:
+                    stopped = True
+                    break
+            frontier = next_frontier
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    complete = complete and not stopped
+    reachable = sorted(reachable)
+    annotated = None
+    if fsm is not None:
+        annotated = fsm.restrict(reachable)
+        annotated.set_reachable(reachable, complete)
+    return ReachabilityResult(termname, reachable, edges, complete, annotated, overapprox)
@@ -0,0 +1,199 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape as xml_escape
+from xml.sax.saxutils import quoteattr
+
+
+class GraphModel(object):
+    def __init__(self, name):
+        self.name = name
+        self.nodes = {}  # key:node id, value:label
+        self.edges = []  # (src id, dst id, label)
+        self.legend = {}  # key:label id, value:full condition label
+        self.legend_index = {}
+
+    def add_node(self, node, label=None):
+        if not node in self.nodes:
+            self.nodes[node] = str(node) if label is None else label
+
+    def add_edge(self, src, dst, label=''):
+        self.edges.append((src, dst, label))
+
+    def shorten(self, label, maxlabel):
+        if len(label) <= maxlabel:
+            return label
+        if label in self.legend_index:
+            return self.legend_index[label]
+        labelid = 'c%d' % len(self.legend)
+        self.legend[labelid] = label
+        self.legend_index[label] = labelid
+        return labelid
+
+
+any_node = '*'
+
+
+def build(fsm, nolabel=False, compact=False, maxlabel=24):
+    if compact:
+        return build_compact(fsm, nolabel, maxlabel)
+    model = GraphModel(fsm.name)
+    for src, dstdict in fsm.fsm.items():
+        model.add_node(str(src))
+        for cond, dst in dstdict.items():
+            model.add_node(str(dst))
+            model.add_edge(str(src), str(dst), '' if nolabel else str(cond))
+    for src in fsm.fsm.keys():
+        for cond, dst in fsm.any.items():
+            model.add_node(str(dst))
+            model.add_edge(str(src), str(dst), '' if nolabel else str(cond))
+    return model
+
+
+def build_compact(fsm, nolabel=False, maxlabel=24):
+    # 'any' transitions leave a single wildcard node, parallel edges are
+    # bundled into one, and long conditions are moved to the legend
+    model = GraphModel(fsm.name)
+    bundles = {}
+    order = []
+    for src, dstdict in fsm.fsm.items():
+        model.add_node(str(src))
+        for cond, dst in dstdict.items():
+            key = (str(src), str(dst))
+            if not key in bundles:
+                bundles[key] = []
+                order.append(key)
+            bundles[key].append(cond)
+    if len(fsm.any) > 0:
+        model.add_node(any_node, 'any')
+    for cond, dst in fsm.any.items():
+        key = (any_node, str(dst))
+        if not key in bundles:
+            bundles[key] = []
+            order.append(key)
+        bundles[key].append(cond)
+    for src, dst in order:
+        model.add_node(dst)
+        if nolabel:
+            model.add_edge(src, dst, '')
+            continue
+        labels = [model.shorten(str(cond), maxlabel) for cond in bundles[(src, dst)]]
+        model.add_edge(src, dst, ' | '.join(labels))
+    return model
+
+
+def dot_escape(s):
+    return str(s).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def dot_quote(s):
+    return '"' + dot_escape(s) + '"'
+
+
+def write_dot(model, out):
+    out.write('digraph %s {\n' % dot_quote(model.name))
+    for node, label in model.nodes.items():
+        out.write('  %s [label=%s];\n' % (dot_quote(node), dot_quote(label)))
+    for src, dst, label in model.edges:
+        out.write('  %s -> %s [label=%s];\n' % (dot_quote(src), dot_quote(dst), dot_quote(label)))
+    if len(model.legend) > 0:
+        lines = [dot_escape('%s: %s' % (labelid, label))
+                 for labelid, label in model.legend.items()]
+        out.write('  "legend" [shape=box, label="%s\\l"];\n' % '\\l'.join(lines))
+    out.write('}\n')
+
+
+def write_json(model, out):
+    obj = {
+        'name': str(model.name),
+        'nodes': [{'id': node, 'label': label} for node, label in model.nodes.items()],
+        'edges': [{'src': src, 'dst': dst, 'label': label} for src, dst, label in model.edges],
+        'legend': model.legend,
+    }
+    json.dump(obj, out)
+    out.write('\n')
+
+
+def write_graphml(model, out):
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+    out.write('  <key id="label" for="all" attr.name="label" attr.type="string"/>\n')
+    out.write('  <key id="legend" for="graph" attr.name="legend" attr.type="string"/>\n')
+    out.write('  <graph id=%s edgedefault="directed">\n' % quoteattr(str(model.name)))
+    if len(model.legend) > 0:
+        legend = '\n'.join(['%s: %s' % (labelid, label) for labelid, label in model.legend.items()])
+        out.write('    <data key="legend">%s</data>\n' % xml_escape(legend))
+    for node, label in model.nodes.items():
+        out.write('    <node id=%s><data key="label">%s</data></node>\n' %
+                  (quoteattr(node), xml_escape(label)))
+    for i, (src, dst, label) in enumerate(model.edges):
+        out.write('    <edge id="e%d" source=%s target=%s><data key="label">%s</data></edge>\n' %
+                  (i, quoteattr(src), quoteattr(dst), xml_escape(label)))
+    out.write('  </graph>\n')
+    out.write('</graphml>\n')
+
+
+writers = {
+    'dot': write_dot,
+    'json': write_json,
+    'graphml': write_graphml,
+}
+
+
+def export(fsm, filename, format=None, nolabel=False, compact=False):
+    if format is None:
+        format = os.path.splitext(filename)[1][1:].lower()
+    if format == 'gv':
+        format = 'dot'
+    if not format in writers:
+        raise ValueError('unsupported graph format: %s' % format)
+    model = build(fsm, nolabel=nolabel, compact=compact)
+    with open(filename, 'w') as out:
+        writers[format](model, out)
+    return filename
+
+
+def render(fsm, filename, queue, nolabel=False, compact=False):
+    dotfile = os.path.splitext(filename)[0] + '.dot'
+    export(fsm, dotfile, 'dot', nolabel=nolabel, compact=compact)
+    return queue.submit(dotfile, filename)
+
+
+class RenderQueue(object):
+    def __init__(self, max_workers=2, timeout=60, prog='dot'):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.timeout = timeout
+        self.prog = prog
+        self.futures = []
+
+    def submit(self, dotfile, filename, format=None):
+        if format is None:
+            format = os.path.splitext(filename)[1][1:]
+        future = self.executor.submit(self._render, dotfile, filename, format)
+        self.futures.append((filename, future))
+        return future
+
+    def _render(self, dotfile, filename, format):
+        cmd = [self.prog, '-T' + format, dotfile, '-o', filename]
+        try:
+            subprocess.run(cmd, check=True, timeout=self.timeout,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.TimeoutExpired:
+            return 'timeout'
+        except (OSError, subprocess.CalledProcessError) as e:
+            return 'error: %s' % str(e)
+        return 'ok'
+
+    def wait(self):
+        results = {}
+        for filename, future in self.futures:
+            results[filename] = future.result()
+        self.futures = []
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
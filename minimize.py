@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+from collections import deque
+
+
+class CompactFSM(object):
+    # integer form of one or more FSMs: conditions interned by tocode() as
+    # symbols, a partial transition function per symbol (a missing entry is
+    # the implicit sink state)
+    def __init__(self, symbols=None):
+        self.symbols = {} if symbols is None else symbols  # key:tocode(), value:symbol id
+        self.conds = []  # key:symbol id, value:first condition seen
+        self.values = []  # key:state id, value:state value
+        self.keys = []  # key:state id, value:initial partition key
+        self.delta = []  # key:state id, value:dict[symbol id]=dst state id
+        self.anysyms = set([])
+
+    def intern(self, cond):
+        code = 'None' if cond is None else cond.tocode()
+        if not code in self.symbols:
+            self.symbols[code] = len(self.symbols)
+        sym = self.symbols[code]
+        while len(self.conds) <= sym:
+            self.conds.append(None)
+        if self.conds[sym] is None:
+            self.conds[sym] = cond
+        return sym
+
+    def add(self, fsm, encoding=False):
+        # returns key:state value, value:state id of the states of fsm
+        offset = len(self.values)
+        states = fsm.states()
+        index = dict([(s, offset + i) for i, s in enumerate(states)])
+        for s in states:
+            self.values.append(s)
+            self.keys.append(s if encoding else 0)
+            self.delta.append({})
+        anys = [(self.intern(cond), index[dst]) for cond, dst in fsm.any.items()]
+        self.anysyms.update([sym for sym, dst in anys])
+        for s in states:
+            trans = self.delta[index[s]]
+            for sym, dst in anys:
+                trans[sym] = dst
+            for cond, dst in fsm.fsm.get(s, {}).items():
+                trans[self.intern(cond)] = index[dst]
+        return index
+
+    def reachable(self, starts):
+        visited = set(starts)
+        queue = deque(starts)
+        while queue:
+            s = queue.popleft()
+            for dst in self.delta[s].values():
+                if not dst in visited:
+                    visited.add(dst)
+                    queue.append(dst)
+        return visited
+
+
+def hopcroft(delta, keys, states=None):
+    # partition refinement over a partial transition function; every initial
+    # block is queued with every symbol, which keeps the smaller-half rule
+    # valid without completing the automaton with a sink state
+    states = range(len(delta)) if states is None else sorted(states)
+    inverse = {}  # key:(symbol, dst), value:list of src
+    symbols = set([])
+    for s in states:
+        for sym, dst in delta[s].items():
+            inverse.setdefault((sym, dst), []).append(s)
+            symbols.add(sym)
+
+    blockid = {}
+    members = []
+    block_of = {}
+    for s in states:
+        if not keys[s] in blockid:
+            blockid[keys[s]] = len(members)
+            members.append(set([]))
+        b = blockid[keys[s]]
+        members[b].add(s)
+        block_of[s] = b
+
+    pending = set([(b, sym) for b in range(len(members)) for sym in symbols])
+    worklist = deque(sorted(pending))
+    while worklist:
+        splitter = worklist.popleft()
+        pending.discard(splitter)
+        b, sym = splitter
+        touched = {}
+        for dst in list(members[b]):
+            for src in inverse.get((sym, dst), ()):
+                touched.setdefault(block_of[src], set([])).add(src)
+        for c, srcs in touched.items():
+            if len(srcs) == len(members[c]):
+                continue
+            members[c] -= srcs
+            new = len(members)
+            members.append(srcs)
+            for s in srcs:
+                block_of[s] = new
+            small = new if len(srcs) <= len(members[c]) else c
+            for a in symbols:
+                if (c, a) in pending:
+                    added = (new, a)
+                else:
+                    added = (small, a)
+                if not added in pending:
+                    pending.add(added)
+                    worklist.append(added)
+    return block_of
+
+
+def minimize(fsm, encoding=False):
+    # returns a new FiniteStateMachine whose states are the smallest values
+    # of the blocks; 'any' transitions stay 'any'
+    compact = CompactFSM()
+    index = compact.add(fsm, encoding)
+    block_of = hopcroft(compact.delta, compact.keys)
+    rep = {}
+    for s, b in block_of.items():
+        v = compact.values[s]
+        if not b in rep or v < rep[b]:
+            rep[b] = v
+
+    rslt = fsm.__class__(fsm.name)
+    rslt.set_delaycnt(fsm.delaycnt)
+    rslt.set_domain(fsm.domain)
+    rslt.set_encoding(fsm.encoding)
+    rslt.set_reset(tuple(sorted(set([rep[block_of[index[v]]] for v in fsm.reset
+                                     if v in index]))) if fsm.reset is not None else None)
+    for cond, dst in fsm.any.items():
+        rslt.any[cond] = rep[block_of[index[dst]]]
+    for s, b in block_of.items():
+        src = rep[b]
+        if src != compact.values[s] or not fsm.fsm.get(src):
+            continue
+        rslt.fsm[src] = dict([(compact.conds[sym], rep[block_of[dst]])
+                              for sym, dst in compact.delta[s].items()
+                              if not sym in compact.anysyms])
+    return rslt
+
+
+def equivalent(fsm0, fsm1, encoding=True):
+    # joint minimization of the disjoint union of the parts reachable from
+    # the reset states; without reset values every state is a start state
+    compact = CompactFSM()
+    index0 = compact.add(fsm0, encoding)
+    index1 = compact.add(fsm1, encoding)
+
+    def starts(fsm, index):
+        if fsm.reset:
+            return [index[v] for v in fsm.reset if v in index]
+        return list(index.values())
+
+    starts0 = starts(fsm0, index0)
+    starts1 = starts(fsm1, index1)
+    states = compact.reachable(starts0 + starts1)
+    block_of = hopcroft(compact.delta, compact.keys, states)
+    return (set([block_of[s] for s in starts0]) ==
+            set([block_of[s] for s in starts1]))
@@ -6,6 +6,7 @@ import pathlib
 from ply.yacc import yacc
 import tempfile
 import subprocess
+import profiler
 
 
 class Node(object):
@@ -793,8 +794,10 @@ def verilogparser(object):
         return text
 
     def parse(self, preprocess_output='preprocess.output', debug=0):
-        text = self.preprocess()
-        ast = self.parser.parse(text, debug=debug)
+        with profiler.span('preprocess'):
+            text = self.preprocess()
+        with profiler.span('ply'):
+            ast = self.parser.parse(text, debug=debug)
         self.main_direct = self.parser.get_main_direct()
         return ast
 
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.reset()
+
+    def reset(self):
+        self.spans = {}  # key:name, value:[count, total seconds]
+        self.counters = {}
+        self.events = []
+        self.origin = time.time()
+
+    def enable(self, trace=False):
+        self.enabled = True
+        self.trace = trace
+
+    def disable(self):
+        self.enabled = False
+        self.trace = False
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            if not name in self.spans:
+                self.spans[name] = [0, 0.0]
+            self.spans[name][0] += 1
+            self.spans[name][1] += end - start
+            if self.trace:
+                self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(),
+                                    'tid': threading.current_thread().ident,
+                                    'ts': (start - self.origin) * 1e6,
+                                    'dur': (end - start) * 1e6})
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, buf=sys.stdout):
+        if len(self.spans) > 0:
+            width = max([len(name) for name in self.spans.keys()] + [5])
+            buf.write('%-*s %10s %12s %12s\n' % (width, 'phase', 'calls', 'total [s]', 'mean [ms]'))
+            for name, (calls, total) in sorted(self.spans.items(), key=lambda x: -x[1][1]):
+                buf.write('%-*s %10d %12.4f %12.4f\n' %
+                          (width, name, calls, total, total * 1000.0 / calls))
+        if len(self.counters) > 0:
+            width = max([len(name) for name in self.counters.keys()] + [7])
+            buf.write('%-*s %12s\n' % (width, 'counter', 'value'))
+            for name, value in sorted(self.counters.items()):
+                buf.write('%-*s %12d\n' % (width, name, value))
+
+    def todict(self):
+        return {
+            'spans': dict([(name, {'calls': calls, 'total': total})
+                           for name, (calls, total) in self.spans.items()]),
+            'counters': dict(self.counters),
+        }
+
+    def dump_trace(self, filename):
+        with open(filename, 'w') as out:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, out)
+
+
+default = Profiler()
+
+
+def span(name):
+    return default.span(name)
+
+
+def count(name, value=1):
+    default.count(name, value)
+
+
+def enabled():
+    return default.enabled
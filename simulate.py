@@ -0,0 +1,166 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import multiprocessing
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import dfcompiler
+from dfcompiler import DFCompiler
+
+
+class SimulationResult(object):
+    def __init__(self, states, runs, steps, visits, hit_sum, hit_cnt):
+        self.states = states  # state values, indexed by state id
+        self.runs = runs
+        self.steps = steps
+        self.visits = visits  # key:state id, value:run-steps spent in the state
+        self.hit_sum = hit_sum  # sum of first hitting times over the runs that hit
+        self.hit_cnt = hit_cnt  # number of runs that hit the state
+
+    def merge(self, other):
+        return SimulationResult(self.states, self.runs + other.runs, self.steps,
+                                self.visits + other.visits,
+                                self.hit_sum + other.hit_sum,
+                                self.hit_cnt + other.hit_cnt)
+
+    def mean_hitting_times(self):
+        # None for the states no run reached
+        return [float(s) / c if c > 0 else None
+                for s, c in zip(self.hit_sum, self.hit_cnt)]
+
+    def todict(self):
+        return {
+            'runs': self.runs,
+            'steps': self.steps,
+            'visits': dict([(str(s), int(v)) for s, v in zip(self.states, self.visits)]),
+            'reached': dict([(str(s), float(c) / self.runs)
+                             for s, c in zip(self.states, self.hit_cnt)]),
+            'mean_hitting_time': dict([(str(s), t) for s, t in
+                                       zip(self.states, self.mean_hitting_times())]),
+        }
+
+    def write(self, buf=sys.stdout):
+        total = float(self.runs * (self.steps + 1))
+        buf.write('# RUNS: %d, STEPS: %d\n' % (self.runs, self.steps))
+        for s, v, c, t in zip(self.states, self.visits, self.hit_cnt, self.mean_hitting_times()):
+            buf.write('%d: visits %.4f, reached %.4f, mean hitting time %s\n' %
+                      (s, v / total, float(c) / self.runs,
+                       '-' if t is None else '%.2f' % t))
+
+
+class RandomSimulator(object):
+    # random walk over a FiniteStateMachine; every condition is compiled to a
+    # vectorized expression and evaluated for all runs of a step at once
+    def __init__(self, fsm, termname, getwidth, initial=None, fixed=None):
+        if np is None:
+            raise ImportError('simulation needs numpy')
+        self.termname = termname
+        self.fixed = {} if fixed is None else fixed  # key:signal name, value:constant input
+        initial = list(initial) if initial else [0]
+        self.initial = initial
+        self.states = sorted(set(fsm.states()) | set(initial))
+
+        compiler = DFCompiler(getwidth, vectorized=True)
+        varnames = [termname]
+        conds = {}  # key:tocode(), value:index in self.conds
+        self.conds = []
+        self.rows = []  # (src or None for any, cond index or None, dst)
+        for src, cond, dst in fsm.transitions():
+            if cond is None:
+                self.rows.append((src, None, dst))
+                continue
+            code = cond.tocode()
+            if not code in conds:
+                func = compiler.compile(cond, varnames=varnames)
+                varnames = list(func.varnames)
+                conds[code] = len(self.conds)
+                self.conds.append(func)
+            self.rows.append((src, conds[code], dst))
+        # 'any' transitions are taken before state specific ones
+        self.rows.sort(key=lambda r: r[0] is not None)
+        self.varnames = tuple(varnames)
+        self.inputs = [(i, name, getwidth(name)) for i, name in enumerate(self.varnames)
+                       if name != termname and not name in self.fixed]
+        self.sources = [(func.source, func.varnames, func.width) for func in self.conds]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['conds']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.conds = [dfcompiler.load(source, varnames, width, True)
+                      for source, varnames, width in self.sources]
+
+    def run(self, runs=1000, steps=1000, seed=0):
+        rnd = np.random.default_rng(seed)
+        statearray = np.array(self.states, dtype=np.int64)
+        nstates = len(self.states)
+        values = [None] * len(self.varnames)
+        for i, name in enumerate(self.varnames):
+            if name in self.fixed:
+                values[i] = np.full(runs, self.fixed[name], dtype=np.int64)
+
+        state = rnd.choice(np.array(self.initial, dtype=np.int64), runs)
+        ids = np.searchsorted(statearray, state)
+        visits = np.bincount(ids, minlength=nstates)
+        first = np.full((nstates, runs), -1, dtype=np.int32)
+        first[ids, np.arange(runs)] = 0
+        state_pos = self.varnames.index(self.termname)
+        for t in range(1, steps + 1):
+            values[state_pos] = state
+            for i, name, width in self.inputs:
+                values[i] = rnd.integers(0, 1 << width, runs, dtype=np.int64)
+            condvalues = [func.func(values) != 0 for func in self.conds]
+            choices = []
+            dsts = []
+            for src, cond, dst in self.rows:
+                if cond is None:
+                    hit = np.ones(runs, dtype=bool) if src is None else state == src
+                elif src is None:
+                    hit = np.broadcast_to(condvalues[cond], (runs, ))
+                else:
+                    hit = (state == src) & condvalues[cond]
+                choices.append(hit)
+                dsts.append(dst)
+            if len(choices) > 0:
+                state = np.select(choices, dsts, default=state)
+            ids = np.searchsorted(statearray, state)
+            visits += np.bincount(ids, minlength=nstates)
+            reached = first[ids, np.arange(runs)]
+            newly = reached < 0
+            first[ids[newly], np.arange(runs)[newly]] = t
+
+        hit = first >= 0
+        return SimulationResult(self.states, runs, steps, visits,
+                                np.where(hit, first, 0).sum(axis=1), hit.sum(axis=1))
+
+    def run_parallel(self, runs=1000, steps=1000, seed=0, processes=None):
+        # splits the runs over processes, each with its own seed
+        processes = multiprocessing.cpu_count() if processes is None else processes
+        if processes <= 1:
+            return self.run(runs, steps, seed)
+        chunks = [runs // processes + (1 if i < runs % processes else 0)
+                  for i in range(processes)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_run_worker, [(self, n, steps, seed + i)
+                                             for i, n in enumerate(chunks) if n > 0])
+        finally:
+            pool.close()
+            pool.join()
+        rslt = results[0]
+        for r in results[1:]:
+            rslt = rslt.merge(r)
+        return rslt
+
+
+def _run_worker(args):
+    simulator, runs, steps, seed = args
+    return simulator.run(runs, steps, seed)
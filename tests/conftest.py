@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import pytest
+
+# appended, so this tree's ast.py does not shadow the standard module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dfglobals
+
+dfglobals.install()
+
+
+@pytest.fixture(scope='session')
+def analyze(tmp_path_factory):
+    # dataflow of a Verilog text through pyverilog's own analyzer and
+    # optimizer, without the iverilog preprocessor; returns the arguments
+    # of VerilogControlflowAnalyzer after the top module name
+    from pyverilog.vparser.parser import VerilogParser
+    from pyverilog.dataflow.dataflow_analyzer import VerilogDataflowAnalyzer
+    from pyverilog.dataflow.optimizer import VerilogDataflowOptimizer
+
+    parserdir = str(tmp_path_factory.mktemp('parser'))
+    results = {}
+
+    def analyze(text, topmodule='TOP'):
+        key = (text, topmodule)
+        if key in results:
+            return results[key]
+        # the parser tables are written to the working directory
+        cwd = os.getcwd()
+        os.chdir(parserdir)
+        try:
+            ast = VerilogParser(debug=False).parse(text)
+            analyzer = VerilogDataflowAnalyzer('dummy.v', topmodule)
+        finally:
+            os.chdir(cwd)
+        analyzer.parse = lambda *args, **kwargs: ast
+        analyzer.generate()
+        terms = analyzer.getTerms()
+        binddict = analyzer.getBinddict()
+        optimizer = VerilogDataflowOptimizer(terms, binddict)
+        optimizer.resolveConstant()
+        results[key] = (terms, binddict, optimizer.getResolvedTerms(),
+                        optimizer.getResolvedBinddict(), optimizer.getConstlist())
+        return results[key]
+    return analyze
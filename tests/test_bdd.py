@@ -0,0 +1,160 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+from bdd import BDD, ConditionEngine
+from controlflow import FiniteStateMachine, VerilogControlflowAnalyzer
+
+
+def term(name):
+    return df.DFTerminal(name)
+
+
+def eq(name, value):
+    return df.DFOperator((term(name), df.DFEvalValue(value)), 'Eq')
+
+
+def op(operator, *nodes):
+    return df.DFOperator(nodes, operator)
+
+
+def test_mk_unique():
+    bdd = BDD()
+    x = bdd.newVar()
+    y = bdd.newVar()
+    assert bdd.mk(0, y, y) == y
+    assert bdd.mk(0, BDD.FALSE, BDD.TRUE) == x
+    assert bdd.mk(1, x, y) == bdd.mk(1, x, y)
+
+
+def test_ite_apply():
+    bdd = BDD()
+    x = bdd.newVar()
+    y = bdd.newVar()
+    assert bdd.ite(BDD.TRUE, x, y) == x
+    assert bdd.ite(BDD.FALSE, x, y) == y
+    assert bdd.ite(x, BDD.TRUE, BDD.FALSE) == x
+    assert bdd.apply_and(x, bdd.apply_not(x)) == BDD.FALSE
+    assert bdd.apply_or(x, bdd.apply_not(x)) == BDD.TRUE
+    assert bdd.apply_and(x, y) == bdd.apply_and(y, x)
+    assert bdd.apply_or(x, y) == bdd.apply_not(bdd.apply_and(bdd.apply_not(x),
+                                                             bdd.apply_not(y)))
+    assert bdd.apply_xor(x, y) == bdd.apply_and(bdd.apply_or(x, y),
+                                                bdd.apply_not(bdd.apply_and(x, y)))
+    assert bdd.apply_xor(x, x) == BDD.FALSE
+
+
+def test_condition_engine():
+    engine = ConditionEngine()
+    a = term('a')
+    b = term('b')
+    assert not engine.isSatisfiable(op('Land', op('Ulnot', a), a))
+    assert engine.isTautology(op('Lor', op('Ulnot', a), a))
+    assert engine.isEquivalent(op('Land', a, b), op('Land', b, a))
+    assert engine.isEquivalent(op('NotEq', term('s'), df.DFEvalValue(1)),
+                               op('Ulnot', eq('s', 1)))
+    assert engine.tobdd(None) == BDD.TRUE
+    assert engine.tobdd(df.DFEvalValue(0)) == BDD.FALSE
+
+
+def test_eq_exclusive():
+    engine = ConditionEngine()
+    assert not engine.isSatisfiable(op('Land', eq('s', 1), eq('s', 2)))
+    assert engine.isSatisfiable(op('Land', eq('s', 1), eq('t', 2)))
+    # s == 1 implies s != 2 in the domain
+    assert engine.isEquivalent(op('Land', eq('s', 1), op('Ulnot', eq('s', 2))), eq('s', 1))
+
+
+def test_canonical():
+    engine = ConditionEngine()
+    a = term('a')
+    b = term('b')
+    first = op('Land', a, b)
+    assert engine.simplify(first) is first
+    assert engine.simplify(op('Land', b, a)) is first
+    assert engine.simplify(op('Lor', a, op('Ulnot', a))) is None
+    false = engine.simplify(op('Land', a, op('Ulnot', a)))
+    assert isinstance(false, df.DFEvalValue) and false.value == 0
+
+
+def test_todf_round_trip():
+    engine = ConditionEngine()
+    a = term('a')
+    b = term('b')
+    c = term('c')
+    conds = [a, op('Ulnot', a), op('Land', a, b), op('Lor', a, op('Land', b, c)),
+             op('Lor', op('Land', a, op('Ulnot', b)), op('Land', op('Ulnot', a), b)),
+             op('Land', eq('s', 1), op('Lor', b, c))]
+    for cond in conds:
+        node = engine.tobdd(cond)
+        assert engine.tobdd(engine.todf(node)) == node
+        # also in an engine that has not seen the condition
+        assert ConditionEngine().isEquivalent(engine.todf(node), cond)
+
+
+def test_prune():
+    a = term('a')
+    fsm = FiniteStateMachine('s')
+    fsm.add((0, 0), 1, a)
+    fsm.add((0, 0), 1, op('Land', a, term('b')))
+    fsm.add((0, 0), 2, op('Land', op('Ulnot', a), a))
+    fsm.add((1, 1), 0, None)
+    fsm.add((3, 3), 0, op('Land', eq('x', 1), eq('x', 2)))
+    assert fsm.states() == [0, 1, 2, 3]
+    fsm.prune(ConditionEngine())
+    # the edges into 1 merge, the unsatisfiable ones and the source left
+    # without edges are removed
+    assert fsm.fsm == {0: {a: 1}, 1: {None: 0}}
+    assert fsm.states() == [0, 1]
+    assert fsm.overlaps == []
+
+
+def test_prune_overlap():
+    a = term('a')
+    b = term('b')
+    unsat = op('Land', op('Ulnot', a), a)
+    fsm = FiniteStateMachine('s')
+    fsm.add((0, 0), 1, a)
+    fsm.add((0, 0), 2, b)
+    fsm.add((0, 0), 3, unsat)
+    fsm.prune(ConditionEngine())
+    # a and b can hold together: both edges stay and are reported
+    assert fsm.fsm == {0: {a: 1, b: 2}}
+    assert fsm.overlaps == [(0, (1, 2))]
+
+
+counter = """
+module TOP(input CLK, input RST, input [1:0] in);
+  reg [1:0] count;
+  always @(posedge CLK) begin
+    if (RST) count <= 0;
+    else case (count)
+      0: if (in[0]) count <= 1;
+      1: if (!in[0]) begin
+           if (in[0]) count <= 3;
+           else count <= 2;
+         end
+      2: count <= 0;
+    endcase
+  end
+endmodule
+"""
+
+
+def test_prune_counter(analyze):
+    args = analyze(counter)
+
+    def extract(prune):
+        analyzer = VerilogControlflowAnalyzer('TOP', *args, prune=prune)
+        fsm = list(analyzer.getFiniteStateMachines().values())[0]
+        return fsm, sorted([(src, None if cond is None else cond.tocode(), dst)
+                            for src, cond, dst in fsm.transitions()])
+
+    fsm, edges = extract(False)
+    assert (1, "((!TOP_in['d0])&&TOP_in['d0])", 3) in edges
+    assert fsm.states() == [0, 1, 2, 3]
+    fsm, edges = extract(True)
+    assert edges == [(0, "TOP_in['d0]", 1), (1, "(!TOP_in['d0])", 2), (2, None, 0)]
+    assert fsm.states() == [0, 1, 2]
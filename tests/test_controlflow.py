@@ -0,0 +1,228 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import random
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+import controlflow
+from controlflow import AnalysisContext, TreeCache, FiniteStateMachine, TransitionTableBuilder
+from controlflow import VerilogControlflowAnalyzer, VerilogActiveConditionAnalyzer
+from dataflow import ConstantList
+
+hierarchical = """
+module TOP(input CLK, input RST, input go, input ready, output [1:0] out);
+  SUB sub0 (.CLK(CLK), .RST(RST), .go(go), .ready(ready), .out(out));
+endmodule
+
+module SUB(input CLK, input RST, input go, input ready, output [1:0] out);
+  reg [1:0] state;
+  wire start = go & ready;
+  assign out = state;
+  always @(posedge CLK) begin
+    if (RST) state <= 0;
+    else case (state)
+      0: if (start) state <= 1;
+      1: state <= 2;
+      2: state <= 0;
+    endcase
+  end
+endmodule
+"""
+
+
+def dump(fsm):
+    return sorted([(src, None if cond is None else cond.tostr(), dst)
+                   for src, cond, dst in fsm.transitions()])
+
+
+def extract(args, **options):
+    analyzer = VerilogControlflowAnalyzer('TOP', *args, **options)
+    return dict([(str(signame), (dump(fsm), analyzer.getResetValues(signame)))
+                 for signame, fsm in analyzer.getFiniteStateMachines().items()])
+
+
+def test_coi_hierarchical(analyze):
+    # the submodule's RST input is bound to TOP.RST, which the slice keeps
+    args = analyze(hierarchical)
+    full = extract(args)
+    assert list(full.keys()) == ['TOP.sub0.state']
+    assert [dst for src, cond, dst in full['TOP.sub0.state'][0]] == [1, 2, 0]
+    assert extract(args, coi=True) == full
+
+
+def build_both(rows):
+    # the table built by TransitionTableBuilder and by one add() per row
+    builder = TransitionTableBuilder()
+    expected = FiniteStateMachine('s')
+    for srcs, dst, cond in rows:
+        builder.add(srcs, dst, cond)
+        expected.add(srcs, dst, cond)
+    fsm = FiniteStateMachine('s')
+    builder.build(fsm)
+    return fsm, expected
+
+
+def random_rows(rnd, base=0, count=200):
+    conds = [None] + [df.DFTerminal(util.toTermname('TOP.c%d' % i)) for i in range(4)]
+    rows = []
+    for i in range(count):
+        lo = base + rnd.randrange(64)
+        hi = lo + rnd.randrange(-2, 8)  # empty ranges too
+        rows.append(((lo, hi), base + rnd.randrange(64), rnd.choice(conds)))
+    return rows
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_transition_table(seed):
+    pytest.importorskip('numpy')
+    fsm, expected = build_both(random_rows(random.Random(seed)))
+    assert fsm.fsm == expected.fsm
+    assert fsm.version > 0
+
+
+def test_transition_table_wide():
+    # values from 2**62 on fall back to add()
+    base = TransitionTableBuilder.max_value - 32
+    builder = TransitionTableBuilder()
+    builder.add((0, 1), base, None)
+    assert builder.vectorizable()
+    builder.add((base, base + 40), 0, None)
+    assert not builder.vectorizable()
+    fsm, expected = build_both(random_rows(random.Random(0), base))
+    assert fsm.fsm == expected.fsm
+    assert max(fsm.fsm.keys()) >= TransitionTableBuilder.max_value
+
+
+def test_transition_table_without_numpy(monkeypatch):
+    monkeypatch.setattr(controlflow, 'np', None)
+    fsm, expected = build_both(random_rows(random.Random(1)))
+    assert fsm.fsm == expected.fsm
+
+
+def test_tree_cache_lru():
+    cache = TreeCache(maxsize=2)
+    cache.put('getTree', 'a', 1)
+    cache.put('getTree', 'b', 2)
+    assert cache.get('getTree', 'a') == (True, 1)
+    # 'a' was used last, so 'b' goes
+    cache.put('getTree', 'c', 3)
+    assert cache.get('getTree', 'b') == (False, None)
+    assert cache.get('getTree', 'a') == (True, 1)
+    assert cache.get('getTree', 'c') == (True, 3)
+    assert cache.stats()['getTree'] == {'hits': 3, 'misses': 1, 'size': 2}
+    assert cache.stats()['optimize'] == {'hits': 0, 'misses': 0, 'size': 0}
+
+
+class Optimizer(object):
+    def __init__(self, constlist):
+        self.constlist = constlist
+
+
+def test_tree_cache_validate():
+    constlist = ConstantList()
+    optimizer = Optimizer(constlist)
+    context = AnalysisContext()
+    context.validate(optimizer)
+    for stage in TreeCache.stages:
+        context.treecache.put(stage, 'a', stage)
+    context.fsms['key'] = {}
+    context.validate(optimizer)
+    assert context.treecache.get('optimize', 'a') == (True, 'optimize')
+    assert context.fsms == {'key': {}}
+    # a write in place clears every stage after getTree and the FSMs
+    constlist['K'] = df.DFEvalValue(1)
+    context.validate(optimizer)
+    assert context.treecache.get('getTree', 'a') == (True, 'getTree')
+    for stage in TreeCache.const_stages:
+        assert context.treecache.get(stage, 'a') == (False, None)
+    assert context.fsms == {}
+    # so does another constant list
+    context.treecache.put('optimize', 'a', 'optimize')
+    optimizer.constlist = ConstantList(constlist)
+    context.validate(optimizer)
+    assert context.treecache.get('optimize', 'a') == (False, None)
+
+
+consts = """
+module TOP(input CLK, input RST, input go, output reg [3:0] state);
+  localparam K = 3;
+  always @(posedge CLK) begin
+    if (RST) state <= 0;
+    else if (go) state <= K;
+  end
+endmodule
+"""
+
+
+def test_constant_write(analyze):
+    terms, binddict, resolved_terms, resolved_binddict, constlist = analyze(consts)
+    constlist = ConstantList(constlist)
+    analyzer = VerilogControlflowAnalyzer('TOP', terms, binddict, resolved_terms,
+                                          resolved_binddict, constlist)
+    termname = [name for name in terms.keys() if str(name) == 'TOP.state'][0]
+    tree = analyzer.makeTree(termname)
+    assert tree.tocode() == "((TOP_RST)? 'd0 : ((TOP_go)? 'd3 : TOP_state))"
+    assert analyzer.makeTree(termname) is tree
+    # go as a constant folds its branch
+    go = [name for name in terms.keys() if str(name) == 'TOP.go'][0]
+    constlist[go] = df.DFEvalValue(1)
+    rebuilt = analyzer.makeTree(termname)
+    assert rebuilt is not tree
+    assert rebuilt.tocode() == "((TOP_RST)? 'd0 : 'd3)"
+    stats = analyzer.context.treecache.stats()
+    assert stats['getTree'] == {'hits': 1, 'misses': 1, 'size': 1}
+    assert stats['optimize']['misses'] == 2
+
+
+active = """
+module TOP(input CLK, input RST, input go, output reg [1:0] state,
+           output reg [7:0] out, output reg done);
+  always @(posedge CLK) begin
+    if (RST) state <= 0;
+    else case (state)
+      0: if (go) state <= 1;
+      1: state <= 2;
+      2: state <= 0;
+    endcase
+  end
+  always @(posedge CLK) begin
+    if (RST) out <= 0;
+    else if (state == 1 && go) out <= 1;
+    else if (state == 2) out <= 2;
+  end
+  always @(posedge CLK) begin
+    if (RST) done <= 0;
+    else if (state == 2) done <= 1;
+  end
+endmodule
+"""
+
+
+def active_conditions(rslt):
+    # comparable across processes: names and conditions as strings
+    def code(conds):
+        return [(state, None if cond is None else cond.tocode()) for state, cond in conds]
+    return dict([(str(termname), dict([(str(fsm_sig), code(conds)) for fsm_sig, conds in d.items()]))
+                 for termname, d in rslt.items()])
+
+
+def test_active_conditions_many(analyze):
+    terms, binddict, resolved_terms, resolved_binddict, constlist = analyze(active)
+    constlist = ConstantList(constlist)
+    analyzer = VerilogActiveConditionAnalyzer('TOP', terms, binddict, resolved_terms,
+                                              resolved_binddict, constlist)
+    names = dict([(str(name), name) for name in terms.keys()])
+    termnames = [names['TOP.out'], names['TOP.done']]
+    expected = {'TOP.out': {'TOP.state': [(1, "(TOP_go>'d0)"), (2, None)]},
+                'TOP.done': {'TOP.state': [(2, None)]}}
+    assert active_conditions(analyzer.getActiveConditionsMany(termnames)) == expected
+    assert active_conditions(analyzer.getActiveConditionsMany(termnames, processes=2)) == expected
+    assert len(analyzer.walk_cache) > 0 and len(analyzer.transcond_cache) > 0
+    # the caches go with the trees when a constant is written in place
+    constlist[names['TOP.go']] = df.DFEvalValue(1, 1)
+    assert len(analyzer.walk_cache) == 0 and len(analyzer.transcond_cache) == 0
+    expected['TOP.out']['TOP.state'][0] = (1, None)
+    assert active_conditions(analyzer.getActiveConditionsMany(termnames, processes=2)) == expected
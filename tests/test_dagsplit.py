@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+import pyverilog.controlflow.splitter as splitter
+import pyverilog.controlflow.transition as transition
+
+import dagsplit
+import utility
+from dataflow import toCase
+
+width = 4
+
+
+def term(name):
+    return df.DFTerminal(util.toTermname('TOP.' + name))
+
+
+def fsm_tree(states=10):
+    # if (RST) state <= 0; else case (state) i: if (go) state <= i + 1; default: state <= 0;
+    state = term('state')
+    node = df.DFEvalValue(0)
+    for i in reversed(range(states)):
+        node = df.DFBranch(df.DFOperator((state, df.DFEvalValue(i)), 'Eq'),
+                           df.DFBranch(term('go'), df.DFEvalValue((i + 1) % states), None), node)
+    return df.DFBranch(term('RST'), df.DFEvalValue(0), node)
+
+
+def split_dag(tree):
+    dag = dagsplit.SplitDAG(toCase(tree)[0])
+    resetvalues = dag.remove_reset(splitter.remove_reset_condlist)
+    return dag, resetvalues
+
+
+def statenodes(nodes):
+    rslt = []
+    for value, node in nodes:
+        for n in (node.nodelist if isinstance(node, transition.StateNodeList) else [node]):
+            rslt.append((value, tuple(sorted(n.range_pairs)), n.isany,
+                         None if n.transcond is None else n.transcond.tostr()))
+    return sorted(rslt)
+
+
+def test_remove_reset():
+    dag, resetvalues = split_dag(fsm_tree())
+    funcdict = dagsplit.DAGFuncdict(dag)
+    assert resetvalues == set([0])
+    assert len(funcdict) == 11
+    for condlist, value in funcdict.items():
+        assert condlist in funcdict
+        assert funcdict[condlist] is value
+    assert not (term('go'), ) in funcdict
+
+
+def test_walker_matches_flat():
+    tree = fsm_tree()
+    termname = term('state').name
+    flat = splitter.remove_reset_condition(splitter.split(tree))
+    walker = dagsplit.StateWalker(split_dag(tree)[0], termname, width)
+
+    domain = utility.inferStateRange(flat, termname, width)
+    assert utility.inferStateDomain(walker.branches(), termname, width) == domain
+    assert walker.evidence() == utility.getEncodingEvidence(flat, termname)
+
+    expected = [(func.value, transition.walkCondlist(condlist, termname, width))
+                for condlist, func in flat.items() if isinstance(func, df.DFEvalValue)]
+    walked = [(value, node) for value, node, values in walker.transitions(domain)]
+    assert statenodes(walked) == statenodes(expected)
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+from dataflow import DataflowIndex
+
+design = """
+module TOP(input CLK, input RST, input go, input [3:0] in, output [3:0] out);
+  reg [3:0] state;
+  reg [3:0] acc;
+  wire [3:0] sum = acc + in;
+  wire [3:0] unused = in ^ 4'hf;
+  assign out = state;
+  always @(posedge CLK) begin
+    if (RST) state <= 0;
+    else if (go) state <= state + 1;
+  end
+  always @(posedge CLK) begin
+    if (RST) acc <= 0;
+    else acc <= sum;
+  end
+endmodule
+"""
+
+
+def names(index):
+    return (dict([(str(k), sorted([str(n) for n in v])) for k, v in index.fanin.items()]),
+            dict([(str(k), sorted([str(n) for n in v])) for k, v in index.fanout.items()]))
+
+
+def test_index_updates(analyze):
+    args = analyze(design)
+    # copies: the fixture's results are shared
+    terms = dict(args[0])
+    binddict = dict([(k, list(v)) for k, v in args[1].items()])
+    index = DataflowIndex(terms, binddict)
+    termnames = dict([(str(name), name) for name in terms.keys()])
+    state = termnames['TOP.state']
+    sum_ = termnames['TOP.sum']
+    assert sorted([str(n) for n in index.getFanin(sum_)]) == ['TOP.acc', 'TOP.in']
+    assert [str(n) for n in index.getFanout(sum_)] == ['TOP.acc']
+
+    # a new term
+    extra = util.toTermname('TOP.extra')
+    terms[extra] = df.Term(extra)
+    bind = df.Bind(df.DFOperator((df.DFTerminal(state), df.DFTerminal(termnames['TOP.go'])),
+                                 'And'), extra)
+    binddict[extra] = [bind]
+    index.addBind(extra, bind)
+    # out reads sum instead of state
+    bindlist = [df.Bind(df.DFTerminal(sum_), termnames['TOP.out'])]
+    binddict[termnames['TOP.out']] = bindlist
+    index.setBinds(termnames['TOP.out'], bindlist)
+    assert sorted([str(n) for n in index.getFanout(state)]) == ['TOP.extra', 'TOP.state']
+    assert names(index) == names(DataflowIndex(terms, binddict))
+
+    # dead terms, until none is left
+    keep = [termnames['TOP.out']]
+    removed = []
+    while True:
+        dead = index.getDeadTerms(keep)
+        if len(dead) == 0:
+            break
+        for termname in dead:
+            index.removeTerm(termname)
+            terms.pop(termname, None)
+            binddict.pop(termname, None)
+            removed.append(str(termname))
+    assert sorted(removed) == ['TOP.CLK', 'TOP.extra', 'TOP.unused']
+    assert names(index) == names(DataflowIndex(terms, binddict))
+    assert sorted([str(n) for n in index.getCone([termnames['TOP.out']])]) == [
+        'TOP.RST', 'TOP.acc', 'TOP.in', 'TOP.out', 'TOP.sum']
@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+from dataflow import DFCase
+from dfcompiler import DFCompiler
+
+widths = {'bus': 8, 'flag': 1, 'sel': 4, 'state': 4}
+
+
+def select_tree():
+    # {bus[3:0], bus[7], flag}
+    bus = df.DFTerminal('bus')
+    return df.DFConcat((df.DFPartselect(bus, df.DFIntConst('3'), df.DFIntConst('0')),
+                        df.DFPointer(bus, df.DFIntConst('7')),
+                        df.DFTerminal('flag')))
+
+
+def case_tree():
+    items = [(df.DFEvalValue(i), df.DFEvalValue(i + 1)) for i in range(3)]
+    return DFCase(df.DFTerminal('sel'), items, df.DFEvalValue(0))
+
+
+def test_partselect_pointer_concat():
+    func = DFCompiler(widths.get).compile(select_tree())
+    assert func.width == 6
+    assert func({'bus': 0xa5, 'flag': 1}) == 0x17
+    assert func({'bus': 0x3c, 'flag': 0}) == 0x30
+
+
+def test_partselect_pointer_concat_vectorized():
+    np = pytest.importorskip('numpy')
+    func = DFCompiler(widths.get, vectorized=True).compile(select_tree())
+    rslt = func({'bus': np.array([0xa5, 0x3c]), 'flag': np.array([1, 0])})
+    assert list(rslt) == [0x17, 0x30]
+
+
+def test_case():
+    func = DFCompiler(widths.get).compile(case_tree(), 4)
+    assert [func({'sel': v}) for v in range(5)] == [1, 2, 3, 0, 0]
+
+
+def test_case_default_keeps_term():
+    items = [(df.DFEvalValue(0), df.DFEvalValue(5))]
+    func = DFCompiler(widths.get).compile(DFCase(df.DFTerminal('sel'), items), 4, 'state')
+    assert func({'sel': 0, 'state': 9}) == 5
+    assert func({'sel': 1, 'state': 9}) == 9
@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+import pyverilog.controlflow.splitter as splitter
+import pyverilog.controlflow.transition as transition
+
+import utility
+from controlflow import FiniteStateMachine
+
+state = df.DFTerminal(util.toTermname('TOP.state'))
+go = df.DFTerminal(util.toTermname('TOP.go'))
+
+
+def eq(value):
+    return df.DFOperator((state, df.DFEvalValue(value)), 'Eq')
+
+
+def bit(pos):
+    return df.DFPointer(state, df.DFEvalValue(pos))
+
+
+def chain(tests, default=None):
+    # if (tests[0][0]) state <= tests[0][1]; else if ...
+    node = default
+    for cond, value in reversed(tests):
+        node = df.DFBranch(cond, df.DFEvalValue(value), node)
+    return splitter.split(node)
+
+
+def encoding(funcdict, width=4, resetvalues=()):
+    evidence = utility.getEncodingEvidence(funcdict, state.name)
+    return utility.selectEncoding(*evidence, width=width, resetvalues=resetvalues)
+
+
+def test_evidence():
+    funcdict = chain([(eq(0), 1), (bit(2), 0), (eq(1), 3)])
+    dsts, consts, bits, pairs = utility.getEncodingEvidence(funcdict, state.name)
+    assert dsts == set([0, 1, 3])
+    assert consts == set([0, 1])
+    assert bits == set([2])
+    # the tested bit stands for its one-hot value
+    assert pairs == set([(0, 1), (4, 0), (1, 3)])
+
+
+def test_onehot():
+    funcdict = chain([(bit(0), 2), (bit(1), 4), (bit(2), 8), (bit(3), 1)])
+    enc = encoding(funcdict)
+    assert enc.kind == 'onehot'
+    assert enc.values == [1, 2, 4, 8]
+    assert enc.bits == [0, 1, 2, 3]
+    assert enc.compact
+
+
+def test_onehot_without_bit_tests():
+    # equality tests only, but no zero state
+    funcdict = chain([(eq(1), 2), (eq(2), 4), (eq(4), 1)])
+    assert encoding(funcdict, resetvalues=(1, )).kind == 'onehot'
+
+
+def test_powers_of_two_binary():
+    # 0 -> 1 -> 2 -> 4 -> 0 compared by value is a binary counter
+    funcdict = chain([(eq(0), 1), (eq(1), 2), (eq(2), 4), (eq(4), 0)])
+    enc = encoding(funcdict, resetvalues=(0, ))
+    assert enc.kind == 'binary'
+    assert enc.values == [0, 1, 2, 4]
+    assert not enc.compact
+
+
+def test_gray():
+    funcdict = chain([(eq(0), 1), (eq(1), 3), (eq(3), 2), (eq(2), 0)])
+    enc = encoding(funcdict)
+    assert enc.kind == 'gray'
+    assert enc.values == [0, 1, 2, 3]
+
+
+def test_binary():
+    funcdict = chain([(eq(0), 1), (eq(1), 2), (eq(2), 3), (eq(3), 0)])
+    enc = encoding(funcdict)
+    assert enc.kind == 'binary'
+    assert not enc.compact
+    assert encoding(funcdict, width=20).compact
+
+
+def test_select():
+    enc = utility.StateEncoding('onehot', [8, 1, 4, 2, 4])
+    assert enc.values == [1, 2, 4, 8]
+    assert enc.select(2, 7) == [2, 4]
+    assert enc.select(9, 15) == []
+    assert 4 in enc and not 3 in enc
+    assert len(enc) == 4
+
+
+def test_compact_add_construct():
+    fsm = FiniteStateMachine('s')
+    fsm.set_encoding(utility.StateEncoding('onehot', [1, 2, 4, 8]))
+    fsm.add((0, 15), 1, go)
+    assert sorted(fsm.fsm.keys()) == [1, 2, 4, 8]
+    fsm = FiniteStateMachine('s')
+    fsm.set_encoding(utility.StateEncoding('onehot', [1, 2, 4, 8]))
+    node = transition.StateNode(range_pairs=((2, 12), ), transcond=go)
+    fsm.construct(1, node)
+    assert fsm.fsm == {2: {go: 1}, 4: {go: 1}, 8: {go: 1}}
+    # the same range over a dense encoding
+    fsm = FiniteStateMachine('s')
+    fsm.set_encoding(utility.StateEncoding('binary', [0, 1, 2], width=4))
+    fsm.construct(1, node)
+    assert sorted(fsm.fsm.keys()) == list(range(2, 13))
@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import explorer
+from controlflow import VerilogControlflowAnalyzer
+
+design = """
+module TOP(input CLK, input RST, input go, input [1:0] sel, output reg [2:0] state);
+  reg flag;
+  always @(posedge CLK) begin
+    if (RST) flag <= 0;
+    else flag <= flag & go;
+  end
+  always @(posedge CLK) begin
+    if (RST) state <= 0;
+    else case (state)
+      0: if (go) state <= 1; else state <= 2;
+      1: state <= 3;
+      2: state <= 4;
+      5: state <= 6;
+      6: if (flag) state <= 7; else state <= 0;
+      default: state <= 0;
+    endcase
+  end
+endmodule
+"""
+
+
+@pytest.fixture
+def analyzer(analyze):
+    return VerilogControlflowAnalyzer('TOP', *analyze(design), prune=True)
+
+
+def statename(analyzer):
+    return [name for name in analyzer.getFiniteStateMachines().keys()
+            if str(name) == 'TOP.state'][0]
+
+
+def test_enumerate_symbolic(analyzer):
+    termname = statename(analyzer)
+    enumerated = explorer.explore(analyzer, termname)
+    symbolic = explorer.explore(analyzer, termname, mode='symbolic')
+    assert enumerated.reachable == symbolic.reachable == [0, 1, 2, 3, 4]
+    # enumerate mode also takes RST as an input
+    assert symbolic.edges < enumerated.edges
+    assert set([dst for src, dst in enumerated.edges - symbolic.edges]) == set([0])
+    assert enumerated.complete and symbolic.complete
+    assert enumerated.fsm.states() == [0, 1, 2, 3, 4]
+    assert enumerated.fsm.reachable == [0, 1, 2, 3, 4]
+
+
+def test_overapprox(analyzer):
+    # from 6, flag is a free input: 7 counts as reachable, though flag stays 0
+    termname = statename(analyzer)
+    rslt = explorer.explore(analyzer, termname, initial=(6, ))
+    assert rslt.reachable == [0, 1, 2, 3, 4, 6, 7]
+    assert rslt.overapprox
+
+
+def test_sampled(analyzer):
+    termname = statename(analyzer)
+    rslt = explorer.explore(analyzer, termname, max_input_bits=0, samples=64)
+    assert rslt.reachable == [0, 1, 2, 3, 4]
+    assert not rslt.complete
+    assert not rslt.fsm.complete
+
+
+class Clock(object):
+    # one second per call
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+def test_time_limit(analyzer, monkeypatch):
+    # 0 is expanded at the first check and 1 at the second; the third stops
+    # the search inside the level of 1 and 2
+    termname = statename(analyzer)
+    monkeypatch.setattr(explorer, 'time', Clock())
+    rslt = explorer.explore(analyzer, termname, time_limit=2.5)
+    assert rslt.reachable == [0, 1, 2, 3]
+    assert not rslt.complete
+
+
+def test_max_states(analyzer):
+    termname = statename(analyzer)
+    rslt = explorer.explore(analyzer, termname, max_states=2)
+    assert rslt.reachable == [0, 1, 2]
+    assert not rslt.complete
@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import io
+import json
+import subprocess
+import xml.etree.ElementTree as ElementTree
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+import graphwriter
+from controlflow import FiniteStateMachine
+
+label = 'a "quoted" \\ <label> & more\nnext line'
+
+
+def make_model():
+    model = graphwriter.GraphModel('fsm "x"')
+    model.add_node('0', label)
+    model.add_node('1')
+    model.add_edge('0', '1', label)
+    model.add_edge('1', '0', '')
+    model.shorten('l' * 30 + ' & "<>"', 24)
+    return model
+
+
+def write(writer, model):
+    out = io.StringIO()
+    writer(model, out)
+    return out.getvalue()
+
+
+def test_dot_quoting():
+    text = write(graphwriter.write_dot, make_model())
+    quoted = '"a \\"quoted\\" \\\\ <label> & more\\nnext line"'
+    assert text.startswith('digraph "fsm \\"x\\"" {\n')
+    assert '  "0" [label=%s];\n' % quoted in text
+    assert '  "0" -> "1" [label=%s];\n' % quoted in text
+    assert '  "1" -> "0" [label=""];\n' in text
+    assert '  "legend" [shape=box, label="c0: %s & \\"<>\\"\\l"];\n' % ('l' * 30) in text
+    # every double quote left is a delimiter
+    for line in text.splitlines()[1:-1]:
+        assert line.replace('\\\\', '').replace('\\"', '').count('"') % 2 == 0
+
+
+def test_json():
+    model = make_model()
+    obj = json.loads(write(graphwriter.write_json, model))
+    assert obj['name'] == 'fsm "x"'
+    assert obj['nodes'] == [{'id': '0', 'label': label}, {'id': '1', 'label': '1'}]
+    assert obj['edges'] == [{'src': '0', 'dst': '1', 'label': label},
+                            {'src': '1', 'dst': '0', 'label': ''}]
+    assert obj['legend'] == model.legend
+
+
+def test_graphml_escaping():
+    model = make_model()
+    root = ElementTree.fromstring(write(graphwriter.write_graphml, model).encode('utf-8'))
+    ns = '{http://graphml.graphdrawing.org/xmlns}'
+    graph = root.find(ns + 'graph')
+    assert graph.get('id') == 'fsm "x"'
+    assert graph.find(ns + 'data').text == 'c0: %s & "<>"' % ('l' * 30)
+    nodes = [(n.get('id'), n.find(ns + 'data').text) for n in graph.findall(ns + 'node')]
+    assert nodes == [('0', label), ('1', '1')]
+    edges = [(e.get('source'), e.get('target'), e.find(ns + 'data').text or '')
+             for e in graph.findall(ns + 'edge')]
+    assert edges == [('0', '1', label), ('1', '0', '')]
+
+
+def test_export(tmp_path):
+    fsm = FiniteStateMachine('TOP_state')
+    fsm.add((0, 0), 1, None)
+    for ext in ('dot', 'gv', 'json', 'graphml'):
+        filename = str(tmp_path / ('fsm.' + ext))
+        assert graphwriter.export(fsm, filename) == filename
+    with pytest.raises(ValueError):
+        graphwriter.export(fsm, str(tmp_path / 'fsm.png'))
+
+
+class Subprocess(object):
+    # the parts of subprocess RenderQueue uses, with run() replaced
+    PIPE = subprocess.PIPE
+    TimeoutExpired = subprocess.TimeoutExpired
+    CalledProcessError = subprocess.CalledProcessError
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def run(self, cmd, check=False, timeout=None, **kwargs):
+        self.calls.append((cmd, timeout))
+        if self.error is not None:
+            raise self.error
+        return subprocess.CompletedProcess(cmd, 0)
+
+
+@pytest.mark.parametrize('error,result', [
+    (None, 'ok'),
+    (subprocess.TimeoutExpired(['dot'], 3), 'timeout'),
+    (subprocess.CalledProcessError(1, ['dot']), 'error: '),
+    (OSError('no dot'), 'error: no dot'),
+])
+def test_render_queue(tmp_path, monkeypatch, error, result):
+    stub = Subprocess(error)
+    monkeypatch.setattr(graphwriter, 'subprocess', stub)
+    fsm = FiniteStateMachine('TOP_state')
+    fsm.add((0, 0), 1, None)
+    filename = str(tmp_path / 'fsm.svg')
+    queue = graphwriter.RenderQueue(timeout=3)
+    try:
+        graphwriter.render(fsm, filename, queue)
+        results = queue.wait()
+    finally:
+        queue.shutdown()
+    assert results[filename].startswith(result)
+    dotfile = str(tmp_path / 'fsm.dot')
+    assert stub.calls == [(['dot', '-Tsvg', dotfile, '-o', filename], 3)]
+    assert open(dotfile).read().startswith('digraph "TOP_state" {')
+    assert queue.wait() == {}
+
+
+def test_build_compact():
+    def term(name):
+        return df.DFTerminal(util.toTermname('TOP.' + name))
+
+    a = term('a')
+    b = term('b')
+    rst = term('rst')
+    long0 = term('request_valid_and_ready')
+    long1 = term('response_valid_and_ready')
+    fsm = FiniteStateMachine('TOP_state')
+    fsm.add((0, 0), 1, a)
+    fsm.add((0, 0), 1, b)
+    fsm.add((1, 1), 2, long0)
+    fsm.add((2, 2), 0, long0)
+    fsm.add((2, 2), 1, a)
+    fsm.add_any(0, rst)
+    fsm.add_any(0, long1)
+
+    full = graphwriter.build(fsm)
+    # 5 edges plus 2 'any' edges from each of the 3 sources
+    assert len(full.edges) == 11
+    assert full.legend == {}
+
+    model = graphwriter.build_compact(fsm)
+    assert model.nodes == {'0': '0', '1': '1', '2': '2', '*': 'any'}
+    assert len(model.edges) == 5
+    # one legend entry per long condition, however often it is used
+    assert model.legend == {'c0': str(long0), 'c1': str(long1)}
+    assert sorted(model.edges) == sorted([
+        ('0', '1', '%s | %s' % (a, b)),
+        ('1', '2', 'c0'),
+        ('2', '0', 'c0'),
+        ('2', '1', str(a)),
+        ('*', '0', '%s | c1' % rst),
+    ])
+
+    model = graphwriter.build_compact(fsm, nolabel=True)
+    assert len(model.edges) == 5
+    assert set([label for src, dst, label in model.edges]) == set([''])
+    assert model.legend == {}
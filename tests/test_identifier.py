@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import gc
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.vparser.ast as vast
+from pyverilog.dataflow.visit import NodeVisitor
+
+import utility
+from utility import IdentifierVisitor, getIdentifiers, getIdentifiersMany
+
+
+class RecursiveIdentifierVisitor(NodeVisitor):
+    # the recursive visitor getIdentifiers used before the iterative walk
+    def __init__(self):
+        self.identifiers = []
+
+    def getIdentifiers(self):
+        return tuple(self.identifiers)
+
+    def visit_Identifier(self, node):
+        self.identifiers.append(node)
+
+
+def reference(node, unique=False, scoped=False):
+    v = RecursiveIdentifierVisitor()
+    v.visit(node)
+    ids = []
+    for ident in v.getIdentifiers():
+        name = utility.getScopedName(ident) if scoped else ident.name
+        if unique and name in ids:
+            continue
+        ids.append(name)
+    return tuple(ids)
+
+
+def scope(*names):
+    return vast.IdentifierScope([vast.IdentifierScopeLabel(name) for name in names])
+
+
+def expression():
+    # (a + sub.b) * (~a[c] ? sub.b : {d, top.sub.a, a})
+    a = vast.Identifier('a')
+    b = vast.Identifier('b', scope('sub'))
+    left = vast.Plus(a, b)
+    cond = vast.Unot(vast.Pointer(vast.Identifier('a'), vast.Identifier('c')))
+    concat = vast.Concat([vast.Identifier('d'), vast.Identifier('a', scope('top', 'sub')),
+                          vast.Identifier('a')])
+    right = vast.Cond(cond, vast.Identifier('b', scope('sub')), concat)
+    return vast.Times(left, right)
+
+
+options = [(False, False), (True, False), (False, True), (True, True)]
+
+
+@pytest.mark.parametrize('unique,scoped', options)
+def test_matches_recursive_visitor(unique, scoped):
+    utility.clearIdentifierCache()
+    node = expression()
+    expected = reference(node, unique, scoped)
+    assert getIdentifiers(node, unique, scoped) == expected
+    # again from the cache
+    assert getIdentifiers(node, unique, scoped) == expected
+
+    v = IdentifierVisitor(unique, scoped)
+    v.visit(node)
+    assert v.getIdentifiers() == expected
+
+    nodes = [node, expression().left, vast.IntConst('1'), expression()]
+    assert getIdentifiersMany(nodes, unique, scoped) == [reference(n, unique, scoped) for n in nodes]
+
+
+def test_options():
+    utility.clearIdentifierCache()
+    node = expression()
+    assert getIdentifiers(node) == ('a', 'b', 'a', 'c', 'b', 'd', 'a', 'a')
+    assert getIdentifiers(node, unique=True) == ('a', 'b', 'c', 'd')
+    assert getIdentifiers(node, unique=True, scoped=True) == ('a', 'sub.b', 'c', 'd', 'top.sub.a')
+
+
+def test_visitor_reset():
+    v = IdentifierVisitor(unique=True)
+    v.visit(vast.Plus(vast.Identifier('x'), vast.Identifier('y')))
+    v.reset()
+    v.visit(vast.Plus(vast.Identifier('y'), vast.Identifier('x')))
+    assert v.getIdentifiers() == ('y', 'x')
+
+
+def test_cache():
+    utility.clearIdentifierCache()
+    node = expression()
+    ids = getIdentifiers(node)
+    assert getIdentifiers(node) is ids
+    assert getIdentifiersMany([node])[0] is ids
+    assert getIdentifiers(node, unique=True) is not ids
+
+    # a rewritten node keeps its stale names until the cache is cleared
+    node.left.left.name = 'e'
+    assert getIdentifiers(node) is ids
+    utility.clearIdentifierCache()
+    assert getIdentifiers(node)[0] == 'e'
+
+    # entries go away with their nodes
+    assert len(utility._identifier_cache) == 1
+    del node
+    gc.collect()
+    assert len(utility._identifier_cache) == 0
+
+
+def test_deep_expression():
+    node = vast.Identifier('x0')
+    for i in range(1, 5000):
+        node = vast.Plus(node, vast.Identifier('x%d' % (i % 7)))
+    ids = getIdentifiers(node, unique=True)
+    assert ids == tuple('x%d' % i for i in range(7))
+    assert len(getIdentifiers(node)) == 5000
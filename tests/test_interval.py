@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+import utility
+from utility import IntervalSet
+from controlflow import VerilogControlflowAnalyzer
+
+step = df.DFTerminal(util.toTermname('TOP.step'))
+go = df.DFTerminal(util.toTermname('TOP.go'))
+
+
+def const(value):
+    return df.DFEvalValue(value)
+
+
+def op(operator, *nodes):
+    return df.DFOperator(nodes, operator)
+
+
+def test_normalize():
+    assert IntervalSet([(5, 7), (0, 2), (3, 4), (9, 8), (6, 6)]).pairs == ((0, 7), )
+    assert IntervalSet([(0, 1), (3, 4)]).pairs == ((0, 1), (3, 4))
+    assert IntervalSet.values([3, 1, 2, 7]).pairs == ((1, 3), (7, 7))
+
+
+def test_set_operations():
+    s = IntervalSet([(0, 3), (10, 20)])
+    t = IntervalSet([(2, 12), (18, 30)])
+    assert s.union(t) == IntervalSet([(0, 30)])
+    assert s.intersect(t) == IntervalSet([(2, 3), (10, 12), (18, 20)])
+    assert s.intersect(IntervalSet()).isempty()
+    assert s.complement(5) == IntervalSet([(4, 9), (21, 31)])
+    assert IntervalSet().complement(4) == IntervalSet.full(4)
+    assert IntervalSet.full(4).complement(4).isempty()
+    assert s.clip(2, 15) == IntervalSet([(2, 3), (10, 15)])
+    assert s.size() == 15
+    assert 10 in s and 3 in s and not 4 in s and not 21 in s
+
+
+def test_shift():
+    s = IntervalSet([(0, 1), (250, 255)])
+    # wraps at the width
+    assert s.shift(10, 8) == IntervalSet([(4, 11)])
+    assert s.shift(-1, 8) == IntervalSet([(0, 0), (249, 255)])
+    assert IntervalSet.full(8).shift(3, 8) == IntervalSet.full(8)
+
+
+def test_infer_ops():
+    def values(operator, value, width=4):
+        return utility.infer(operator, const(value), width).toIntervalSet(width)
+
+    assert values('Eq', 3) == IntervalSet.values([3])
+    assert values('NotEq', 3) == IntervalSet([(0, 2), (4, 15)])
+    assert values('LessThan', 3) == IntervalSet([(0, 2)])
+    assert values('GreaterEq', 3) == IntervalSet([(3, 15)])
+    # the edges of the width
+    assert values('LessThan', 0).isempty()
+    assert values('GreaterThan', 15).isempty()
+    assert values('LessEq', 15) == IntervalSet.full(4)
+    assert values('Eq', 16).isempty()
+    assert values('NotEq', 16) == IntervalSet.full(4)
+    # operators without a rule allow everything
+    assert values('Divide', 0) == IntervalSet.full(4)
+
+
+def test_infer_condition():
+    width = 4
+    may, must = utility.inferCondition(op('LessThan', const(3), step), step.name, width)
+    assert may == must == IntervalSet([(4, 15)])
+    cond = op('Land', go, op('Eq', step, const(2)))
+    may, must = utility.inferCondition(cond, step.name, width)
+    assert may == IntervalSet.values([2])
+    assert must.isempty()
+    may, must = utility.inferCondition(op('Ulnot', cond), step.name, width)
+    assert may == IntervalSet.full(width)
+    assert must == IntervalSet([(0, 1), (3, 15)])
+    may, must = utility.inferCondition(op('Lor', cond, op('GreaterThan', step, const(13))),
+                                       step.name, width)
+    assert may == IntervalSet([(2, 2), (14, 15)])
+    assert must == IntervalSet([(14, 15)])
+
+
+def test_infer_next():
+    width = 8
+    values = IntervalSet([(250, 255)])
+    assert utility.inferNext(const(300), values, step.name, width) == IntervalSet.values([44])
+    assert utility.inferNext(op('Plus', step, const(10)), values, step.name,
+                             width) == IntervalSet([(4, 9)])
+    assert utility.inferNext(op('Minus', step, const(251)), values, step.name,
+                             width) == IntervalSet([(0, 4), (255, 255)])
+    assert utility.inferNext(step, values, step.name, width) is values
+    # division, also by zero, is not followed
+    assert utility.inferNext(op('Divide', step, const(0)), values, step.name,
+                             width) == IntervalSet.full(width)
+
+
+nested = """
+module TOP(input CLK, input RST, input [7:0] in, output reg [7:0] step);
+  always @(posedge CLK) begin
+    if (RST) step <= 5;
+    else if (in[0]) begin
+      case (step)
+        5: begin
+          if (in[1]) step <= 20;
+          else step <= 71;
+        end
+        20: step <= 71;
+        default: step <= 5;
+      endcase
+    end
+  end
+endmodule
+"""
+
+
+@pytest.mark.parametrize('dagsplit', [False, True])
+def test_clipped_domain(analyze, dagsplit):
+    analyzer = VerilogControlflowAnalyzer('TOP', *analyze(nested), dagsplit=dagsplit)
+    fsms = analyzer.getFiniteStateMachines()
+    termname = list(fsms.keys())[0]
+    fsm = fsms[termname]
+    # only the reset value, not every constant of the next-state function
+    assert analyzer.getResetValues(termname) == (5, )
+    assert fsm.reset == (5, )
+    # 3 of the 256 values of the register: the default branch only adds 71
+    assert fsm.domain == IntervalSet.values([5, 20, 71])
+    assert sorted(fsm.fsm.keys()) == [5, 20, 71]
+    assert fsm.states() == [5, 20, 71]
@@ -0,0 +1,97 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+import minimize
+from controlflow import FiniteStateMachine
+
+
+def term(name):
+    return df.DFTerminal(util.toTermname('TOP.' + name))
+
+
+a = term('a')
+b = term('b')
+c = term('c')
+
+
+def make_fsm(edges, reset=(0, ), name='s'):
+    fsm = FiniteStateMachine(name)
+    for src, cond, dst in edges:
+        fsm.add((src, src), dst, cond)
+    fsm.set_reset(reset)
+    return fsm
+
+
+def diamond(offset=0):
+    # 1 and 2 only differ by their values
+    return make_fsm([(offset, a, offset + 1), (offset, b, offset + 2),
+                     (offset + 1, c, offset + 3), (offset + 2, c, offset + 3),
+                     (offset + 3, None, offset)], reset=(offset, ))
+
+
+def compact_form(fsm):
+    compact = minimize.CompactFSM()
+    compact.add(fsm)
+    return compact.delta, compact.keys
+
+
+def test_minimize_merges():
+    fsm = diamond().minimize()
+    assert fsm.fsm == {0: {a: 1, b: 1}, 1: {c: 3}, 3: {None: 0}}
+    assert fsm.states() == [0, 1, 3]
+    assert fsm.reset == (0, )
+
+
+def test_minimize_encoding():
+    fsm = diamond()
+    assert fsm.minimize(encoding=True).fsm == fsm.fsm
+
+
+def test_minimize_partial():
+    # 2 and 5 have no transitions at all: the implicit sink tells 1 and 3
+    # apart from 2 and 5, while 1 and 3 as well as 2 and 5 merge
+    fsm = make_fsm([(0, a, 1), (1, a, 2), (0, b, 3), (3, a, 5)])
+    block_of = minimize.hopcroft(*compact_form(fsm))
+    assert len(set(block_of.values())) == 3
+    fsm = fsm.minimize()
+    assert fsm.fsm == {0: {a: 1, b: 1}, 1: {a: 2}}
+    assert fsm.states() == [0, 1, 2]
+
+
+def test_equivalent():
+    fsm = diamond()
+    merged = fsm.minimize()
+    assert fsm.is_equivalent(fsm)
+    assert fsm.is_equivalent(merged, encoding=False)
+    assert merged.is_equivalent(fsm, encoding=False)
+    # 0 --b--> 2 against 0 --b--> 1
+    assert not fsm.is_equivalent(merged)
+
+
+def test_equivalent_renumbered():
+    assert diamond().is_equivalent(diamond(10), encoding=False)
+    assert not diamond().is_equivalent(diamond(10))
+
+
+def test_equivalent_unreachable():
+    # parts that cannot be reached from the reset states do not count
+    fsm = diamond()
+    fsm.add((7, 7), 0, b)
+    assert fsm.is_equivalent(diamond())
+    fsm.set_reset(None)
+    assert not fsm.is_equivalent(diamond())
+
+
+def test_inequivalent_revisions():
+    fsm = diamond()
+    redirected = make_fsm([(0, a, 1), (0, b, 2), (1, c, 3), (2, c, 3), (3, None, 1)])
+    relabeled = make_fsm([(0, a, 1), (0, b, 2), (1, c, 3), (2, b, 3), (3, None, 0)])
+    missing = make_fsm([(0, a, 1), (0, b, 2), (1, c, 3), (3, None, 0)])
+    for other in (redirected, relabeled, missing):
+        assert not fsm.is_equivalent(other)
+        assert not fsm.is_equivalent(other, encoding=False)
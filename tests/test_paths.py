@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import pyverilog.utils.util as util
+
+from controlflow import FiniteStateMachine
+
+
+def term(name):
+    return df.DFTerminal(util.toTermname('TOP.' + name))
+
+
+a = term('a')
+b = term('b')
+c = term('c')
+
+
+def make_fsm():
+    # 0 reaches 3 through 1, 2, 1 and 2, or 4 and 5; 6 is not reachable
+    fsm = FiniteStateMachine('s')
+    for src, cond, dst in ((0, a, 1), (0, b, 2), (0, c, 4), (1, c, 3), (1, a, 2),
+                           (2, c, 3), (4, a, 5), (5, a, 3), (3, None, 0), (6, a, 0)):
+        fsm.add((src, src), dst, cond)
+    return fsm
+
+
+def states(path):
+    return [path[0][0]] + [step[2] for step in path]
+
+
+def test_shortest_path():
+    fsm = make_fsm()
+    assert fsm.shortest_path(0, 3) == [(0, a, 1), (1, c, 3)]
+    assert fsm.shortest_path(0, 0) == []
+    assert states(fsm.shortest_path(0, 3, banned_nodes=(1, ))) == [0, 2, 3]
+    assert states(fsm.shortest_path(0, 3, banned_edges=((0, a, 1), (0, b, 2)))) == [0, 4, 5, 3]
+    assert fsm.shortest_path(0, 6) is None
+
+
+def test_k_shortest_paths():
+    fsm = make_fsm()
+    paths = fsm.k_shortest_paths(0, 3, 10)
+    assert [states(p) for p in paths] == [[0, 1, 3], [0, 2, 3], [0, 1, 2, 3], [0, 4, 5, 3]]
+    assert fsm.k_shortest_paths(0, 3, 2) == paths[:2]
+    assert fsm.k_shortest_paths(0, 6, 3) == []
+
+
+def test_k_shortest_paths_parallel():
+    # parallel transitions with different conditions are different paths
+    fsm = make_fsm()
+    fsm.add((1, 1), 3, b)
+    paths = fsm.k_shortest_paths(0, 3, 3)
+    assert [len(p) for p in paths] == [2, 2, 2]
+    assert set([p[1][1] for p in paths if p[0][2] == 1]) == set([b, c])
+
+
+def test_all_paths():
+    fsm = make_fsm()
+    paths = list(fsm.all_paths(0, 3, 3))
+    assert sorted([states(p) for p in paths]) == [[0, 1, 2, 3], [0, 1, 3], [0, 2, 3], [0, 4, 5, 3]]
+    assert sorted([states(p) for p in fsm.all_paths(0, 3, 2)]) == [[0, 1, 3], [0, 2, 3]]
+    assert list(fsm.all_paths(0, 6, 10)) == []
+    # states repeat, and paths go on through dst
+    paths = sorted([states(p) for p in fsm.all_paths(3, 0, 4, simple=False)])
+    assert paths == [[3, 0], [3, 0, 1, 3, 0], [3, 0, 2, 3, 0]]
+
+
+def test_distance():
+    fsm = make_fsm()
+    assert fsm.distance(0, 3) == 2
+    assert fsm.distance(0, 0) == 0
+    assert fsm.distance(3, 5) == 3
+    assert fsm.distance(6, 3) == 3
+    assert fsm.distance(0, 6) == -1
+    assert fsm.distance(0, 99) == -1
+
+
+def ring(n):
+    fsm = FiniteStateMachine('s')
+    for s in range(n):
+        fsm.add((s, s), (s + 1) % n, None)
+    fsm.add((0, 0), n // 2, a)
+    return fsm
+
+
+@pytest.mark.parametrize('n', [8, FiniteStateMachine.max_floyd_states + 1])
+def test_distance_matrix_methods(n, monkeypatch):
+    np = pytest.importorskip('numpy')
+    calls = []
+    bfs = FiniteStateMachine._bfs_distances
+
+    def counted(self, states):
+        calls.append(len(states))
+        return bfs(self, states)
+
+    monkeypatch.setattr(FiniteStateMachine, '_bfs_distances', counted)
+    fsm = ring(n)
+    states, matrix = fsm.distance_matrix()
+    # Floyd-Warshall up to max_floyd_states, breadth-first search above
+    assert calls == ([] if n <= FiniteStateMachine.max_floyd_states else [n])
+    other = 'bfs' if len(calls) == 0 else 'floyd'
+    assert np.array_equal(matrix, fsm.distance_matrix(other)[1])
+    assert matrix[0][n // 2] == 1
+    assert matrix[n // 2][0] == n - n // 2
+
+
+def test_distance_cache():
+    fsm = make_fsm()
+    states, matrix = fsm.distance_matrix()
+    assert fsm.distance_matrix()[1] is matrix
+    assert fsm.distance(0, 6) == -1
+    version = fsm.version
+    fsm.add((3, 3), 6, b)
+    assert fsm.version > version
+    assert fsm.distance_matrix()[1] is not matrix
+    assert fsm.distance(0, 6) == 3
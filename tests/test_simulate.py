@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+np = pytest.importorskip('numpy')
+
+import pyverilog.utils.util as util
+import pyverilog.utils.verror as verror
+
+from controlflow import FiniteStateMachine
+from simulate import RandomSimulator
+
+
+def term(name):
+    return df.DFTerminal(util.toTermname('TOP.' + name))
+
+
+state = term('state')
+go = term('go')
+wide = term('wide')
+widths = {state.name: 2, go.name: 1, wide.name: 64}
+
+
+def make_fsm(edges):
+    fsm = FiniteStateMachine('TOP_state')
+    for src, cond, dst in edges:
+        fsm.add((src, src), dst, cond)
+    return fsm
+
+
+def test_deterministic():
+    # 0 -> 1 -> 2 -> 0 in every run
+    fsm = make_fsm([(0, None, 1), (1, None, 2), (2, None, 0)])
+    rslt = RandomSimulator(fsm, state.name, widths.get).run(runs=10, steps=6)
+    assert rslt.states == [0, 1, 2]
+    assert list(rslt.visits) == [30, 20, 20]
+    assert list(rslt.hit_cnt) == [10, 10, 10]
+    assert rslt.mean_hitting_times() == [0.0, 1.0, 2.0]
+    assert rslt.todict()['reached'] == {'0': 1.0, '1': 1.0, '2': 1.0}
+
+
+def test_unreached():
+    fsm = make_fsm([(0, None, 1), (1, None, 0), (2, None, 0)])
+    rslt = RandomSimulator(fsm, state.name, widths.get).run(runs=4, steps=3)
+    assert list(rslt.visits) == [8, 8, 0]
+    assert rslt.mean_hitting_times() == [0.0, 1.0, None]
+
+
+def random_fsm():
+    # 0 -> 1 when go, 1 -> 0 always: 0 holds 2/3 of the time, and 1 is
+    # first hit after 2 steps on average
+    return make_fsm([(0, go, 1), (1, None, 0)])
+
+
+def test_random():
+    simulator = RandomSimulator(random_fsm(), state.name, widths.get)
+    rslt = simulator.run(runs=2000, steps=50, seed=1)
+    total = float(rslt.runs * (rslt.steps + 1))
+    assert rslt.visits.sum() == total
+    assert abs(rslt.visits[0] / total - 2.0 / 3) < 0.02
+    assert abs(rslt.mean_hitting_times()[1] - 2.0) < 0.1
+    # seeded
+    again = simulator.run(runs=2000, steps=50, seed=1)
+    assert list(again.visits) == list(rslt.visits)
+    assert list(again.hit_sum) == list(rslt.hit_sum)
+
+
+def test_fixed_input():
+    simulator = RandomSimulator(random_fsm(), state.name, widths.get, fixed={go.name: 0})
+    rslt = simulator.run(runs=8, steps=5)
+    assert list(rslt.visits) == [48, 0]
+
+
+def test_run_parallel():
+    simulator = RandomSimulator(random_fsm(), state.name, widths.get)
+    rslt = simulator.run_parallel(runs=1001, steps=20, seed=3, processes=2)
+    assert rslt.runs == 1001
+    assert rslt.visits.sum() == 1001 * 21
+    assert rslt.hit_cnt[0] == 1001
+    assert abs(rslt.visits[0] / (1001 * 21.0) - 2.0 / 3) < 0.05
+
+
+def test_wide_signal():
+    fsm = make_fsm([(0, df.DFOperator((wide, df.DFEvalValue(0)), 'Eq'), 1)])
+    with pytest.raises(verror.FormatError):
+        RandomSimulator(fsm, state.name, widths.get)
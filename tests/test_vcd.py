@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import io
+import pytest
+
+df = pytest.importorskip('pyverilog.dataflow.dataflow')
+
+import vcd
+from controlflow import FiniteStateMachine
+
+dump = """$timescale 1ns $end
+$scope module tb $end
+$var reg 1 % clk $end
+$scope module uut $end
+$var reg 2 ! state [1:0] $end
+$var wire 8 " data [7:0] $end
+$upscope $end
+$upscope $end
+$enddefinitions $end
+#0
+$dumpvars
+bx !
+x%
+b0 "
+$end
+#1
+b0 !
+1%
+#2
+b1 !
+b101 "
+#3
+b10 !
+0%
+#4
+b0 !
+#5
+b11 !
+#6
+b1 !
+#7
+bz !
+"""
+
+
+@pytest.fixture
+def dumpfile(tmp_path):
+    filename = tmp_path / 'dump.vcd'
+    filename.write_text(dump)
+    return str(filename)
+
+
+def ring_fsm():
+    # 0 -> 1 -> 2 -> 0, and 1 -> 0 on a
+    fsm = FiniteStateMachine('TOP_state')
+    for s in range(3):
+        fsm.add((s, s), (s + 1) % 3, None)
+    fsm.add((1, 1), 0, df.DFTerminal('a'))
+    return fsm
+
+
+def test_header(dumpfile):
+    reader = vcd.VCDReader(dumpfile)
+    try:
+        assert reader.signals == {'tb_clk': ('%', 1), 'tb_uut_state': ('!', 2),
+                                  'tb_uut_data': ('"', 8)}
+    finally:
+        reader.close()
+
+
+def test_header_root(dumpfile):
+    reader = vcd.VCDReader(dumpfile, root='tb.uut', topmodule='TOP')
+    try:
+        # tb.clk is outside the root scope
+        assert reader.signals == {'TOP_state': ('!', 2), 'TOP_data': ('"', 8)}
+    finally:
+        reader.close()
+
+
+def test_changes(dumpfile):
+    reader = vcd.VCDReader(dumpfile)
+    try:
+        assert list(reader.changes(['tb_uut_state'])) == [
+            ('tb_uut_state', v) for v in (None, 0, 1, 2, 0, 3, 1, None)]
+        assert list(reader.changes(['tb_uut_data'])) == [('tb_uut_data', 0), ('tb_uut_data', 5)]
+        assert list(reader.changes(['tb_clk'])) == [('tb_clk', None), ('tb_clk', 1), ('tb_clk', 0)]
+        # merged in dump order
+        merged = list(reader.changes(['tb_clk', 'tb_uut_data']))
+        assert merged == [('tb_clk', None), ('tb_uut_data', 0), ('tb_clk', 1),
+                          ('tb_uut_data', 5), ('tb_clk', 0)]
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('batch', [1, 3, 1 << 16])
+def test_coverage(dumpfile, batch):
+    result = vcd.coverage(dumpfile, {'TOP_state': ring_fsm()}, root='tb.uut',
+                          topmodule='TOP', batch=batch, flatname=str)
+    cov = result['TOP_state']
+    d = cov.todict()
+    assert d['states'] == {'0': 2, '1': 2, '2': 1}
+    assert d['transitions'] == {'0->1': 1, '1->0': 0, '1->2': 1, '2->0': 1}
+    assert d['state_coverage'] == (3, 3)
+    assert d['transition_coverage'] == (3, 4)
+    assert d['unknown_states'] == {'3': 1}
+    assert d['unknown_transitions'] == {'0->3': 1, '3->1': 1}
+
+
+def test_coverage_report(dumpfile):
+    result = vcd.coverage(dumpfile, {'TOP_state': ring_fsm()}, root='tb.uut',
+                          topmodule='TOP', flatname=str)
+    buf = io.StringIO()
+    result['TOP_state'].write(buf)
+    lines = buf.getvalue().splitlines()
+    assert '# STATE COVERAGE: 3/3' in lines
+    assert '# TRANSITION COVERAGE: 3/4' in lines
+    assert 'uncovered transition 1 --> 0' in lines
+    assert 'unknown state 3 (1 hits)' in lines
+    assert 'unknown transition 0 --> 3 (1 hits)' in lines
+    assert 'unknown transition 3 --> 1 (1 hits)' in lines
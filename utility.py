@@ -2,32 +2,176 @@ from __future__ import absolute_import
 from __future__ import print_function
 import sys
 import os
+import bisect
+import weakref
 
-def getIdentifiers(node):
-    v = IdentifierVisitor()
+# id(node) -> (weakref to node, {(unique, scoped): names}); AST nodes
+# compare and hash by structure, so a WeakKeyDictionary would hash the
+# whole subtree on each lookup
+_identifier_cache = {}
+
+
+def _getNodeCache(node):
+    key = id(node)
+    entry = _identifier_cache.get(key)
+    if entry is not None and entry[0]() is node:
+        return entry[1]
+    try:
+        ref = weakref.ref(node, lambda ref, key=key: _dropNodeCache(key, ref))
+    except TypeError:
+        return {}
+    cache = {}
+    _identifier_cache[key] = (ref, cache)
+    return cache
+
+
+def _dropNodeCache(key, ref):
+    entry = _identifier_cache.get(key)
+    if entry is not None and entry[0] is ref:
+        del _identifier_cache[key]
+
+
+def getIdentifiers(node, unique=False, scoped=False):
+    cache = _getNodeCache(node)
+    key = (unique, scoped)
+    if key in cache:
+        return cache[key]
+    v = IdentifierVisitor(unique, scoped)
     v.visit(node)
     ids = v.getIdentifiers()
+    cache[key] = ids
     return ids
 
 
+def getIdentifiersMany(nodes, unique=False, scoped=False):
+    v = IdentifierVisitor(unique, scoped)
+    rslt = []
+    for node in nodes:
+        cache = _getNodeCache(node)
+        key = (unique, scoped)
+        if not key in cache:
+            v.reset()
+            v.visit(node)
+            cache[key] = v.getIdentifiers()
+        rslt.append(cache[key])
+    return rslt
+
+
+def clearIdentifierCache():
+    _identifier_cache.clear()
+
+
+def getScopedName(node):
+    if node.scope is None:
+        return node.name
+    return '.'.join([label.name for label in node.scope.labellist] + [node.name])
+
+
+def getTerminals(tree):
+    # names of the DFTerminal nodes in a dataflow tree
+    names = []
+    if tree is None:
+        return names
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if isinstance(node, DFTerminal):
+            names.append(node.name)
+            continue
+        stack.extend(node.children())
+    return names
+
+
 class IdentifierVisitor(NodeVisitor):
-    def __init__(self):
+    def __init__(self, unique=False, scoped=False):
+        self.unique = unique
+        self.scoped = scoped
         self.identifiers = []
+        self.found = set([])
 
     def getIdentifiers(self):
         return tuple(self.identifiers)
 
     def reset(self):
         self.identifiers = []
+        self.found = set([])
+
+    def visit(self, node):
+        # iterative pre-order walk, so deep expressions do not hit the recursion limit
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n is None:
+                continue
+            if isinstance(n, Identifier):
+                self.visit_Identifier(n)
+                continue
+            stack.extend(reversed(n.children()))
 
     def visit_Identifier(self, node):
-        self.identifiers.append(node.name)
+        name = getScopedName(node) if self.scoped else node.name
+        if self.unique:
+            if name in self.found:
+                return
+            self.found.add(name)
+        self.identifiers.append(name)
+
+def maxvalue(width):
+    return (1 << width) - 1
+
+
+def op_None(val, width):
+    return InferredValue(0, maxvalue(width))
+
+
+def op_Eq(val, width):
+    return InferredValue(val, val)
+
 
-def infer(op, node):
+def op_NotEq(val, width):
+    return InferredValue(val, val, inv=True)
+
+
+def op_LessThan(val, width):
+    return InferredValue(0, val - 1)
+
+
+def op_GreaterThan(val, width):
+    return InferredValue(val + 1, maxvalue(width))
+
+
+def op_LessEq(val, width):
+    return InferredValue(0, val)
+
+
+def op_GreaterEq(val, width):
+    return InferredValue(val, maxvalue(width))
+
+
+op_Eql = op_Eq
+op_NotEql = op_NotEq
+
+flipped_ops = {
+    'LessThan': 'GreaterThan',
+    'GreaterThan': 'LessThan',
+    'LessEq': 'GreaterEq',
+    'GreaterEq': 'LessEq',
+    'Eq': 'Eq',
+    'NotEq': 'NotEq',
+    'Eql': 'Eql',
+    'NotEql': 'NotEql',
+}
+
+
+def infer(op, node, width=32):
+    # values v of a signal for which 'v op node' holds
     val = node.value
     funcname = 'op_' + op
-    opfunc = getattr(this, funcname, op_None)
-    return opfunc(val)
+    opfunc = getattr(sys.modules[__name__], funcname, op_None)
+    return opfunc(val, width)
+
 
 class InferredValue(object):
     def __init__(self, minval, maxval, inv=False):
@@ -38,5 +182,330 @@ class InferredValue(object):
     def invert(self):
         self.inv = not self.inv
 
+    def toIntervalSet(self, width):
+        rslt = IntervalSet([(self.minval, self.maxval)]).clip(0, maxvalue(width))
+        if self.inv:
+            return rslt.complement(width)
+        return rslt
+
+
+class IntervalSet(object):
+    # sorted, disjoint and non-adjacent closed intervals (lo, hi)
+    def __init__(self, pairs=()):
+        self.pairs = self.normalize(pairs)
+
+    @classmethod
+    def full(cls, width):
+        return cls([(0, maxvalue(width))])
+
+    @classmethod
+    def values(cls, vals):
+        return cls([(v, v) for v in vals])
+
+    @staticmethod
+    def normalize(pairs):
+        rslt = []
+        for lo, hi in sorted([p for p in pairs if p[0] <= p[1]]):
+            if rslt and lo <= rslt[-1][1] + 1:
+                if hi > rslt[-1][1]:
+                    rslt[-1] = (rslt[-1][0], hi)
+                continue
+            rslt.append((lo, hi))
+        return tuple(rslt)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self.pairs == other.pairs
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.pairs)
+
+    def __repr__(self):
+        return 'IntervalSet(%s)' % str(list(self.pairs))
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __contains__(self, value):
+        for lo, hi in self.pairs:
+            if lo <= value <= hi:
+                return True
+            if value < lo:
+                return False
+        return False
+
+    def isempty(self):
+        return len(self.pairs) == 0
+
+    def size(self):
+        return sum([hi - lo + 1 for lo, hi in self.pairs])
+
+    def union(self, other):
+        return IntervalSet(self.pairs + other.pairs)
+
+    def intersect(self, other):
+        rslt = []
+        i = 0
+        j = 0
+        while i < len(self.pairs) and j < len(other.pairs):
+            lo = max(self.pairs[i][0], other.pairs[j][0])
+            hi = min(self.pairs[i][1], other.pairs[j][1])
+            if lo <= hi:
+                rslt.append((lo, hi))
+            if self.pairs[i][1] < other.pairs[j][1]:
+                i += 1
+            else:
+                j += 1
+        return IntervalSet(rslt)
+
+    def complement(self, width):
+        rslt = []
+        cur = 0
+        for lo, hi in self.pairs:
+            if lo > cur:
+                rslt.append((cur, lo - 1))
+            cur = hi + 1
+        if cur <= maxvalue(width):
+            rslt.append((cur, maxvalue(width)))
+        return IntervalSet(rslt)
+
+    def clip(self, minval, maxval):
+        return self.intersect(IntervalSet([(minval, maxval)]))
+
+    def shift(self, offset, width):
+        # modular addition of a constant
+        mod = 1 << width
+        rslt = []
+        for lo, hi in self.pairs:
+            if hi - lo + 1 >= mod:
+                return IntervalSet.full(width)
+            nlo = (lo + offset) % mod
+            nhi = (hi + offset) % mod
+            if nlo <= nhi:
+                rslt.append((nlo, nhi))
+            else:
+                rslt.append((nlo, mod - 1))
+                rslt.append((0, nhi))
+        return IntervalSet(rslt)
+
+
+def inferCondition(cond, termname, width):
+    # (may, must): values of termname for which cond may hold for some
+    # values of the other signals, and for which it holds for all of them
+    full = IntervalSet.full(width)
+    empty = IntervalSet()
+    if cond is None:
+        return full, full
+    if isinstance(cond, DFEvalValue):
+        return (full, full) if cond.value > 0 else (empty, empty)
+    if isinstance(cond, DFTerminal):
+        if cond.name == termname:
+            nonzero = IntervalSet([(1, maxvalue(width))])
+            return nonzero, nonzero
+        return full, empty
+    if isinstance(cond, DFOperator):
+        if cond.operator == 'Land':
+            may, must = full, full
+            for n in cond.nextnodes:
+                m, t = inferCondition(n, termname, width)
+                may = may.intersect(m)
+                must = must.intersect(t)
+            return may, must
+        if cond.operator == 'Lor':
+            may, must = empty, empty
+            for n in cond.nextnodes:
+                m, t = inferCondition(n, termname, width)
+                may = may.union(m)
+                must = must.union(t)
+            return may, must
+        if cond.operator == 'Ulnot':
+            may, must = inferCondition(cond.nextnodes[0], termname, width)
+            return must.complement(width), may.complement(width)
+        if cond.operator in flipped_ops and len(cond.nextnodes) == 2:
+            left, right = cond.nextnodes
+            op = cond.operator
+            if isinstance(right, DFTerminal) and isinstance(left, DFEvalValue):
+                left, right = right, left
+                op = flipped_ops[op]
+            if (isinstance(left, DFTerminal) and left.name == termname and
+                    isinstance(right, DFEvalValue)):
+                rslt = infer(op, right, width).toIntervalSet(width)
+                return rslt, rslt
+    return full, empty
+
+
+def inferNext(func, values, termname, width):
+    # values of termname after assigning func, when it currently holds values
+    if isinstance(func, DFEvalValue):
+        return IntervalSet.values([func.value & maxvalue(width)])
+    if isinstance(func, DFTerminal) and func.name == termname:
+        return values
+    if isinstance(func, DFOperator) and func.operator in ('Plus', 'Minus'):
+        if len(func.nextnodes) == 2:
+            left, right = func.nextnodes
+            if func.operator == 'Plus' and isinstance(left, DFEvalValue):
+                left, right = right, left
+            if (isinstance(left, DFTerminal) and left.name == termname and
+                    isinstance(right, DFEvalValue)):
+                offset = right.value if func.operator == 'Plus' else -right.value
+                return values.shift(offset, width)
+    return IntervalSet.full(width)
+
+
+def getStateBranches(funcdict, termname, width):
+    # (may, func): the values of termname for which a condition list may
+    # hold, and the value assigned under it
+    full = IntervalSet.full(width)
+    branches = []
+    for condlist, func in funcdict.items():
+        if isinstance(func, DFTerminal) and func.name == termname:
+            # holding the current value never adds a new one
+            continue
+        may = full
+        for cond in condlist:
+            may = may.intersect(inferCondition(cond, termname, width)[0])
+        branches.append((may, func))
+    return branches
+
+
+def inferStateRange(funcdict, termname, width, initial=None, iterations=8):
+    return inferStateDomain(getStateBranches(funcdict, termname, width),
+                            termname, width, initial, iterations)
+
+
+def inferStateDomain(branches, termname, width, initial=None, iterations=8):
+    # interval abstract interpretation of the next-state function: start from
+    # the image of every branch without state restriction, which already
+    # covers all reachable values, then narrow it a few times
+    initial = IntervalSet.full(width) if initial is None else initial
+    domain = initial
+    for may, func in branches:
+        if not may.isempty():
+            domain = domain.union(inferNext(func, may, termname, width))
+
+    for i in range(iterations):
+        new_domain = initial
+        for may, func in branches:
+            values = may.intersect(domain)
+            if not values.isempty():
+                new_domain = new_domain.union(inferNext(func, values, termname, width))
+        if new_domain == domain:
+            break
+        domain = new_domain
+    return domain
+
+
+def isOnehot(value):
+    return value > 0 and value & (value - 1) == 0
+
+
+class StateEncoding(object):
+    # state values observed in the next-state function; compact encodings are
+    # iterated value by value instead of as dense integer ranges
+    max_dense_width = 16
+
+    def __init__(self, kind, values, bits=(), width=32):
+        self.kind = kind  # 'onehot', 'gray' or 'binary'
+        self.values = sorted(set(values))
+        self.index = dict([(v, i) for i, v in enumerate(self.values)])
+        self.bits = sorted(set(bits))  # bit positions tested in conditions
+        self.compact = kind == 'onehot' or width > self.max_dense_width
+
+    def __repr__(self):
+        return '%s(%d states)' % (self.kind, len(self.values))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self.index
+
+    def select(self, minval, maxval):
+        # observed values within [minval, maxval]
+        return self.values[bisect.bisect_left(self.values, minval):
+                           bisect.bisect_right(self.values, maxval)]
+
+
+def getStateTests(cond, termname, consts, bits):
+    # collects constants compared with termname and its tested bit positions
+    stack = [cond]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if (isinstance(node, DFOperator) and node.operator in ('Eq', 'NotEq', 'Eql', 'NotEql') and
+                len(node.nextnodes) == 2):
+            left, right = node.nextnodes
+            if isinstance(left, DFEvalValue):
+                left, right = right, left
+            if (isinstance(left, DFTerminal) and left.name == termname and
+                    isinstance(right, DFEvalValue)):
+                consts.add(right.value)
+        if isinstance(node, DFPointer):
+            if (isinstance(node.var, DFTerminal) and node.var.name == termname and
+                    isinstance(node.ptr, DFEvalValue)):
+                bits.add(node.ptr.value)
+        if isinstance(node, DFPartselect):
+            if (isinstance(node.var, DFTerminal) and node.var.name == termname and
+                    isinstance(node.msb, DFEvalValue) and isinstance(node.lsb, DFEvalValue) and
+                    node.msb.value == node.lsb.value):
+                bits.add(node.lsb.value)
+        stack.extend(node.children())
+
+
+def getStateSource(condlist, termname):
+    # the state value a condition list positively tests, None when unknown
+    for cond in condlist:
+        if (isinstance(cond, DFOperator) and cond.operator in ('Eq', 'Eql') and
+                len(cond.nextnodes) == 2):
+            left, right = cond.nextnodes
+            if isinstance(left, DFEvalValue):
+                left, right = right, left
+            if (isinstance(left, DFTerminal) and left.name == termname and
+                    isinstance(right, DFEvalValue)):
+                return right.value
+        if (isinstance(cond, DFPointer) and isinstance(cond.var, DFTerminal) and
+                cond.var.name == termname and isinstance(cond.ptr, DFEvalValue)):
+            return 1 << cond.ptr.value
+    return None
+
+
+def getEncodingEvidence(funcdict, termname):
+    # (dsts, consts, bits, pairs): assigned constants, constants compared with
+    # termname, its tested bits and the (src, dst) pairs of the transitions
+    dsts = set([])
+    consts = set([])
+    bits = set([])
+    pairs = set([])
+    for condlist, func in funcdict.items():
+        for cond in condlist:
+            getStateTests(cond, termname, consts, bits)
+        if not isinstance(func, DFEvalValue):
+            continue
+        dsts.add(func.value)
+        src = getStateSource(condlist, termname)
+        if src is not None and src != func.value:
+            pairs.add((src, func.value))
+    return dsts, consts, bits, pairs
+
+
+def detectEncoding(funcdict, termname, width, resetvalues=()):
+    dsts, consts, bits, pairs = getEncodingEvidence(funcdict, termname)
+    return selectEncoding(dsts, consts, bits, pairs, width, resetvalues)
 
 
+def selectEncoding(dsts, consts, bits, pairs, width, resetvalues=()):
+    values = dsts | consts | set(resetvalues)
+    nonzero = [v for v in values if v != 0]
+    # powers of two alone fit a binary FSM as well ({0, 1, 2, 4}): one-hot
+    # also needs single-bit tests of the state, or no zero state but reset
+    if (len(nonzero) >= 2 and all([isOnehot(v) for v in nonzero]) and
+            (len(bits) > 0 or not 0 in (dsts | consts))):
+        values |= set([1 << b for b in bits if b < width])
+        return StateEncoding('onehot', values, bits, width)
+    if len(values) >= 3 and len(pairs) >= 2 and all(
+            [bin(src ^ dst).count('1') == 1 for src, dst in pairs]):
+        return StateEncoding('gray', values, bits, width)
+    return StateEncoding('binary', values, bits, width)
@@ -0,0 +1,221 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+import os
+import heapq
+import mmap
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class VCDReader(object):
+    # root: dotted VCD scope of the top module instance (e.g. 'tb.uut'),
+    # which is renamed to topmodule so names match util.toFlatname
+    def __init__(self, filename, root=None, topmodule=None):
+        self.filename = filename
+        self.root = tuple(root.split('.')) if root is not None else None
+        self.topmodule = topmodule
+        self.signals = {}  # key:flatname, value:(id, width)
+        self.body = 0
+        self.newline = b'\n'
+        self.file = open(filename, 'rb')
+        self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.read_header()
+
+    def close(self):
+        self.buf.close()
+        self.file.close()
+
+    def size(self):
+        return len(self.buf)
+
+    def flatname(self, scopes, ref):
+        scopes = tuple(scopes)
+        if self.root is not None:
+            if scopes[:len(self.root)] != self.root:
+                return None
+            scopes = scopes[len(self.root):]
+            if self.topmodule is not None:
+                scopes = (self.topmodule, ) + scopes
+        return '_'.join(scopes + (ref, ))
+
+    def read_header(self):
+        end = self.buf.find(b'$enddefinitions')
+        if end < 0:
+            raise ValueError('no $enddefinitions in %s' % self.filename)
+        self.newline = b'\r\n' if self.buf.find(b'\r\n', 0, end) >= 0 else b'\n'
+        tokens = self.buf[:end].decode('ascii', 'replace').split()
+        self.body = self.buf.find(b'$end', end + len(b'$enddefinitions')) + len(b'$end')
+        scopes = []
+        pos = 0
+        while pos < len(tokens):
+            token = tokens[pos]
+            if token == '$scope':
+                scopes.append(tokens[pos + 2])
+                pos += 3
+            elif token == '$upscope':
+                scopes.pop()
+                pos += 1
+            elif token == '$var':
+                width = int(tokens[pos + 2])
+                code = tokens[pos + 3]
+                ref = tokens[pos + 4].split('[')[0]
+                name = self.flatname(scopes, ref)
+                if name is not None and not name in self.signals:
+                    self.signals[name] = (code, width)
+                pos += 5
+            else:
+                pos += 1
+
+    def scan(self, code, name=None):
+        # yields (offset, name, bits) of the value changes of one identifier code;
+        # only lines ending in the code are looked at, found by bytes search
+        buf = self.buf
+        needle = code + self.newline
+        pos = buf.find(needle, self.body)
+        while pos >= 0:
+            start = buf.rfind(b'\n', 0, pos) + 1
+            head = buf[start:start + 1]
+            if head in (b'b', b'B') and buf[pos - 1:pos] == b' ':
+                yield start, name, buf[start + 1:pos - 1]
+            elif pos - start == 1 and head in b'01xzXZ':
+                yield start, name, head
+            pos = buf.find(needle, pos + len(needle))
+
+    def changes(self, names):
+        # yields (flatname, value) in dump order; value is None for x/z
+        scans = []
+        for name in names:
+            if name in self.signals:
+                code = self.signals[name][0].encode('ascii')
+                scans.append(self.scan(code, name))
+        decoded = {}
+        merged = scans[0] if len(scans) == 1 else heapq.merge(*scans)
+        for pos, name, bits in merged:
+            if not bits in decoded:
+                try:
+                    decoded[bits] = int(bits, 2)
+                except ValueError:
+                    decoded[bits] = None
+            yield name, decoded[bits]
+
+
+class FsmCoverage(object):
+    def __init__(self, signame, fsm):
+        self.signame = signame
+        self.fsm = fsm
+        self.states = fsm.states()
+        self.stateid = dict([(s, i) for i, s in enumerate(self.states)])
+        pairs = set([])
+        for src, cond, dst in fsm.transitions():
+            if src is None:
+                pairs.update([(s, dst) for s in fsm.fsm.keys()])
+            else:
+                pairs.add((src, dst))
+        self.pairs = sorted(pairs)
+        self.pairid = dict([(p, i) for i, p in enumerate(self.pairs)])
+        if np is not None:
+            self.state_hits = np.zeros(len(self.states), dtype=np.int64)
+            self.transition_hits = np.zeros(len(self.pairs), dtype=np.int64)
+        else:
+            self.state_hits = [0] * len(self.states)
+            self.transition_hits = [0] * len(self.pairs)
+        self.unknown_states = {}
+        self.unknown_transitions = {}
+        self.prev = None
+
+    def add(self, values):
+        # a batch of consecutive values of the state signal
+        sids = []
+        tids = []
+        for value in values:
+            if value is None:
+                self.prev = None
+                continue
+            if value in self.stateid:
+                sids.append(self.stateid[value])
+            else:
+                self.unknown_states[value] = self.unknown_states.get(value, 0) + 1
+            if self.prev is not None and self.prev != value:
+                pair = (self.prev, value)
+                if pair in self.pairid:
+                    tids.append(self.pairid[pair])
+                else:
+                    self.unknown_transitions[pair] = self.unknown_transitions.get(pair, 0) + 1
+            self.prev = value
+        if np is not None:
+            self.state_hits += np.bincount(np.array(sids, dtype=np.int64),
+                                           minlength=len(self.states))
+            self.transition_hits += np.bincount(np.array(tids, dtype=np.int64),
+                                                minlength=len(self.pairs))
+            return
+        for i in sids:
+            self.state_hits[i] += 1
+        for i in tids:
+            self.transition_hits[i] += 1
+
+    def state_coverage(self):
+        covered = sum([1 for h in self.state_hits if h > 0])
+        return (covered, len(self.states))
+
+    def transition_coverage(self):
+        covered = sum([1 for h in self.transition_hits if h > 0])
+        return (covered, len(self.pairs))
+
+    def todict(self):
+        return {
+            'signal': str(self.signame),
+            'states': dict([(str(s), int(h)) for s, h in zip(self.states, self.state_hits)]),
+            'transitions': dict([('%d->%d' % p, int(h))
+                                 for p, h in zip(self.pairs, self.transition_hits)]),
+            'state_coverage': self.state_coverage(),
+            'transition_coverage': self.transition_coverage(),
+            'unknown_states': dict([(str(s), h) for s, h in self.unknown_states.items()]),
+            'unknown_transitions': dict([('%d->%d' % p, h)
+                                         for p, h in self.unknown_transitions.items()]),
+        }
+
+    def write(self, buf=sys.stdout):
+        scov, stotal = self.state_coverage()
+        tcov, ttotal = self.transition_coverage()
+        buf.write('# SIGNAL NAME: %s\n' % self.signame)
+        buf.write('# STATE COVERAGE: %d/%d\n' % (scov, stotal))
+        buf.write('# TRANSITION COVERAGE: %d/%d\n' % (tcov, ttotal))
+        for s, h in zip(self.states, self.state_hits):
+            if h == 0:
+                buf.write('uncovered state %d\n' % s)
+        for (src, dst), h in zip(self.pairs, self.transition_hits):
+            if h == 0:
+                buf.write('uncovered transition %d --> %d\n' % (src, dst))
+        for s, h in sorted(self.unknown_states.items()):
+            buf.write('unknown state %d (%d hits)\n' % (s, h))
+        for (src, dst), h in sorted(self.unknown_transitions.items()):
+            buf.write('unknown transition %d --> %d (%d hits)\n' % (src, dst, h))
+
+
+def coverage(filename, fsms, root=None, topmodule=None, batch=1 << 16, flatname=None):
+    # fsms: the dict of getFiniteStateMachines(); returns key:signame, value:FsmCoverage
+    flatname = util.toFlatname if flatname is None else flatname
+    reader = VCDReader(filename, root, topmodule)
+    try:
+        names = {}
+        for signame, fsm in fsms.items():
+            names[flatname(signame)] = FsmCoverage(signame, fsm)
+        pending = dict([(name, []) for name in names.keys()])
+        cnt = 0
+        for name, value in reader.changes(names.keys()):
+            pending[name].append(value)
+            cnt += 1
+            if cnt >= batch:
+                for n, values in pending.items():
+                    names[n].add(values)
+                    pending[n] = []
+                cnt = 0
+        for n, values in pending.items():
+            names[n].add(values)
+    finally:
+        reader.close()
+    return dict([(cov.signame, cov) for cov in names.values()])